@@ -0,0 +1,157 @@
+#! /usr/bin/env python
+
+"""Benchmark the display limit selection of ``PreviewImage``.
+
+This module compares the sort-based display limits used by earlier
+versions of ``PreviewImage.find_limits`` with the current
+partition-based selection and with the ``sampled`` estimator, for
+frames of increasing size. For the ``sampled`` estimator, the rank
+error of the returned limits is reported as well.
+
+Use
+---
+
+    This script can be executed from the command line:
+
+    ::
+
+        python find_limits_benchmark.py --sizes 1024 2048 4096
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.utils.preview_image import PreviewImage
+
+
+def create_preview_image(directory):
+    """Return a ``PreviewImage`` instance built from a minimal FITS
+    file, to be used for calling its limit-finding methods.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write the FITS file
+
+    Returns
+    -------
+    image : obj
+        ``PreviewImage`` instance
+    """
+    filename = os.path.join(directory, 'jw00000001001_01101_00001_nrca1_rate.fits')
+    primary = fits.PrimaryHDU()
+    for keyword in ['SUBSTRT1', 'SUBSTRT2', 'SUBSIZE1', 'SUBSIZE2']:
+        primary.header[keyword] = 1
+    sci = fits.ImageHDU(np.zeros((1, 1), dtype=np.float32), name='SCI')
+    fits.HDUList([primary, sci]).writeto(filename, overwrite=True)
+
+    return PreviewImage(filename, 'SCI')
+
+
+def sort_limits(data, pixmap, clipperc):
+    """The sort-based implementation of ``PreviewImage.find_limits``
+    that was used before the partition-based selection.
+
+    Parameters
+    ----------
+    data : obj
+        2D numpy ndarray of floats
+    pixmap : obj
+        2D numpy ndarray boolean array of science pixel locations
+    clipperc : float
+        Fraction of top and bottom signal levels to clip
+
+    Returns
+    -------
+    results : tuple
+        Tuple of floats, minimum and maximum signal levels
+    """
+    nelem = np.sum(pixmap)
+    numclip = int(clipperc * nelem)
+    sorted = np.sort(data[pixmap], axis=None)
+    minval = sorted[numclip]
+    maxval = sorted[-numclip-1]
+    return (minval, maxval)
+
+
+def time_function(function, repeats, *args):
+    """Return the best wall-clock time of ``repeats`` calls of
+    ``function`` and the result of the last call.
+    """
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def run_benchmark(sizes, clipperc=0.01, repeats=3):
+    """Time the limit-finding methods for square frames of each size
+    and print the results.
+
+    Parameters
+    ----------
+    sizes : list
+        Side lengths of the frames to benchmark
+    clipperc : float
+        Fraction of top and bottom signal levels to clip
+    repeats : int
+        Number of timed calls per method; the best time is reported
+
+    Returns
+    -------
+    results : list
+        One dictionary of timings and rank errors per frame size
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        image = create_preview_image(directory)
+
+        print('{:>8} {:>10} {:>10} {:>10} {:>8} {:>12}'.format(
+            'size', 'sort [s]', 'exact [s]', 'sampled [s]', 'speedup', 'rank error'))
+        for size in sizes:
+            random_state = np.random.RandomState(size)
+            data = random_state.lognormal(size=(size, size)).astype(np.float32)
+            pixmap = np.ones((size, size), dtype=bool)
+            pixmap[:4, :] = pixmap[-4:, :] = pixmap[:, :4] = pixmap[:, -4:] = False
+
+            sort_time, expected = time_function(sort_limits, repeats, data, pixmap, clipperc)
+
+            image.limits_method = 'exact'
+            exact_time, exact = time_function(image.find_limits, repeats, data, pixmap, clipperc)
+            assert exact == expected
+
+            image.limits_method = 'sampled'
+            sampled_time, sampled = time_function(image.find_limits, repeats, data, pixmap,
+                                                  clipperc)
+
+            # Rank error of the sampled limits, as a fraction of the science pixels
+            pixels = np.sort(data[pixmap])
+            ranks = np.searchsorted(pixels, sampled) / pixels.size
+            rank_error = max(abs(ranks[0] - clipperc), abs(ranks[1] - (1. - clipperc)))
+
+            print('{:>8} {:>10.4f} {:>10.4f} {:>10.4f} {:>8.1f} {:>12.5f}'.format(
+                size, sort_time, exact_time, sampled_time, sort_time / exact_time, rank_error))
+            results.append({'size': size, 'sort': sort_time, 'exact': exact_time,
+                            'sampled': sampled_time, 'rank_error': rank_error})
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark PreviewImage.find_limits')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048, 4096, 8192],
+                        help='Side lengths of the square frames to benchmark')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of timed calls per method')
+    args = parser.parse_args()
+
+    run_benchmark(args.sizes, repeats=args.repeats)
@@ -0,0 +1,206 @@
+#! /usr/bin/env python
+
+"""Benchmark the exposure grouping of ``generate_preview_images``.
+
+This module times ``group_filenames`` for increasingly long lists of
+synthetic JWST filenames, and compares it with the regular expression
+based grouping used by earlier versions, which matched every file
+against every remaining file. Because the earlier version scales
+quadratically, it is only run up to ``--legacy-max`` files, where the
+two outputs are also checked to be identical.
+
+Use
+---
+
+    This script can be executed from the command line:
+
+    ::
+
+        python group_filenames_benchmark.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+
+from jwql.jwql_monitors.generate_preview_images import group_filenames
+from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
+from jwql.utils.utils import filename_parser
+
+# Detectors of the synthetic exposures. NIRCam exposures use either
+# all short wave or all long wave detectors.
+DETECTOR_SETS = [NIRCAM_SHORTWAVE_DETECTORS, NIRCAM_LONGWAVE_DETECTORS,
+                 ['MIRIMAGE'], ['NIS'], ['NRS1', 'NRS2'], ['GUIDER1']]
+
+
+def make_filenames(nfiles, directory='/filesystem', seed=0):
+    """Return a shuffled list of synthetic JWST filenames.
+
+    Parameters
+    ----------
+    nfiles : int
+        Number of filenames to return
+    directory : str
+        Top-level directory of the files; each proposal gets its own
+        subdirectory
+    seed : int
+        Seed of the random number generator
+
+    Returns
+    -------
+    filenames : list
+        List of filenames
+    """
+    random_state = np.random.RandomState(seed)
+    filenames = []
+    exposure = 0
+    while len(filenames) < nfiles:
+        exposure += 1
+        program = '{:05d}'.format(random_state.randint(1, 100))
+        detectors = DETECTOR_SETS[random_state.randint(len(DETECTOR_SETS))]
+        suffix = ['uncal', 'rate', 'rateints', 'cal'][random_state.randint(4)]
+        for detector in detectors:
+            filename = 'jw{}001001_02101_{:05d}_{}_{}.fits'.format(
+                program, exposure, detector.lower(), suffix)
+            filenames.append(os.path.join(directory, 'jw{}'.format(program), filename))
+    filenames = filenames[:nfiles]
+    random_state.shuffle(filenames)
+
+    return filenames
+
+
+def regex_group_filenames(input_files):
+    """The regular expression based implementation of
+    ``group_filenames`` that was used before the single-pass grouping.
+
+    Parameters
+    ----------
+    input_files : list
+        list of filenames
+
+    Returns
+    -------
+    grouped : list
+        grouped list of filenames
+    """
+    grouped = []
+
+    # Sort files first
+    input_files.sort()
+
+    goodindex = np.arange(len(input_files))
+    input_files = np.array(input_files)
+
+    # Loop over each file in the list of good files
+    for index, full_filename in enumerate(input_files[goodindex]):
+        file_directory, filename = os.path.split(full_filename)
+
+        # Generate string to be matched with other filenames
+        filename_parts = filename_parser(filename)
+        program = filename_parts['program_id']
+        observation = filename_parts['observation']
+        visit = filename_parts['visit']
+        visit_group = filename_parts['visit_group']
+        parallel = filename_parts['parallel_seq_id']
+        activity = filename_parts['activity']
+        exposure = filename_parts['exposure_id']
+        detector = filename_parts['detector'].upper()
+        suffix = filename_parts['suffix']
+
+        observation_base = 'jw{}{}{}_{}{}{}_{}_'.format(
+            program, observation, visit, visit_group,
+            parallel, activity, exposure)
+
+        if detector in NIRCAM_SHORTWAVE_DETECTORS:
+            detector_str = 'NRC[AB][1234]'
+        elif detector in NIRCAM_LONGWAVE_DETECTORS:
+            detector_str = 'NRC[AB]5'
+        else:
+            detector_str = detector
+        match_str = '{}{}_{}.fits'.format(observation_base, detector_str, suffix)
+        match_str = os.path.join(file_directory, match_str)
+        pattern = re.compile(match_str, re.IGNORECASE)
+
+        # Try to match the substring to each good file
+        matches = []
+        matched_name = []
+        for index2, file2match in enumerate(input_files[goodindex]):
+            match = pattern.match(file2match)
+
+            # Add any files that match the string
+            if match is not None:
+                matched_name.append(file2match)
+                matches.append(goodindex[index2])
+        # For any matched files, remove from goodindex so we don't
+        # use them as a basis for matching later
+        all_locs = []
+        for num in matches:
+            loc = np.where(goodindex == num)
+            all_locs.append(loc[0][0])
+        if len(all_locs) != 0:
+            # Delete matched file indexes from the list of
+            # files to search
+            goodindex = np.delete(goodindex, all_locs)
+
+            # Add the list of matched files to the overall list of files
+            grouped.append(list(matched_name))
+
+    return grouped
+
+
+def run_benchmark(sizes, legacy_max=5000):
+    """Time the grouping of each number of files and print the
+    results.
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of filenames to group
+    legacy_max : int
+        Largest number of files for which the regular expression based
+        grouping is run
+
+    Returns
+    -------
+    results : list
+        One dictionary of timings per number of files
+    """
+    results = []
+    print('{:>8} {:>8} {:>12} {:>12} {:>8}'.format(
+        'files', 'groups', 'regex [s]', 'single [s]', 'speedup'))
+    for size in sizes:
+        filenames = make_filenames(size)
+
+        start = time.perf_counter()
+        grouped = group_filenames(list(filenames))
+        single_time = time.perf_counter() - start
+
+        regex_time = np.nan
+        if size <= legacy_max:
+            start = time.perf_counter()
+            expected = regex_group_filenames(list(filenames))
+            regex_time = time.perf_counter() - start
+            assert grouped == expected
+
+        print('{:>8} {:>8} {:>12.3f} {:>12.3f} {:>8.1f}'.format(
+            size, len(grouped), regex_time, single_time, regex_time / single_time))
+        results.append({'files': size, 'groups': len(grouped), 'regex': regex_time,
+                        'single': single_time})
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark group_filenames')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 100000],
+                        help='Numbers of filenames to group')
+    parser.add_argument('--legacy-max', type=int, default=5000,
+                        help='Largest number of files for which the regular expression '
+                             'based grouping is run')
+    args = parser.parse_args()
+
+    run_benchmark(args.sizes, legacy_max=args.legacy_max)
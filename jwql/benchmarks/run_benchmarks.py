@@ -0,0 +1,362 @@
+#! /usr/bin/env python
+
+"""Run the preview image benchmark suite.
+
+This module writes a synthetic dataset (see ``synthetic_data``) to a
+temporary directory and times the steps of the preview image pipeline
+on it: reading the data (``PreviewImage.get_data``), making difference
+images, finding the display limits, rendering the preview images and
+thumbnails (``PreviewImage.make_image``, with the settings used by
+``generate_preview_images``), building a NIRCam mosaic, grouping
+filenames into exposures, and building the data of the thumbnails
+pages of the web app. For each step the best time of several
+runs, the throughput, and the peak memory allocated during the step
+are reported. Everything runs offline. The thumbnails step is skipped
+if the web app cannot be imported, e.g. without a ``config.json`` or
+the web app dependencies.
+
+The results can be saved as JSON and compared with those of an earlier
+run, in which case the script exits with a non-zero status if any step
+became slower by more than the given tolerance.
+
+Use
+---
+
+    This script can be executed from the command line:
+
+    ::
+
+        python -m jwql.benchmarks.run_benchmarks
+        python -m jwql.benchmarks.run_benchmarks --quick --json results.json
+        python -m jwql.benchmarks.run_benchmarks --compare baseline.json --tolerance 0.25
+
+Notes
+-----
+
+    Peak memory is measured with ``tracemalloc``, which tracks the
+    memory allocated by Python and ``numpy``, but not by ``matplotlib``
+    or ``Pillow`` image buffers.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.benchmarks.group_filenames_benchmark import make_filenames
+from jwql.benchmarks.synthetic_data import make_dataset
+from jwql.jwql_monitors.generate_preview_images import PREVIEW_PARAMETERS, create_mosaic, \
+    create_mosaic_stream, group_filenames
+from jwql.utils.preview_image import PreviewImage
+
+# Use the 'Agg' backend to avoid invoking $DISPLAY
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+
+def compare_results(results, baseline, tolerance):
+    """Compare the timings of two benchmark runs.
+
+    Parameters
+    ----------
+    results : list
+        The output of ``run_benchmarks``
+    baseline : list
+        The output of an earlier ``run_benchmarks`` call
+    tolerance : float
+        Largest accepted fractional increase of the time of a step
+
+    Returns
+    -------
+    regressions : list
+        Names of the steps that became slower by more than
+        ``tolerance``
+    """
+
+    baseline = {result['name']: result for result in baseline}
+    regressions = []
+    print('\n{:<36} {:>12} {:>12} {:>8}'.format('step', 'baseline [s]', 'time [s]', 'change'))
+    for result in results:
+        if result['name'] not in baseline:
+            continue
+        reference = baseline[result['name']]['time']
+        change = result['time'] / reference - 1.
+        flag = ''
+        if change > tolerance:
+            regressions.append(result['name'])
+            flag = '  REGRESSION'
+        print('{:<36} {:>12.4f} {:>12.4f} {:>+7.0%}{}'.format(
+            result['name'], reference, result['time'], change, flag))
+
+    return regressions
+
+
+def consume(iterator):
+    """Exhaust an iterator, discarding its items."""
+
+    for _ in iterator:
+        pass
+
+
+def consume_mosaic_stream(filenames):
+    """Build all integrations of a mosaic with ``create_mosaic_stream``.
+
+    Parameters
+    ----------
+    filenames : list
+        List of filenames to be combined into a mosaic
+    """
+
+    consume(create_mosaic_stream(filenames))
+
+
+def fits_shape(filename):
+    """Return the shape of the ``SCI`` extension of a FITS file,
+    without reading the data.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file
+
+    Returns
+    -------
+    shape : tuple
+        Shape of the data
+    """
+
+    header = fits.getheader(filename, 'SCI')
+    return tuple(header['NAXIS{}'.format(axis)] for axis in range(header['NAXIS'], 0, -1))
+
+
+def main(args=None):
+    """Parse the command line, run the benchmarks, and save or compare
+    the results.
+
+    Parameters
+    ----------
+    args : list
+        Command line arguments. ``sys.argv`` is used if ``None``.
+
+    Returns
+    -------
+    status : int
+        ``1`` if a regression was found, ``0`` otherwise
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark the preview image pipeline '
+                                                 'on synthetic data')
+    parser.add_argument('--quick', action='store_true',
+                        help='Use smaller frames, fewer filenames and a single timed call '
+                             'per step')
+    parser.add_argument('--integrations', type=int, default=2,
+                        help='Number of integrations of the rateints and uncal files')
+    parser.add_argument('--groups', type=int, default=5,
+                        help='Number of groups per integration of the uncal files')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Number of timed calls per step')
+    parser.add_argument('--directory',
+                        help='Directory in which to write the dataset (default: a temporary '
+                             'directory that is removed afterwards)')
+    parser.add_argument('--json', help='Save the results to this JSON file')
+    parser.add_argument('--compare', help='Compare the timings with this JSON file of an '
+                                          'earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Largest accepted fractional slowdown when comparing (default: 0.25)')
+    args = parser.parse_args(args)
+
+    options = {'integrations': args.integrations, 'groups': args.groups,
+               'repeats': args.repeats}
+    if args.quick:
+        options.update({'binning': 4, 'nfilenames': 10000, 'nthumbnails': 10000, 'repeats': 1})
+
+    if args.directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_benchmarks(directory, **options)
+    else:
+        results = run_benchmarks(args.directory, **options)
+
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print('\n{} step(s) slower than the baseline: {}'.format(
+                len(regressions), ', '.join(regressions)))
+            return 1
+
+    return 0
+
+
+def measure(function, args=(), repeats=3):
+    """Time a function and measure the peak memory it allocates.
+
+    Parameters
+    ----------
+    function : obj
+        The function to benchmark
+    args : tuple
+        Arguments of ``function``
+    repeats : int
+        Number of timed calls; the best time is reported. The memory
+        is measured in one additional call, since tracing slows the
+        function down.
+
+    Returns
+    -------
+    best_time : float
+        Best wall-clock time of the calls in seconds
+    peak_memory : int
+        Peak memory allocated during the call in bytes
+    """
+
+    best_time = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        best_time = min(best_time, time.perf_counter() - start)
+        plt.close('all')
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        plt.close('all')
+
+    return best_time, peak_memory
+
+
+def render_preview(filename, output_directory):
+    """Create the preview images and thumbnails of a file with the
+    settings of ``generate_preview_images``.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file
+    output_directory : str
+        Directory in which to save the images
+    """
+
+    image = PreviewImage(filename, 'SCI')
+    for attribute, value in PREVIEW_PARAMETERS.items():
+        setattr(image, attribute, value)
+    image.preview_output_directory = output_directory
+    image.thumbnail_output_directory = output_directory
+    image.make_image()
+
+
+def run_benchmarks(directory, integrations=2, groups=5, binning=1, nfilenames=100000,
+                   nthumbnails=50000, repeats=3):
+    """Write the synthetic dataset and benchmark each step of the
+    preview image pipeline on it.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write the dataset and images
+    integrations : int
+        Number of integrations of the ``rateints`` and ``uncal`` files
+    groups : int
+        Number of groups per integration of the ``uncal`` files
+    binning : int
+        Factor by which the single-detector frame sizes are reduced
+    nfilenames : int
+        Number of filenames grouped by ``group_filenames``
+    nthumbnails : int
+        Number of filenames shown on the synthetic thumbnails page
+    repeats : int
+        Number of timed calls per step
+
+    Returns
+    -------
+    results : list
+        One dictionary per step, with the ``name`` of the step, its
+        best ``time`` in seconds, its ``throughput`` in ``unit`` per
+        second, and its ``peak_memory`` in bytes
+    """
+
+    dataset = make_dataset(directory, integrations, groups, binning)
+    output_directory = os.path.join(directory, 'output')
+    os.makedirs(output_directory, exist_ok=True)
+
+    # Each step is given as (name, function, arguments, amount of
+    # work, unit of the throughput)
+    steps = []
+    for name in ['nircam_rate', 'nircam_rateints', 'nircam_uncal', 'miri_uncal', 'nirspec_uncal']:
+        filename = dataset[name][0]
+        image = PreviewImage(filename, 'SCI', read_data=False)
+        steps.append(('get_data {}'.format(name), image.get_data, (filename, 'SCI'),
+                      np.prod(fits_shape(filename)), 'Mpix'))
+
+    for name in ['nircam_uncal', 'miri_uncal']:
+        image = PreviewImage(dataset[name][0], 'SCI')
+        steps.append(('difference_image {}'.format(name), image.difference_image, (image.data,),
+                      image.data.size, 'Mpix'))
+
+    image = PreviewImage(dataset['nircam_rate'][0], 'SCI')
+    for method in ['exact', 'sampled']:
+        limits_image = PreviewImage(dataset['nircam_rate'][0], 'SCI', read_data=False)
+        limits_image.limits_method = method
+        steps.append(('find_limits {} nircam_rate'.format(method), limits_image.find_limits,
+                      (image.data, image.dq, PREVIEW_PARAMETERS['clip_percent']),
+                      image.data.size, 'Mpix'))
+
+    for name in ['nircam_rate', 'nircam_rateints', 'nircam_uncal', 'miri_rate']:
+        filename = dataset[name][0]
+        steps.append(('make_image {}'.format(name), render_preview, (filename, output_directory),
+                      np.prod(fits_shape(filename)), 'Mpix'))
+
+    mosaic_files = dataset['nircam_sw_mosaic']
+    mosaic_pixels = sum(np.prod(fits_shape(filename)) for filename in mosaic_files)
+    steps.append(('create_mosaic nircam_sw', create_mosaic, (mosaic_files,), mosaic_pixels, 'Mpix'))
+    steps.append(('create_mosaic_stream nircam_sw', consume_mosaic_stream, (mosaic_files,),
+                  mosaic_pixels, 'Mpix'))
+
+    filenames = make_filenames(nfilenames)
+    steps.append(('group_filenames {}'.format(nfilenames), lambda: group_filenames(list(filenames)),
+                  (), nfilenames, 'kfiles'))
+
+    # The web app reads the config file and needs its own dependencies
+    # when it is imported, so it is only imported for its own step
+    try:
+        from jwql.website.apps.jwql.data_containers import thumbnail_data, thumbnail_menus
+    except (ImportError, OSError) as error:
+        print('Skipping the thumbnails step, the web app cannot be imported: {}'.format(error))
+    else:
+        thumbnail_files = make_filenames(nthumbnails)
+        steps.append(('thumbnails {}'.format(nthumbnails),
+                      lambda: (thumbnail_menus(thumbnail_files),
+                               thumbnail_data('NIRCam', thumbnail_files, thumbnail_files)),
+                      (), nthumbnails, 'kfiles'))
+
+    results = []
+    print('{:<36} {:>10} {:>14} {:>12}'.format('step', 'time [s]', 'throughput', 'peak [MB]'))
+    for name, function, args, amount, unit in steps:
+        best_time, peak_memory = measure(function, args, repeats)
+        scale = 1e6 if unit == 'Mpix' else 1e3
+        throughput = amount / scale / best_time
+        print('{:<36} {:>10.4f} {:>8.1f} {:<5} {:>12.1f}'.format(
+            name, best_time, throughput, unit + '/s', peak_memory / 2**20))
+        results.append({'name': name, 'time': best_time, 'throughput': throughput,
+                        'unit': unit + '/s', 'peak_memory': peak_memory})
+
+    return results
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+
+"""Create synthetic JWST-like FITS files for benchmarking.
+
+The files mimic the layout of pipeline products closely enough for the
+preview image code: a primary header with the ``SUBSTRT``/``SUBSIZE``,
+``NINTS`` and ``NGROUPS`` keywords, a ``SCI`` extension, and a
+``PIXELDQ`` extension in which the reference pixels are flagged as
+non-science pixels. ``uncal`` files hold 4D ``uint16`` ramps, while
+``rate`` and ``rateints`` files hold 2D and 3D ``float32`` count rate
+images. The pixel values are a noisy background with a sprinkling of
+bright sources, so that the display limits are not trivial.
+
+Use
+---
+
+    This module can be imported and used as such:
+
+    ::
+
+        from jwql.benchmarks.synthetic_data import make_dataset
+        files = make_dataset('/path/to/directory')
+
+    or executed from the command line to write a dataset to disk:
+
+    ::
+
+        python synthetic_data.py /path/to/directory --integrations 2 --groups 5
+"""
+
+import argparse
+from collections import OrderedDict
+import os
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.utils.utils import ensure_dir_exists
+
+# Full frame dimensions (y, x) of the detectors used in the datasets
+DETECTOR_SHAPES = {'mirimage': (1024, 1032),
+                   'nrca1': (2048, 2048),
+                   'nrca2': (2048, 2048),
+                   'nrca3': (2048, 2048),
+                   'nrca4': (2048, 2048),
+                   'nrs1': (2048, 2048)}
+
+# Width in pixels of the reference pixel border
+REFERENCE_BORDER = 4
+
+# Data quality flags of reference pixels (REFERENCE_PIXEL | NON_SCIENCE),
+# as defined in ``jwst.datamodels.dqflags``
+REFERENCE_PIXEL_FLAGS = 2147483648 | 512
+
+
+def make_dataset(directory, integrations=2, groups=5, binning=1, seed=0):
+    """Write a set of synthetic exposures covering the file types and
+    detectors handled by the preview image code.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write the files. Like the ``jwql``
+        filesystem, the files are placed in a ``jw<proposal>``
+        subdirectory.
+    integrations : int
+        Number of integrations of the ``rateints`` and ``uncal`` files
+    groups : int
+        Number of groups per integration of the ``uncal`` files
+    binning : int
+        Factor by which the frame sizes of the single-detector files
+        are reduced, e.g. for a quick run. The files used to build the
+        NIRCam mosaic are always full frame.
+    seed : int
+        Seed of the random number generator
+
+    Returns
+    -------
+    dataset : dict
+        Lists of filenames, keyed by the name of the exposure (e.g.
+        ``nircam_uncal``)
+    """
+
+    directory = os.path.join(directory, 'jw00327')
+    ensure_dir_exists(directory)
+
+    exposures = [('nircam_rate', ['nrca1'], 'rate'),
+                 ('nircam_rateints', ['nrca1'], 'rateints'),
+                 ('nircam_uncal', ['nrca1'], 'uncal'),
+                 ('miri_rate', ['mirimage'], 'rate'),
+                 ('miri_uncal', ['mirimage'], 'uncal'),
+                 ('nirspec_rate', ['nrs1'], 'rate'),
+                 ('nirspec_uncal', ['nrs1'], 'uncal'),
+                 ('nircam_sw_mosaic', ['nrca1', 'nrca2', 'nrca3', 'nrca4'], 'rate')]
+
+    dataset = OrderedDict()
+    random_state = np.random.RandomState(seed)
+    for exposure_number, (name, detectors, suffix) in enumerate(exposures, start=1):
+        dataset[name] = []
+        for detector in detectors:
+            ny, nx = DETECTOR_SHAPES[detector]
+            if name != 'nircam_sw_mosaic':
+                ny, nx = ny // binning, nx // binning
+            if suffix == 'rate':
+                shape = (ny, nx)
+            elif suffix == 'rateints':
+                shape = (integrations, ny, nx)
+            else:
+                shape = (integrations, groups, ny, nx)
+
+            filename = os.path.join(directory, 'jw00327001001_02101_{:05d}_{}_{}.fits'.format(
+                exposure_number, detector, suffix))
+            make_fits_file(filename, shape, random_state)
+            dataset[name].append(filename)
+
+    return dataset
+
+
+def make_fits_file(filename, shape, random_state=None):
+    """Write a single synthetic FITS file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file to write
+    shape : tuple
+        Shape of the ``SCI`` extension. 4D shapes
+        ``(integrations, groups, y, x)`` produce ``uint16`` ramps, and
+        2D or 3D shapes ``float32`` count rates.
+    random_state : obj
+        ``numpy.random.RandomState`` object used to make the data
+    """
+
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    ny, nx = shape[-2:]
+
+    # Count rate image: background plus point sources
+    rate = random_state.normal(1., 0.1, (ny, nx)).astype(np.float32)
+    nsources = ny * nx // 2000
+    rows = random_state.randint(0, ny, nsources)
+    columns = random_state.randint(0, nx, nsources)
+    rate[rows, columns] += random_state.lognormal(3., 1.5, nsources).astype(np.float32)
+
+    if len(shape) == 4:
+        # Ramps of uint16 counts on top of a bias level
+        integrations, groups = shape[:2]
+        data = np.empty(shape, dtype=np.uint16)
+        bias = random_state.normal(12000., 50., (ny, nx)).astype(np.float32)
+        for group in range(groups):
+            signal = bias + rate * 10. * (group + 1)
+            data[:, group] = np.clip(signal, 0, 65535).astype(np.uint16)
+    elif len(shape) == 3:
+        data = np.repeat(rate[np.newaxis], shape[0], axis=0)
+        data += random_state.normal(0., 0.05, shape).astype(np.float32)
+    else:
+        data = rate
+
+    primary = fits.PrimaryHDU()
+    primary.header['SUBSTRT1'] = 1
+    primary.header['SUBSTRT2'] = 1
+    primary.header['SUBSIZE1'] = nx
+    primary.header['SUBSIZE2'] = ny
+    primary.header['NINTS'] = shape[0] if len(shape) > 2 else 1
+    primary.header['NGROUPS'] = shape[1] if len(shape) == 4 else 1
+
+    dq = np.zeros((ny, nx), dtype=np.uint32)
+    dq[:REFERENCE_BORDER, :] = dq[-REFERENCE_BORDER:, :] = REFERENCE_PIXEL_FLAGS
+    dq[:, :REFERENCE_BORDER] = dq[:, -REFERENCE_BORDER:] = REFERENCE_PIXEL_FLAGS
+
+    hdulist = fits.HDUList([primary,
+                            fits.ImageHDU(data, name='SCI'),
+                            fits.ImageHDU(dq, name='PIXELDQ')])
+    hdulist.writeto(filename, overwrite=True)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write synthetic JWST-like FITS files')
+    parser.add_argument('directory', help='Directory in which to write the files')
+    parser.add_argument('--integrations', type=int, default=2,
+                        help='Number of integrations of the rateints and uncal files')
+    parser.add_argument('--groups', type=int, default=5,
+                        help='Number of groups per integration of the uncal files')
+    parser.add_argument('--binning', type=int, default=1,
+                        help='Factor by which to reduce the single-detector frame sizes')
+    args = parser.parse_args()
+
+    for name, filenames in make_dataset(args.directory, args.integrations, args.groups,
+                                        args.binning).items():
+        print('{}: {}'.format(name, ', '.join(filenames)))
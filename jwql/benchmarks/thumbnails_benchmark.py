@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+
+"""Benchmark the data containers of the thumbnails pages.
+
+This module times ``thumbnail_menus`` and ``thumbnail_data``, which
+build the dropdown menus and file data of the ``thumbnails`` pages with
+a single grouping pass over the files of an instrument, for
+increasingly long lists of synthetic JWST filenames. They are compared
+with the loops used by earlier versions of ``thumbnails`` and
+``thumbnails_ajax``, which matched every rootname against every file.
+Because the earlier versions scale quadratically, they are only run up
+to ``--legacy-max`` files, where the outputs are also checked to be
+the same.
+
+Neither version reads the files, so the benchmark runs without the
+``jwql`` filesystem. Importing the data containers needs a config file,
+as for the web app.
+
+Use
+---
+
+    This script can be executed from the command line:
+
+    ::
+
+        python thumbnails_benchmark.py --sizes 1000 5000 50000
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from jwql.benchmarks.group_filenames_benchmark import make_filenames
+from jwql.utils.utils import filename_parser
+from jwql.website.apps.jwql.data_containers import get_expstart, thumbnail_data, \
+    thumbnail_menus
+
+
+def legacy_thumbnail_menus(filepaths, proposal=None):
+    """The loops of ``thumbnails`` that were used before the single
+    grouping pass.
+
+    Parameters
+    ----------
+    filepaths : list
+        Full paths of the files shown on the page
+    proposal : str (optional)
+        Number of APT proposal to filter
+
+    Returns
+    -------
+    detectors : list
+        The detectors of the files
+    proposals : list
+        The proposals of the files
+    """
+    full_ids = set(['_'.join(f.split('/')[-1].split('_')[:-1]) for f in filepaths])
+    if proposal is not None:
+        full_ids = [f for f in full_ids if f[2:7] == proposal]
+
+    detectors = []
+    proposals = []
+    for i, file_id in enumerate(full_ids):
+        for file in filepaths:
+            if '_'.join(file.split('/')[-1].split('_')[:-1]) == file_id:
+                program_id = filename_parser(file)['program_id']
+                detector = filename_parser(file)['detector']
+
+        if detector not in detectors and not detector.startswith('f'):
+            detectors.append(detector)
+        if program_id not in proposals:
+            proposals.append(program_id)
+
+    return detectors, proposals
+
+
+def legacy_thumbnail_data(inst, filepaths, available_filepaths, proposal=None):
+    """The loops of ``thumbnails_ajax`` that were used before the
+    single grouping pass. The glob of ``get_filenames_by_rootname`` is
+    replaced by a scan of ``available_filepaths``, which is what it did
+    on the filesystem.
+
+    Parameters
+    ----------
+    inst : str
+        Name of JWST instrument
+    filepaths : list
+        Full paths of the files whose rootnames are shown
+    available_filepaths : list
+        Full paths of all files of the instrument
+    proposal : str (optional)
+        Number of APT proposal to filter
+
+    Returns
+    -------
+    data_dict : dict
+        Dictionary of data needed for the ``thumbnails`` template
+    """
+    rootnames = set(['_'.join(f.split('/')[-1].split('_')[:-1]) for f in filepaths])
+    if proposal is not None:
+        rootnames = [rootname for rootname in rootnames if rootname[2:7] == proposal]
+
+    data_dict = {'inst': inst, 'file_data': {}}
+    for rootname in rootnames:
+        filename_dict = filename_parser(rootname)
+        available_files = sorted(os.path.basename(f) for f in available_filepaths
+                                 if os.path.basename(f).startswith(rootname))
+        data_dict['file_data'][rootname] = {
+            'filename_dict': filename_dict,
+            'available_files': available_files,
+            'expstart': get_expstart(rootname),
+            'suffixes': [filename_parser(filename)['suffix'] for filename in available_files]}
+
+    return data_dict
+
+
+def run_benchmark(sizes, legacy_max=5000):
+    """Time the thumbnails data containers for each number of files
+    and print the results.
+
+    Parameters
+    ----------
+    sizes : list
+        Numbers of filenames
+    legacy_max : int
+        Largest number of files for which the earlier loops are run
+
+    Returns
+    -------
+    results : list
+        One dictionary of timings per number of files
+    """
+    results = []
+    print('{:>8} {:>10} {:>12} {:>12} {:>8}'.format(
+        'files', 'rootnames', 'legacy [s]', 'single [s]', 'speedup'))
+    for size in sizes:
+        filepaths = make_filenames(size)
+
+        start = time.perf_counter()
+        detectors, proposals = thumbnail_menus(filepaths)
+        data_dict = thumbnail_data('NIRCam', filepaths, filepaths)
+        single_time = time.perf_counter() - start
+
+        legacy_time = np.nan
+        if size <= legacy_max:
+            start = time.perf_counter()
+            expected_detectors, expected_proposals = legacy_thumbnail_menus(filepaths)
+            expected = legacy_thumbnail_data('NIRCam', filepaths, filepaths)
+            legacy_time = time.perf_counter() - start
+            assert sorted(detectors) == sorted(expected_detectors)
+            assert sorted(proposals) == sorted(expected_proposals)
+            assert data_dict['file_data'] == expected['file_data']
+
+        print('{:>8} {:>10} {:>12.3f} {:>12.3f} {:>8.1f}'.format(
+            size, len(data_dict['file_data']), legacy_time, single_time,
+            legacy_time / single_time))
+        results.append({'files': size, 'rootnames': len(data_dict['file_data']),
+                        'legacy': legacy_time, 'single': single_time})
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the thumbnails data containers')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 50000],
+                        help='Numbers of filenames')
+    parser.add_argument('--legacy-max', type=int, default=5000,
+                        help='Largest number of files for which the earlier loops are run')
+    args = parser.parse_args()
+
+    run_benchmark(args.sizes, legacy_max=args.legacy_max)
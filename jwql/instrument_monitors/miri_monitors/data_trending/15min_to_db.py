@@ -1,6 +1,7 @@
 import statistics
 import os
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.mnemonics as mn
+import jwql.instrument_monitors.miri_monitors.data_trending.dashboard as dash
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.sql_interface as sql
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.csv_to_AstropyTable as apt
 from jwql.utils.utils import get_config, filename_parser
@@ -135,6 +136,10 @@ def main():
 
     #close connection
     sql.close_connection(conn)
+
+    #build the dashboard from the new data, so that the web app serves it
+    #from the dashboard cache
+    dash.cached_data_trending_dashboard()
     print("done")
 
 if __name__ == "__main__":
@@ -18,6 +18,11 @@ Use
         import jwql.instrument_monitors.miri_monitors.data_trending.dashboard as dash
         dashboard, variables = dash.data_trending_dashboard(start_time, end_time)
 
+    or, to serve the dashboard from the dashboard cache:
+
+    ::
+        dashboard, variables = dash.cached_data_trending_dashboard(start_time, end_time)
+
 Dependencies
 ------------
     User must provide "miri_database.db" in folder jwql/database
@@ -25,6 +30,8 @@ Dependencies
 """
 import os
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.sql_interface as sql
+from jwql.instrument_monitors.miri_monitors.data_trending.utils.dashboard_cache import \
+    DashboardCache, database_signature, get_dashboard_cache_filename, snap_to_day
 from jwql.utils.utils import get_config, filename_parser
 
 from bokeh.embed import components
@@ -52,6 +59,47 @@ default_start = datetime.date(2017, 8, 15).isoformat()
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
+def cached_data_trending_dashboard(start = default_start, end = None):
+    """Returns the dashboard from the dashboard cache. It is only
+    built again if the database has changed since it was cached, e.g.
+    by an ingest. The time range is widened to whole days, so that
+    ranges given to the second share the same cached dashboard.
+    Parameters
+    ----------
+    start : time
+        configures start time for query and visualisation
+    end : time
+        configures end time for query and visualisation. If None, the
+        dashboard ends at the time it is built
+    Return
+    ------
+    plot_data : list
+        A list containing the JavaScript and HTML content for the dashboard
+    variables : dict
+        no use
+    """
+
+    DATABASE_LOCATION = os.path.join(get_config()['jwql_dir'], 'database')
+    DATABASE_FILE = os.path.join(DATABASE_LOCATION, 'miri_database.db')
+
+    #the range, snapped to whole days, is the key of the cached dashboard
+    range_start = snap_to_day(start)
+    range_end = '' if end is None else snap_to_day(end, ceil=True)
+
+    cache = DashboardCache(get_dashboard_cache_filename())
+    plot_data = cache.get(range_start, range_end, DATABASE_FILE)
+    if plot_data is None:
+        signature = database_signature(DATABASE_FILE)
+        end = datetime.datetime.now() if end is None else range_end
+        plot_data, variables = data_trending_dashboard(range_start, end)
+        cache.put(range_start, range_end, plot_data, signature)
+
+    #some variables can be passed to the template via following
+    variables = dict(init = 1)
+
+    return plot_data, variables
+
+
 def data_trending_dashboard(start = default_start, end = now):
     """Bulilds dashboard
     Parameters
@@ -5,6 +5,7 @@ import sqlite3
 from jwql.utils.utils import get_config, filename_parser
 
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.mnemonics as mn
+import jwql.instrument_monitors.miri_monitors.data_trending.dashboard as dash
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.sql_interface as sql
 import jwql.instrument_monitors.miri_monitors.data_trending.utils.csv_to_AstropyTable as apt
 from jwql.instrument_monitors.miri_monitors.data_trending.utils.process_data import whole_day_routine, wheelpos_routine
@@ -161,6 +162,10 @@ def main():
         process_file(conn, path)
 
     sql.close_connection(conn)
+
+    #build the dashboard from the new data, so that the web app serves it
+    #from the dashboard cache
+    dash.cached_data_trending_dashboard()
     print("done")
 
 if __name__ == "__main__":
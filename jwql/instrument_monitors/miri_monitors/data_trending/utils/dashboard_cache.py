@@ -0,0 +1,204 @@
+"""Cache of the rendered MIRI data trending dashboard.
+
+The ``[div, script]`` of the dashboard is kept in a SQLite database,
+keyed by the time range (snapped to whole days) and by the signature of
+the data trending database it was built from. Only the ``max_ranges``
+most recently built ranges are kept.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.instrument_monitors.miri_monitors.data_trending.utils.dashboard_cache import \\
+            DashboardCache, database_signature, get_dashboard_cache_filename, snap_to_day
+
+        cache = DashboardCache(get_dashboard_cache_filename())
+        start, end = snap_to_day(start), snap_to_day(end, ceil=True)
+        plot_data = cache.get(start, end, database_file)
+        if plot_data is None:
+            signature = database_signature(database_file)
+            plot_data = build_dashboard()
+            cache.put(start, end, plot_data, signature)
+"""
+
+import os
+import time
+
+from astropy.time import Time
+
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+
+def database_signature(database_file):
+    """Return the modification time and size of the data trending
+    database, which change with every ingest.
+
+    Parameters
+    ----------
+    database_file : str
+        Path of the data trending database
+
+    Returns
+    -------
+    signature : tuple
+        Modification time and size of the database
+    """
+
+    status = os.stat(database_file)
+
+    return status.st_mtime, status.st_size
+
+
+def get_dashboard_cache_filename():
+    """Return the location of the dashboard cache database. This is the
+    ``miri_dashboard_cache`` entry of the config file, if present, and
+    ``<outputs>/miri_data_trending/dashboard_cache.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the cache database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'miri_data_trending', 'dashboard_cache.db')
+
+    return settings.get('miri_dashboard_cache', default)
+
+
+def snap_to_day(value, ceil=False):
+    """Return the start of the day of a time, as the key of a time
+    range in the cache.
+
+    Parameters
+    ----------
+    value : obj
+        The time, as an ISO string or ``datetime`` object
+    ceil : bool
+        If ``True``, return the start of the next day, unless the time
+        is already the start of a day
+
+    Returns
+    -------
+    day : str
+        ISO representation of the start of the day, e.g.
+        ``2017-08-15 00:00:00.000``
+    """
+
+    value = Time(value)
+    day = Time(value.iso[:10])
+    if ceil and day < value:
+        day = Time(day.mjd + 1, format='mjd')
+
+    return day.iso
+
+
+class DashboardCache(SQLiteStore):
+    """Rendered dashboards, keyed by time range.
+
+    Attributes
+    ----------
+    max_ranges : int
+        Number of time ranges whose dashboards are kept
+
+    Methods
+    -------
+    get(start, end, database_file)
+        Return the cached dashboard of a time range
+    put(start, end, plot_data, signature)
+        Cache the dashboard of a time range
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS dashboards ('
+              'range_start TEXT NOT NULL, '
+              'range_end TEXT NOT NULL, '
+              'database_mtime REAL NOT NULL, '
+              'database_size INTEGER NOT NULL, '
+              'div TEXT NOT NULL, '
+              'script TEXT NOT NULL, '
+              'created REAL NOT NULL, '
+              'PRIMARY KEY (range_start, range_end))']
+
+    def __init__(self, filename, max_ranges=8, timeout=30., wal=False):
+        """Create the database if it does not exist.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the database file
+        max_ranges : int
+            Number of time ranges whose dashboards are kept
+        timeout : float
+            Number of seconds to wait for a lock held by another
+            process
+        wal : bool
+            If ``True``, use the write-ahead log (see
+            ``jwql.utils.sqlite_store``)
+        """
+
+        super(DashboardCache, self).__init__(filename, timeout=timeout, wal=wal)
+        self.max_ranges = max_ranges
+
+    def get(self, start, end, database_file):
+        """Return the cached dashboard of a time range, if it was built
+        from the current version of the data trending database.
+
+        Parameters
+        ----------
+        start : str
+            Start of the time range
+        end : str
+            End of the time range, or an empty string for a range that
+            ends at the time the dashboard is built
+        database_file : str
+            Path of the data trending database
+
+        Returns
+        -------
+        plot_data : list
+            The ``[div, script]`` of the dashboard, or ``None`` if it is
+            not cached or out of date
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT database_mtime, database_size, div, script '
+                                     'FROM dashboards WHERE range_start = ? AND range_end = ?',
+                                     (start, end)).fetchone()
+        if row is None or tuple(row[:2]) != database_signature(database_file):
+            return None
+
+        return [row[2], row[3]]
+
+    def put(self, start, end, plot_data, signature):
+        """Cache the dashboard of a time range, replacing the one built
+        from an earlier version of the database. Dashboards of other
+        time ranges built from earlier versions are removed, as are the
+        oldest ones beyond ``max_ranges``.
+
+        Parameters
+        ----------
+        start : str
+            Start of the time range
+        end : str
+            End of the time range, or an empty string
+        plot_data : list
+            The ``[div, script]`` of the dashboard
+        signature : tuple
+            The ``database_signature`` of the database taken before the
+            dashboard was built, so that a dashboard built while an
+            ingest was writing is not served as current
+        """
+
+        with self.connect() as connection:
+            connection.execute('DELETE FROM dashboards WHERE database_mtime != ? '
+                               'OR database_size != ?', signature)
+            connection.execute('INSERT OR REPLACE INTO dashboards VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (start, end, signature[0], signature[1], plot_data[0],
+                                plot_data[1], time.time()))
+            connection.execute('DELETE FROM dashboards WHERE rowid NOT IN '
+                               '(SELECT rowid FROM dashboards ORDER BY created DESC LIMIT ?)',
+                               (self.max_ranges,))
@@ -8,6 +8,24 @@ axes labels, titles, and colorbars, wheras thumbnail images are
 smaller and contain no labels.  Images are saved into the
 ``preview_image_filesystem`` and ``thumbnail_filesystem``, organized
 by subdirectories pertaining to the ``program_id`` in the filenames.
+For NIRCam mosaics, a deep-zoom tile pyramid is saved alongside the
+preview image, to be served by the web app.
+
+The inputs of the generated images are recorded in a manifest (see
+``jwql.utils.preview_manifest``), so that later runs only render
+exposures whose files are new or have changed since they were last
+rendered.
+
+Several hosts that share the filesystem can split a run between them
+with ``--coordinate``: each exposure group is then claimed through a
+lease file (see ``jwql.utils.preview_leases``) before it is rendered,
+so that no two hosts render the same group, and the groups of a host
+that crashes are taken over once its leases expire. The hosts must then
+share the manifest as well, so that a host does not render again the
+groups that another host has finished: the manifest (the
+``preview_manifest`` entry of the config file) must be on the same
+shared filesystem as the lease directory, and must not use SQLite's
+write-ahead log, which does not work on network filesystems.
 
 Authors
 -------
@@ -24,20 +42,70 @@ Use
     ::
 
         python generate_preview_images.py
+
+    To spread the exposure groups across several worker processes:
+
+    ::
+
+        python generate_preview_images.py --workers 8
+
+    To render the integrations of each file in parallel instead, e.g.
+    for time series observations with many integrations:
+
+    ::
+
+        python generate_preview_images.py --integration-workers 8
+
+    To render the images again even if they are up to date, for all
+    proposals or only the given ones:
+
+    ::
+
+        python generate_preview_images.py --force
+        python generate_preview_images.py --force 00327 jw01022
+
+    To split the run with other hosts running the same command:
+
+    ::
+
+        python generate_preview_images.py --coordinate --lease-duration 600
+
+    To keep the data held by all worker processes within a memory
+    ceiling, e.g. on a shared node:
+
+    ::
+
+        python generate_preview_images.py --workers 8 --memory-limit 16G
+
+    ``--force`` is not coordinated between hosts; forced runs should be
+    started on a single host.
 """
 
+import argparse
+from collections import OrderedDict
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 import logging
+import multiprocessing
 import os
 import re
 
+from astropy.io import fits
 import numpy as np
 
 from jwql.utils import permissions
 from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
-from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.logging_functions import RecordCollector, configure_logging, log_info, log_fail
 from jwql.utils.preview_image import PreviewImage
-from jwql.utils.utils import get_config, filename_parser
+from jwql.utils.preview_leases import LeaseDirectory, get_lease_directory, lease_name
+from jwql.utils.preview_manifest import PreviewManifest, file_signatures, get_manifest_filename
+from jwql.utils.utils import get_config, filename_parser, format_size, parse_size
+
+# Use the 'Agg' backend to avoid invoking $DISPLAY
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
 
 # Size of NIRCam inter- and intra-module chip gaps
 SW_MOD_GAP = 1387  # pixels = int(43 arcsec / 0.031 arcsec/pixel)
@@ -46,6 +114,191 @@ SW_DET_GAP = 145  # pixels = int(4.5 arcsec / 0.031 arcsec/pixel)
 FULLX = 2048  # Width of the full detector
 FULLY = 2048  # Height of the full detector
 
+# Settings of the preview images and thumbnails. These are stored in the
+# manifest, so changing any of them causes every exposure to be rendered
+# again on the next run.
+PREVIEW_PARAMETERS = {'clip_percent': 0.01,
+                      'cmap': 'viridis',
+                      'engine': 'direct',
+                      'output_format': 'jpg',
+                      'scaling': 'log',
+                      'thumbnail_size': 480,
+                      'thumbnail_source': 'preview',
+                      'tile_size': 256}
+
+# The manifests opened by a worker process of a coordinated run, keyed
+# by filename, so that the database is set up once per worker rather
+# than once per exposure group
+WORKER_MANIFESTS = {}
+
+
+def _initialize_worker():
+    """Prepare a worker process of the ``--workers`` pool. Log records
+    are routed through a ``RecordCollector`` for each exposure group
+    rather than written to the log file directly.
+    """
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    plt.close('all')
+
+
+def _check_shared_manifest(manifest, leases):
+    """Make sure the manifest can be shared by the hosts of a
+    coordinated run, i.e. that it is on the same filesystem as the
+    lease directory and does not use the write-ahead log.
+
+    Parameters
+    ----------
+    manifest : obj
+        ``PreviewManifest`` object
+    leases : obj
+        ``LeaseDirectory`` object
+
+    Raises
+    ------
+    ValueError
+        If the manifest cannot be shared
+    """
+
+    manifest_device = os.stat(os.path.dirname(os.path.abspath(manifest.filename))).st_dev
+    if manifest.wal or manifest_device != os.stat(leases.directory).st_dev:
+        raise ValueError('In coordinated mode, the manifest ({}) must be on the filesystem of '
+                         'the lease directory ({}), shared by all render hosts, and must not '
+                         'use the write-ahead log'.format(manifest.filename, leases.directory))
+
+
+def _claim_group(leases, manifest, file_list, signatures, forced):
+    """Claim the lease of an exposure group before it is rendered in
+    coordinated mode.
+
+    Parameters
+    ----------
+    leases : obj
+        ``LeaseDirectory`` object
+    manifest : obj
+        ``PreviewManifest`` object
+    file_list : list
+        The files of the exposure group
+    signatures : dict
+        The output of ``file_signatures`` for ``file_list``
+    forced : bool
+        If ``True``, the group is rendered even if it is up to date
+
+    Returns
+    -------
+    status : str
+        ``claimed`` if the group is being rendered by another host,
+        ``skipped`` if another host has rendered it since the run
+        began, and ``None`` if the lease is now held and the group is
+        to be rendered
+    """
+
+    name = lease_name(file_list)
+    if not leases.acquire(name):
+        return 'claimed'
+
+    # Another host may have finished the group and released its lease
+    # since the manifest was read at the beginning of the run. Only the
+    # entries of the group are read again.
+    if not forced and manifest.is_current(signatures, PREVIEW_PARAMETERS):
+        leases.release(name)
+        return 'skipped'
+
+    return None
+
+
+def _process_group_in_worker(job):
+    """Render a single exposure group inside a worker process.
+
+    Parameters
+    ----------
+    job : tuple
+        The arguments of ``process_file_group``, and either ``None`` or,
+        in coordinated mode, the ``LeaseDirectory`` object, the
+        filename of the manifest, and the signatures and ``forced``
+        flag of the group (see ``_claim_group``). The lease of a
+        rendered group is left to the parent process to release, once
+        the group is recorded in the manifest.
+
+    Returns
+    -------
+    status : str
+        The status returned by ``process_file_group``, or by
+        ``_claim_group`` if the group was not claimed
+    records : list
+        The ``logging.LogRecord`` objects emitted while rendering
+    """
+
+    task, claim = job
+    if claim is not None:
+        leases, manifest_filename, signatures, forced = claim
+        if manifest_filename not in WORKER_MANIFESTS:
+            WORKER_MANIFESTS[manifest_filename] = PreviewManifest(manifest_filename)
+        status = _claim_group(leases, WORKER_MANIFESTS[manifest_filename], task[0],
+                              signatures, forced)
+        if status is not None:
+            return status, []
+
+    collector = RecordCollector()
+    root = logging.getLogger()
+    root.addHandler(collector)
+    try:
+        status = _process_group_safely(*task)
+    finally:
+        root.removeHandler(collector)
+        plt.close('all')
+
+    return status, collector.records
+
+
+def _process_group_safely(file_list, preview_image_filesystem, thumbnail_filesystem,
+                          overwrite=False, memory_limit=None, integration_workers=1,
+                          integration_pool=None):
+    """Run ``process_file_group``, logging any unexpected exception
+    instead of letting it stop the run.
+
+    Returns
+    -------
+    status : str
+        ``rendered``, ``skipped``, or ``failed``
+    """
+
+    try:
+        return process_file_group(file_list, preview_image_filesystem, thumbnail_filesystem,
+                                  overwrite=overwrite, memory_limit=memory_limit,
+                                  integration_workers=integration_workers,
+                                  integration_pool=integration_pool)
+    except Exception:
+        logging.exception('Failed to create preview images for {}'.format(file_list[0]))
+        return 'failed'
+
+
+def _record_status(manifest, statuses, status, file_list, signatures):
+    """Tally the outcome of an exposure group, and record it in the
+    manifest unless it failed, so that it is retried on the next run.
+
+    Parameters
+    ----------
+    manifest : obj
+        ``PreviewManifest`` object
+    statuses : dict
+        Lists of the first filename of each group, keyed by status
+    status : str
+        ``rendered``, ``skipped``, or ``failed``
+    file_list : list
+        The files of the exposure group
+    signatures : dict
+        The output of ``file_signatures`` for ``file_list``, taken
+        before the group was processed
+    """
+
+    statuses[status].append(file_list[0])
+    if status != 'failed':
+        manifest.record(signatures, PREVIEW_PARAMETERS)
+
 
 def array_coordinates(channelmod, detector_list, lowerleft_list):
     """Create an appropriately sized ``numpy`` array to contain the
@@ -338,6 +591,112 @@ def create_mosaic(filenames):
     return full_array, full_dq
 
 
+def create_mosaic_stream(filenames, prefetch=True):
+    """Create the mosaic of an exposure one integration at a time.
+
+    Unlike ``create_mosaic``, which holds the difference images of all
+    detectors and integrations in memory along with the full mosaic,
+    this generator keeps a single ``float32`` mosaic frame that is
+    filled in place for each integration, so that its memory use does
+    not grow with the number of integrations. With ``prefetch``, the
+    detector data of the next integration are read in a background
+    thread while the caller works on the current one.
+
+    Parameters
+    ----------
+    filenames : list
+        List of filenames to be combined into a mosaic
+
+    prefetch : bool
+        If ``True``, read the next integration while the current one
+        is being used
+
+    Yields
+    ------
+    integration : int
+        Integration number
+
+    mosaic : obj
+        2D ``numpy`` array containing the mosaic of the integration.
+        The same array is refilled for each integration, so it must
+        not be kept beyond the current iteration.
+
+    dq : obj
+        2D ``numpy`` array containing the DQ array of the mosaic (see
+        ``create_dq_array``), based on the first integration
+    """
+
+    # Read the detector and aperture location of each file, and the
+    # number of integrations, from the headers
+    detector = []
+    data_lower_left = []
+    nints = []
+    for filename in filenames:
+        with fits.open(filename) as hdulist:
+            if 'SCI' not in hdulist:
+                raise ValueError(('WARNING: no SCI extension in {}!'.format(filename)))
+            header = hdulist['SCI'].header
+            if header['NAXIS'] not in [2, 3, 4]:
+                raise ValueError(('Difference image for {} must be either 2D or 3D.'
+                                  .format(filename)))
+            if header['NAXIS'] == 2:
+                nints.append(1)
+            else:
+                nints.append(header['NAXIS{}'.format(header['NAXIS'])])
+            data_lower_left.append((hdulist[0].header['SUBSTRT1'], hdulist[0].header['SUBSTRT2']))
+        detector.append(filename_parser(filename)['detector'].upper())
+
+    if len(set(nints)) != 1:
+        raise ValueError(('Files of {} have different numbers of integrations.'
+                          .format(filenames[0])))
+
+    # Make sure SW and LW data are not being mixed. Create the
+    # appropriately sized numpy array to hold one integration of the
+    # data based on the channel, module, and subarray size
+    mosaic_channel = find_data_channel(detector)
+    full_xdim, full_ydim, full_lower_left = array_coordinates(mosaic_channel, detector,
+                                                              data_lower_left)
+    mosaic = np.full((full_ydim, full_xdim), np.nan, dtype=np.float32)
+
+    def read_integration(integration):
+        return [read_detector_integration(filename, integration) for filename in filenames]
+
+    executor = None
+    if prefetch:
+        executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        data = read_integration(0)
+        for integration in range(nints[0]):
+            if prefetch and integration + 1 < nints[0]:
+                future = executor.submit(read_integration, integration + 1)
+
+            # Place the data from the individual detectors in the
+            # appropriate places in the mosaic. The detectors cover the
+            # same pixels in every integration, so the gaps between
+            # them stay NaN.
+            for pixdata, detect in zip(data, detector):
+                x0, y0 = full_lower_left[detect]
+                yd, xd = pixdata.shape
+                mosaic[y0: y0 + yd, x0: x0 + xd] = pixdata
+            data = None
+
+            # Create associated DQ array and set unpopulated pixels to
+            # be skipped in preview image scaling
+            if integration == 0:
+                full_dq = create_dq_array(full_xdim, full_ydim, mosaic, mosaic_channel)
+
+            yield integration, mosaic, full_dq
+
+            if integration + 1 < nints[0]:
+                if prefetch:
+                    data = future.result()
+                else:
+                    data = read_integration(integration + 1)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
 def create_dq_array(xd, yd, mosaic, module):
     """Create DQ array that goes with the mosaic image. Set unpopulated
     pixels to be skipped in preview image scaling. Same for the
@@ -424,6 +783,43 @@ def create_dq_array(xd, yd, mosaic, module):
     return dq
 
 
+def define_options():
+    """Create the command line parser for the ``generate_preview_images``
+    script.
+
+    Returns
+    -------
+    parser : obj
+        ``argparse.ArgumentParser`` object
+    """
+
+    parser = argparse.ArgumentParser(description='Generate preview images and thumbnails '
+                                                 'for all files in the jwql filesystem.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes used to render the exposure groups '
+                             '(default: 1, render serially)')
+    parser.add_argument('--integration-workers', type=int, default=1,
+                        help='Number of processes used to render the integrations of a single '
+                             'file, e.g. for time series with many integrations. Only used '
+                             'with --workers 1 (default: 1)')
+    parser.add_argument('--force', nargs='*', metavar='PROPOSAL',
+                        help='Render the images again even if the manifest shows that they are '
+                             'up to date, for the given proposals (e.g. 00327 or jw00327), or '
+                             'for all proposals if none are given')
+    parser.add_argument('--memory-limit',
+                        help='Memory ceiling shared by the workers, e.g. 16G (default: the '
+                             'preview_memory_limit entry of the config file, or no limit)')
+    parser.add_argument('--coordinate', action='store_true',
+                        help='Claim each exposure group through a lease file before rendering '
+                             'it, so that several hosts can split the run. The preview '
+                             'manifest must be on the filesystem shared by the hosts')
+    parser.add_argument('--lease-duration', type=float, default=600.,
+                        help='Seconds after which the lease of a host that stopped renewing it '
+                             'is taken over by another host (default: 600)')
+
+    return parser
+
+
 def detector_check(detector_list, search_string):
     """Search a given list of detector names for the provided regular
     expression sting.
@@ -450,6 +846,59 @@ def detector_check(detector_list, search_string):
     return total
 
 
+def exposure_group_key(full_filename):
+    """Return the key shared by the files of an exposure that are
+    grouped together by ``group_filenames``: their directory,
+    exposure, NIRCam channel (or detector for other instruments), and
+    suffix.
+
+    Parameters
+    ----------
+    full_filename : str
+        Path of a JWST file
+
+    Returns
+    -------
+    key : tuple
+        The group key
+    canonical : bool
+        ``True`` if the filename follows the JWST naming convention
+        (``<exposure>_<detector>_<suffix>.fits``) exactly, and can
+        therefore be grouped
+    """
+
+    file_directory, filename = os.path.split(full_filename)
+
+    # Generate the key shared by the files of the exposure
+    filename_parts = filename_parser(filename)
+    program = filename_parts['program_id']
+    observation = filename_parts['observation']
+    visit = filename_parts['visit']
+    visit_group = filename_parts['visit_group']
+    parallel = filename_parts['parallel_seq_id']
+    activity = filename_parts['activity']
+    exposure = filename_parts['exposure_id']
+    detector = filename_parts['detector'].upper()
+    suffix = filename_parts['suffix']
+
+    observation_base = 'jw{}{}{}_{}{}{}_{}_'.format(
+        program, observation, visit, visit_group,
+        parallel, activity, exposure)
+
+    if detector in NIRCAM_SHORTWAVE_DETECTORS:
+        detector_class = 'NRC_SW'
+    elif detector in NIRCAM_LONGWAVE_DETECTORS:
+        detector_class = 'NRC_LW'
+    else:  # non-NIRCam detectors - should never be used I think??
+        detector_class = detector
+
+    key = (file_directory, observation_base.lower(), detector_class, suffix.lower())
+    canonical_name = '{}{}_{}.fits'.format(observation_base, detector, suffix)
+    canonical = filename.lower() == canonical_name.lower()
+
+    return key, canonical
+
+
 def find_data_channel(detectors):
     """Using a list of detectors, identify the channel(s) that the data
     are from.
@@ -498,8 +947,40 @@ def find_data_channel(detectors):
 
 @log_fail
 @log_info
-def generate_preview_images():
-    """The main function of the ``generate_preview_image`` module."""
+def generate_preview_images(workers=1, force=None, integration_workers=1, coordinate=False,
+                            lease_duration=600., memory_limit=None):
+    """The main function of the ``generate_preview_image`` module.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes used to render the exposure groups.
+        With the default of ``1`` the groups are rendered one at a time
+        in the current process.
+    force : list or None
+        Proposals (e.g. ``00327`` or ``jw00327``) whose images are
+        rendered again even if they are up to date. An empty list
+        forces all proposals, and ``None`` (default) none of them.
+    integration_workers : int
+        Number of processes used to render the integrations of a
+        single file (see ``PreviewImage.workers``). Only used if
+        ``workers`` is ``1``, since the workers of the pool cannot
+        start processes of their own.
+    coordinate : bool
+        If ``True``, claim each exposure group through a lease file in
+        the ``preview_lease_directory`` before rendering it, and leave
+        the groups claimed by other hosts to them. The manifest must
+        then be on the same shared filesystem as the lease directory.
+    lease_duration : float
+        Number of seconds after its last renewal at which a lease is
+        taken over by another host
+    memory_limit : str
+        Memory ceiling of the run, e.g. ``16G``, shared equally by the
+        ``workers``. Each worker then reads large ramps in blocks to
+        stay within its share (see ``PreviewImage.memory_limit``).
+        Defaults to the ``preview_memory_limit`` entry of the config
+        file, if present, and no limit otherwise.
+    """
 
     # Begin logging
     logging.info("Beginning the script run")
@@ -512,74 +993,104 @@ def generate_preview_images():
     grouped_filenames = group_filenames(filenames)
     logging.info('Found {} filenames'.format(len(filenames)))
 
+    # The memory limit is shared by the worker processes
+    worker_memory_limit = None
+    if memory_limit is None:
+        memory_limit = get_config().get('preview_memory_limit')
+    if memory_limit is not None:
+        worker_memory_limit = parse_size(str(memory_limit)) // max(workers, 1)
+        logging.info('Each of the {} worker(s) may use {} for the data of a file'.format(
+            max(workers, 1), format_size(worker_memory_limit)))
+
+    # Look up the exposure groups in the manifest, and only render the
+    # ones that are new, have changed, or are forced
+    if force is not None:
+        force = ['jw{}'.format(proposal.lower().replace('jw', '').zfill(5)) for proposal in force]
+    manifest = PreviewManifest(get_manifest_filename())
+    entries = manifest.entries()
+    tasks = []
+    signatures = []
+    forced_groups = []
+    statuses = {'rendered': [], 'skipped': [], 'failed': [], 'claimed': []}
     for file_list in grouped_filenames:
-        filename = file_list[0]
-        # Determine the save location
-        try:
-            identifier = 'jw{}'.format(filename_parser(filename)['program_id'])
-        except ValueError as error:
-            identifier = os.path.basename(filename).split('.fits')[0]
-
-        preview_output_directory = os.path.join(preview_image_filesystem, identifier)
-        thumbnail_output_directory = os.path.join(thumbnail_filesystem, identifier)
-
-        # Check to see if the preview images already exist and skip
-        # if they do
-        file_exists = check_existence(file_list, preview_output_directory)
-        if file_exists:
-            logging.info("JPG already exists for {}, skipping.".format(filename))
+        proposal = os.path.basename(os.path.dirname(file_list[0]))
+        forced = force is not None and (len(force) == 0 or proposal in force)
+        group_signatures = file_signatures(file_list)
+        if not forced and manifest.is_current(group_signatures, PREVIEW_PARAMETERS, entries):
+            statuses['skipped'].append(file_list[0])
             continue
 
-        # Create the output directories if necessary
-        if not os.path.exists(preview_output_directory):
-            os.makedirs(preview_output_directory)
-            permissions.set_permissions(preview_output_directory)
-            logging.info('Created directory {}'.format(preview_output_directory))
-        if not os.path.exists(thumbnail_output_directory):
-            os.makedirs(thumbnail_output_directory)
-            permissions.set_permissions(thumbnail_output_directory)
-            logging.info('Created directory {}'.format(thumbnail_output_directory))
-
-        # If the exposure contains more than one file (because more
-        # than one detector was used), then create a mosaic
-        max_size = 8
-        numfiles = len(file_list)
-        if numfiles != 1:
-            try:
-                mosaic_image, mosaic_dq = create_mosaic(file_list)
-                logging.info('Created mosiac for:')
-                for item in file_list:
-                    logging.info('\t{}'.format(item))
-            except (ValueError, FileNotFoundError) as error:
-                logging.error(error)
-            dummy_file = create_dummy_filename(file_list)
-            if numfiles in [2, 4]:
-                max_size = 16
-            elif numfiles in [8]:
-                max_size = 32
-
-        # Create the nominal preview image and thumbnail
-        try:
-            im = PreviewImage(filename, "SCI")
-            im.clip_percent = 0.01
-            im.scaling = 'log'
-            im.cmap = 'viridis'
-            im.output_format = 'jpg'
-            im.preview_output_directory = preview_output_directory
-            im.thumbnail_output_directory = thumbnail_output_directory
-
-            # If a mosaic was made from more than one file
-            # insert it and it's associated DQ array into the
-            # instance of PreviewImage. Also set the input
-            # filename to indicate that we have mosaicked data
-            if numfiles != 1:
-                im.data = mosaic_image
-                im.dq = mosaic_dq
-                im.file = dummy_file
-
-            im.make_image(max_img_size=max_size)
-        except ValueError as error:
-            logging.warning(error)
+        # Files that are not in the manifest at all may still have
+        # images from before the manifest existed. These are checked
+        # for (and adopted) by process_file_group.
+        known = any(filename in entries for filename in file_list)
+        tasks.append((file_list, preview_image_filesystem, thumbnail_filesystem, forced or known,
+                      worker_memory_limit))
+        signatures.append(group_signatures)
+        forced_groups.append(forced)
+    logging.info('{} exposure groups are up to date, {} to be processed'.format(
+        len(statuses['skipped']), len(tasks)))
+
+    # In coordinated mode, the leases of the groups being rendered are
+    # renewed in the background for the whole run
+    leases = None
+    with ExitStack() as stack:
+        if coordinate:
+            leases = LeaseDirectory(get_lease_directory(), duration=lease_duration)
+            _check_shared_manifest(manifest, leases)
+            stack.enter_context(leases.keep_alive())
+            logging.info('Claiming exposure groups as {}'.format(leases.owner))
+
+        if workers > 1:
+            # Use the spawn start method so that every worker begins
+            # with a fresh interpreter and its own matplotlib state. Log
+            # records are collected in the workers and re-emitted here
+            # in group order, so the log reads the same as for a serial
+            # run.
+            claims = [None] * len(tasks)
+            if leases is not None:
+                claims = [(leases, manifest.filename, group_signatures, forced)
+                          for group_signatures, forced in zip(signatures, forced_groups)]
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(processes=workers, initializer=_initialize_worker) as pool:
+                results = pool.imap(_process_group_in_worker, zip(tasks, claims))
+                for task, group_signatures, (status, records) in zip(tasks, signatures, results):
+                    for record in records:
+                        logging.getLogger().handle(record)
+                    if status == 'claimed':
+                        statuses[status].append(task[0][0])
+                        continue
+                    _record_status(manifest, statuses, status, task[0], group_signatures)
+                    if leases is not None:
+                        leases.release(lease_name(task[0]))
+        else:
+            # A single pool renders the integrations of all the files
+            # of the run, rather than one pool being started per file
+            integration_pool = None
+            if integration_workers > 1 and tasks:
+                context = multiprocessing.get_context('spawn')
+                integration_pool = stack.enter_context(
+                    context.Pool(processes=integration_workers))
+            for task, group_signatures, forced in zip(tasks, signatures, forced_groups):
+                if leases is not None:
+                    status = _claim_group(leases, manifest, task[0], group_signatures, forced)
+                    if status is not None:
+                        statuses[status].append(task[0][0])
+                        continue
+                status = _process_group_safely(*task, integration_workers=integration_workers,
+                                               integration_pool=integration_pool)
+                _record_status(manifest, statuses, status, task[0], group_signatures)
+                if leases is not None:
+                    leases.release(lease_name(task[0]))
+
+    # Summarize the run
+    logging.info('Rendered {} exposure groups, skipped {}, failed {}'.format(
+        len(statuses['rendered']), len(statuses['skipped']), len(statuses['failed'])))
+    if coordinate:
+        logging.info('{} exposure groups were claimed by other hosts'.format(
+            len(statuses['claimed'])))
+    for filename in statuses['failed']:
+        logging.info('\tFailed: {}'.format(filename))
 
     # Complete logging:
     logging.info("Completed.")
@@ -595,6 +1106,11 @@ def group_filenames(input_files):
     a given exposure will be kept separate from one another and no
     mosaic will be made.
 
+    The files are grouped in a single pass, keyed on their directory,
+    exposure, NIRCam channel (or detector), and suffix. Files whose
+    names do not follow the JWST naming convention
+    (``<exposure>_<detector>_<suffix>.fits``) are left out.
+
     Parameters
     ----------
     input_files : list
@@ -605,77 +1121,200 @@ def group_filenames(input_files):
     grouped : list
         grouped list of filenames where each element is a list and
         contains the names of filenames with matching exposure
-        information.
+        information. Groups are ordered by the first (sorted) file of
+        each exposure, and the filenames of each group are sorted.
     """
 
-    grouped = []
+    groups = OrderedDict()
 
     # Sort files first
     input_files.sort()
 
-    goodindex = np.arange(len(input_files))
-    input_files = np.array(input_files)
-
-    # Loop over each file in the list of good files
-    for index, full_filename in enumerate(input_files[goodindex]):
-        file_directory, filename = os.path.split(full_filename)
-
-        # Generate string to be matched with other filenames
-        filename_parts = filename_parser(filename)
-        program = filename_parts['program_id']
-        observation = filename_parts['observation']
-        visit = filename_parts['visit']
-        visit_group = filename_parts['visit_group']
-        parallel = filename_parts['parallel_seq_id']
-        activity = filename_parts['activity']
-        exposure = filename_parts['exposure_id']
-        detector = filename_parts['detector'].upper()
-        suffix = filename_parts['suffix']
-
-        observation_base = 'jw{}{}{}_{}{}{}_{}_'.format(
-            program, observation, visit, visit_group,
-            parallel, activity, exposure)
-
-        if detector in NIRCAM_SHORTWAVE_DETECTORS:
-            detector_str = 'NRC[AB][1234]'
-        elif detector in NIRCAM_LONGWAVE_DETECTORS:
-            detector_str = 'NRC[AB]5'
-        else:  # non-NIRCam detectors - should never be used I think??
-            detector_str = detector
-        match_str = '{}{}_{}.fits'.format(observation_base, detector_str, suffix)
-        match_str = os.path.join(file_directory, match_str)
-        pattern = re.compile(match_str, re.IGNORECASE)
-
-        # Try to match the substring to each good file
-        matches = []
-        matched_name = []
-        for index2, file2match in enumerate(input_files[goodindex]):
-            match = pattern.match(file2match)
-
-            # Add any files that match the string
-            if match is not None:
-                matched_name.append(file2match)
-                matches.append(goodindex[index2])
-        # For any matched files, remove from goodindex so we don't
-        # use them as a basis for matching later
-        all_locs = []
-        for num in matches:
-            loc = np.where(goodindex == num)
-            all_locs.append(loc[0][0])
-        if len(all_locs) != 0:
-            # Delete matched file indexes from the list of
-            # files to search
-            goodindex = np.delete(goodindex, all_locs)
-
-            # Add the list of matched files to the overall list of files
-            grouped.append(matched_name)
+    for full_filename in input_files:
+        # Only files named exactly after their parts are added to the
+        # group, but any file (e.g. a segment of the exposure) sets the
+        # position of its group in the output
+        key, canonical = exposure_group_key(full_filename)
+        group = groups.setdefault(key, [])
+        if canonical:
+            group.append(full_filename)
+
+    grouped = [group for group in groups.values() if len(group) > 0]
 
     return grouped
 
 
+def process_file_group(file_list, preview_image_filesystem, thumbnail_filesystem,
+                       overwrite=False, memory_limit=None, integration_workers=1,
+                       integration_pool=None):
+    """Create the preview images and thumbnails for a single exposure
+    group, as returned by ``group_filenames``.
+
+    Parameters
+    ----------
+    file_list : list
+        List of filenames belonging to the same exposure. If more than
+        one file is given, a mosaic of the detectors is created.
+
+    preview_image_filesystem : str
+        Top-level directory of the preview images
+
+    thumbnail_filesystem : str
+        Top-level directory of the thumbnail images
+
+    overwrite : bool
+        If ``True``, create the images even if they already exist
+
+    memory_limit : int
+        Number of bytes that the data of a single file may take in
+        memory (see ``PreviewImage.memory_limit``)
+
+    integration_workers : int
+        Number of processes used to render the integrations of a
+        single file
+
+    integration_pool : obj
+        ``multiprocessing.pool.Pool`` of ``integration_workers``
+        processes shared by the files of the run (see
+        ``PreviewImage.pool``). If ``None``, a pool is started for
+        each file with several integrations.
+
+    Returns
+    -------
+    status : str
+        ``skipped`` if the preview images already exist, ``failed`` if
+        they could not be created, and ``rendered`` otherwise
+    """
+
+    filename = file_list[0]
+    # Determine the save location
+    try:
+        identifier = 'jw{}'.format(filename_parser(filename)['program_id'])
+    except ValueError as error:
+        identifier = os.path.basename(filename).split('.fits')[0]
+
+    preview_output_directory = os.path.join(preview_image_filesystem, identifier)
+    thumbnail_output_directory = os.path.join(thumbnail_filesystem, identifier)
+
+    # Check to see if the preview images already exist and skip
+    # if they do
+    if not overwrite:
+        file_exists = check_existence(file_list, preview_output_directory)
+        if file_exists:
+            logging.info("JPG already exists for {}, skipping.".format(filename))
+            return 'skipped'
+
+    # Create the output directories if necessary
+    if not os.path.exists(preview_output_directory):
+        os.makedirs(preview_output_directory, exist_ok=True)
+        permissions.set_permissions(preview_output_directory)
+        logging.info('Created directory {}'.format(preview_output_directory))
+    if not os.path.exists(thumbnail_output_directory):
+        os.makedirs(thumbnail_output_directory, exist_ok=True)
+        permissions.set_permissions(thumbnail_output_directory)
+        logging.info('Created directory {}'.format(thumbnail_output_directory))
+
+    # If the exposure contains more than one file (because more
+    # than one detector was used), then create a mosaic
+    max_size = 8
+    numfiles = len(file_list)
+    if numfiles != 1:
+        dummy_file = create_dummy_filename(file_list)
+        if numfiles in [2, 4]:
+            max_size = 16
+        elif numfiles in [8]:
+            max_size = 32
+
+        # The mosaic is built and rendered one integration at a time.
+        # The input filename is set to indicate that we have
+        # mosaicked data. Mosaics are too large to be viewed as a
+        # single JPEG, so a tile pyramid is saved alongside.
+        im = PreviewImage(dummy_file, "SCI", read_data=False)
+        for attribute, value in PREVIEW_PARAMETERS.items():
+            setattr(im, attribute, value)
+        im.preview_output_directory = preview_output_directory
+        im.thumbnail_output_directory = thumbnail_output_directory
+        im.tile_output_directory = preview_output_directory
+        im.stats_output_directory = preview_output_directory
+        try:
+            for integration, mosaic_image, mosaic_dq in create_mosaic_stream(file_list):
+                if integration == 0:
+                    logging.info('Created mosiac for:')
+                    for item in file_list:
+                        logging.info('\t{}'.format(item))
+                im.dq = mosaic_dq
+                im.make_integration_image(mosaic_image, integration, max_img_size=max_size)
+            im.save_statistics()
+        except (ValueError, FileNotFoundError) as error:
+            logging.error(error)
+            return 'failed'
+
+        return 'rendered'
+
+    # Create the nominal preview image and thumbnail
+    try:
+        im = PreviewImage(filename, "SCI", read_data=False)
+        for attribute, value in PREVIEW_PARAMETERS.items():
+            setattr(im, attribute, value)
+        im.memory_limit = memory_limit
+        im.data, im.dq = im.get_data(filename, "SCI")
+        im.preview_output_directory = preview_output_directory
+        im.thumbnail_output_directory = thumbnail_output_directory
+        im.stats_output_directory = preview_output_directory
+        im.workers = integration_workers
+        im.pool = integration_pool
+        im.make_image(max_img_size=max_size)
+    except ValueError as error:
+        logging.warning(error)
+        return 'failed'
+
+    return 'rendered'
+
+
+def read_detector_integration(filename, integration):
+    """Read the difference image of a single integration from the
+    ``SCI`` extension of a file. For 4D data, only the first and last
+    group of the integration are read.
+
+    Parameters
+    ----------
+    filename : str
+        Name of fits file containing data
+
+    integration : int
+        Integration number
+
+    Returns
+    -------
+    diff_im : obj
+        2D ``float32`` ``numpy`` array
+    """
+
+    with fits.open(filename) as hdulist:
+        hdu = hdulist['SCI']
+        dimensions = hdu.header['NAXIS']
+        if dimensions == 4:
+            ngroup = hdu.shape[1]
+            first = hdu.section[integration, 0].astype(np.float32)
+            diff_im = hdu.section[integration, ngroup - 1].astype(np.float32)
+            diff_im -= first
+        elif dimensions == 3:
+            diff_im = hdu.section[integration].astype(np.float32)
+        else:
+            diff_im = hdu.data.astype(np.float32)
+
+    return diff_im
+
+
 if __name__ == '__main__':
 
     module = os.path.basename(__file__).strip('.py')
+    parser = define_options()
+    args = parser.parse_args()
+
     configure_logging(module)
 
-    generate_preview_images()
+    generate_preview_images(workers=args.workers, force=args.force,
+                            integration_workers=args.integration_workers,
+                            coordinate=args.coordinate, lease_duration=args.lease_duration,
+                            memory_limit=args.memory_limit)
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+
+"""Bring the filesystem index up to date.
+
+The web app lists the files of the ``jwql`` filesystem and of the
+preview image and thumbnail stores from a persistent index (see
+``jwql.utils.filesystem_index``) rather than by globbing the stores.
+The web app updates the index itself when it is older than the
+``filesystem_index_max_age`` entry of the config file (60 seconds by
+default), but the first update of a large store takes a while. This
+script performs that update ahead of time, e.g. from a cron job, so
+that requests find the index current.
+
+Only the proposal directories that have changed since the last update
+are listed again, unless ``--full`` is given. With ``--headers``, the
+header keywords of the new or changed FITS files are also read into the
+header cache (see ``jwql.utils.header_cache``), so that the web app
+does not need to open them.
+
+Use
+---
+
+    This script is intended to be executed as such:
+
+    ::
+
+        python index_filesystem.py
+
+    To list every directory again, e.g. after the index was lost:
+
+    ::
+
+        python index_filesystem.py --full
+
+    To also fill the header cache:
+
+    ::
+
+        python index_filesystem.py --headers
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from jwql.utils.filesystem_index import FilesystemIndex, get_index_filename
+from jwql.utils.header_cache import HeaderCache, get_header_cache_filename
+from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.utils import get_config
+
+
+def define_options():
+    """Create the command line parser for the ``index_filesystem``
+    script.
+
+    Returns
+    -------
+    parser : obj
+        ``argparse.ArgumentParser`` object
+    """
+
+    parser = argparse.ArgumentParser(description='Bring the index of the jwql filesystem and '
+                                                 'image stores up to date.')
+    parser.add_argument('--full', action='store_true',
+                        help='List every directory again, not only those that have changed')
+    parser.add_argument('--headers', action='store_true',
+                        help='Read the header keywords of new and changed FITS files into the '
+                             'header cache')
+
+    return parser
+
+
+@log_fail
+@log_info
+def index_filesystem(full=False, headers=False):
+    """The main function of the ``index_filesystem`` module. Update the
+    index of each store served by the web app.
+
+    Parameters
+    ----------
+    full : bool
+        If ``True``, list every directory again
+    headers : bool
+        If ``True``, fill the header cache with the keywords of the
+        FITS files of the filesystem
+    """
+
+    # The directories from which the web app serves the files
+    jwql_dir = get_config()['jwql_dir']
+    index = FilesystemIndex(get_index_filename())
+    for store in ['filesystem', 'preview_images', 'thumbnails']:
+        start = time.time()
+        added, removed = index.update(store, os.path.join(jwql_dir, store), full=full)
+        logging.info('Indexed {}: {} files added, {} removed in {:.1f} s'.format(
+            store, added, removed, time.time() - start))
+
+    if headers:
+        start = time.time()
+        filepaths = index.query('filesystem', extension='fits')
+        HeaderCache(get_header_cache_filename()).keywords(filepaths)
+        logging.info('Cached the header keywords of {} files in {:.1f} s'.format(
+            len(filepaths), time.time() - start))
+
+
+if __name__ == '__main__':
+
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    parser = define_options()
+    args = parser.parse_args()
+
+    configure_logging(module)
+
+    index_filesystem(full=args.full, headers=args.headers)
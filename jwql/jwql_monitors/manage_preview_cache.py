@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+
+"""Report the disk usage of the preview image and thumbnail stores,
+and keep them within a size budget.
+
+The ``usage`` command reports the size of the stores per proposal and
+per instrument. The ``evict`` command removes the images of the least
+recently viewed exposures until the stores fit within the budget (see
+``jwql.utils.preview_cache`` for the exposures that are pinned). The
+budget is given with ``--budget``, or as ``preview_cache_budget`` in
+the config file (e.g. ``"500G"``).
+
+Use
+---
+
+    This script is intended to be executed as such:
+
+    ::
+
+        python manage_preview_cache.py usage
+        python manage_preview_cache.py evict --budget 500G --pin-days 30
+
+    To list the exposures that would be evicted without removing them:
+
+    ::
+
+        python manage_preview_cache.py evict --budget 500G --dry-run
+"""
+
+import argparse
+from collections import OrderedDict
+import logging
+import os
+
+from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.preview_cache import PreviewCache, evict, get_cache_filename, scan_stores, \
+    select_evictions
+from jwql.utils.utils import format_size, get_config, parse_size
+
+
+def define_options():
+    """Create the command line parser for the ``manage_preview_cache``
+    script.
+
+    Returns
+    -------
+    parser : obj
+        ``argparse.ArgumentParser`` object
+    """
+
+    parser = argparse.ArgumentParser(description='Report the usage of the preview image and '
+                                                 'thumbnail stores, and evict images to keep '
+                                                 'them within a budget.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    subparsers.add_parser('usage', help='Report the disk usage per proposal and instrument')
+
+    evict_parser = subparsers.add_parser('evict', help='Evict the least recently viewed images')
+    evict_parser.add_argument('--budget',
+                              help='Largest total size of the stores, e.g. 500G (default: the '
+                                   'preview_cache_budget entry of the config file)')
+    evict_parser.add_argument('--pin-days', type=float, default=30.,
+                              help='Never evict images created or viewed within this many days '
+                                   '(default: 30)')
+    evict_parser.add_argument('--dry-run', action='store_true',
+                              help='List the exposures to evict without removing them')
+
+    return parser
+
+
+@log_fail
+@log_info
+def evict_previews(budget=None, pin_days=30., dry_run=False):
+    """Evict the images of the least recently viewed exposures until
+    the stores fit within the budget.
+
+    Parameters
+    ----------
+    budget : str
+        Largest total size of the stores, e.g. ``500G``. Defaults to
+        the ``preview_cache_budget`` entry of the config file.
+    pin_days : float
+        Number of days during which new or viewed images are pinned
+    dry_run : bool
+        If ``True``, only log the exposures that would be evicted
+    """
+
+    if budget is None:
+        budget = get_config().get('preview_cache_budget')
+        if budget is None:
+            raise ValueError('No budget given, and no preview_cache_budget in the config file')
+    budget = parse_size(budget)
+
+    exposures = scan_stores(get_store_directories())
+    last_access = PreviewCache(get_cache_filename()).last_access()
+    evictions, remaining = select_evictions(exposures, last_access, budget, pin_days)
+
+    total = sum(exposure['size'] for exposure in exposures.values())
+    logging.info('The stores hold {} in {} exposures, the budget is {}'.format(
+        format_size(total), len(exposures), format_size(budget)))
+
+    for key in evictions:
+        logging.info('{} {} ({})'.format('Would evict' if dry_run else 'Evicting', key,
+                                         format_size(exposures[key]['size']
+                                                     - exposures[key]['pinned_size'])))
+    if not dry_run:
+        evict(exposures, evictions)
+
+    logging.info('{} {} exposures, {} remaining'.format(
+        'Would evict' if dry_run else 'Evicted', len(evictions), format_size(remaining)))
+    if remaining > budget:
+        logging.warning('The pinned images alone exceed the budget by {}'.format(
+            format_size(remaining - budget)))
+
+
+def get_store_directories():
+    """Return the top-level directories of the preview image and
+    thumbnail stores.
+
+    Returns
+    -------
+    directories : list
+        The ``preview_image_filesystem`` and ``thumbnail_filesystem``
+    """
+
+    settings = get_config()
+
+    return [settings['preview_image_filesystem'], settings['thumbnail_filesystem']]
+
+
+def report_usage():
+    """Print the disk usage of the stores per proposal and per
+    instrument."""
+
+    exposures = scan_stores(get_store_directories())
+    for category in ['proposal', 'instrument']:
+        usage = OrderedDict()
+        for exposure in exposures.values():
+            row = usage.setdefault(exposure[category], [0, 0, 0])
+            row[0] += 1
+            row[1] += exposure['files']
+            row[2] += exposure['size']
+
+        print('\n{:<12} {:>10} {:>10} {:>12}'.format(category, 'exposures', 'files', 'size'))
+        for name, (count, files, size) in sorted(usage.items(), key=lambda item: -item[1][2]):
+            print('{:<12} {:>10} {:>10} {:>12}'.format(name, count, files, format_size(size)))
+
+    print('\n{:<12} {:>10} {:>10} {:>12}'.format(
+        'total', len(exposures), sum(exposure['files'] for exposure in exposures.values()),
+        format_size(sum(exposure['size'] for exposure in exposures.values()))))
+
+
+if __name__ == '__main__':
+
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    parser = define_options()
+    args = parser.parse_args()
+
+    if args.command == 'usage':
+        report_usage()
+    else:
+        configure_logging(module)
+        evict_previews(budget=args.budget, pin_days=args.pin_days, dry_run=args.dry_run)
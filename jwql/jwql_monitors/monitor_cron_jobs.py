@@ -4,6 +4,10 @@
 log files. Basic results (e.g. ``success``, ``failure``) are collected
 and placed in a ``bokeh`` table for display on the web app.
 
+The table is shown on the dashboard of the web app, which only reads
+it, so this module must be run as a scheduled job (e.g. a cron job
+every 15 minutes) to keep the table current.
+
 Authors
 -------
 
@@ -12,7 +16,14 @@ Authors
 Use
 ---
 
-    This module can be executed as such:
+    This module can be executed from the command line, e.g. from a
+    cron job:
+
+    ::
+
+        python monitor_cron_jobs.py
+
+    or imported and run as such:
 
     ::
 
@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+
+"""Render the preview images requested by the web app.
+
+When the image view page of the web app is opened for a file root
+whose preview images do not exist yet (or that is to be rewritten),
+the web app submits a job to the preview job queue (see
+``jwql.utils.preview_jobs``) instead of rendering the images inside
+the request. This script takes the jobs from the queue one at a time
+and renders them. Several instances of the script may be run side by
+side to render jobs in parallel.
+
+Use
+---
+
+    This script is intended to be executed as such:
+
+    ::
+
+        python process_preview_jobs.py
+
+    To render the jobs that are currently queued and then exit:
+
+    ::
+
+        python process_preview_jobs.py --once
+"""
+
+import argparse
+from glob import glob
+import logging
+import os
+import time
+
+from jwql.jwql_monitors.generate_preview_images import _process_group_safely
+from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.preview_jobs import PreviewJobQueue, get_job_queue_filename
+from jwql.utils.utils import get_config
+
+
+def define_options():
+    """Create the command line parser for the ``process_preview_jobs``
+    script.
+
+    Returns
+    -------
+    parser : obj
+        ``argparse.ArgumentParser`` object
+    """
+
+    parser = argparse.ArgumentParser(description='Render the preview images requested by the '
+                                                 'web app.')
+    parser.add_argument('--once', action='store_true',
+                        help='Exit once no job is queued, instead of waiting for new jobs')
+    parser.add_argument('--poll-interval', type=float, default=1.,
+                        help='Seconds to wait between checks of an empty queue (default: 1)')
+
+    return parser
+
+
+@log_fail
+@log_info
+def process_preview_jobs(once=False, poll_interval=1.):
+    """The main function of the ``process_preview_jobs`` module. Take
+    jobs from the queue and render them until interrupted.
+
+    Parameters
+    ----------
+    once : bool
+        If ``True``, return once the queue is empty
+    poll_interval : float
+        Number of seconds to wait between checks of an empty queue
+    """
+
+    # The directories from which the web app serves the images
+    jwql_dir = get_config()['jwql_dir']
+    filesystem = os.path.join(jwql_dir, 'filesystem')
+    preview_image_filesystem = os.path.join(jwql_dir, 'preview_images')
+    thumbnail_filesystem = os.path.join(jwql_dir, 'thumbnails')
+
+    queue = PreviewJobQueue(get_job_queue_filename())
+    while True:
+        job = queue.claim()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        file_root, rewrite = job
+        status, message = render_file_root(file_root, rewrite, filesystem,
+                                           preview_image_filesystem, thumbnail_filesystem)
+        queue.finish(file_root, status, message)
+        logging.info('Job {}: {} ({})'.format(file_root, status, message))
+
+
+def render_file_root(file_root, rewrite, filesystem, preview_image_filesystem,
+                     thumbnail_filesystem):
+    """Create the preview images and thumbnails of every file of a
+    file root.
+
+    Parameters
+    ----------
+    file_root : str
+        The file root, e.g. ``jw00327001001_02101_00001_nrca1``
+    rewrite : bool
+        If ``True``, create the images even if they already exist
+    filesystem : str
+        Top-level directory of the FITS files
+    preview_image_filesystem : str
+        Top-level directory of the preview images
+    thumbnail_filesystem : str
+        Top-level directory of the thumbnail images
+
+    Returns
+    -------
+    status : str
+        ``failed`` if no file was found or the images of any file
+        could not be created, and ``done`` otherwise
+    message : str
+        Description of the outcome
+    """
+
+    filenames = sorted(glob(os.path.join(filesystem, file_root[:7], file_root + '*.fits')))
+    if len(filenames) == 0:
+        return 'failed', 'No files found for {}'.format(file_root)
+
+    failed = []
+    for filename in filenames:
+        status = _process_group_safely([filename], preview_image_filesystem,
+                                       thumbnail_filesystem, overwrite=rewrite)
+        if status == 'failed':
+            failed.append(os.path.basename(filename))
+
+    if len(failed) > 0:
+        return 'failed', 'Could not create the preview images of {}'.format(', '.join(failed))
+
+    return 'done', 'Created the preview images of {} file(s)'.format(len(filenames))
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    parser = define_options()
+    args = parser.parse_args()
+
+    configure_logging(module)
+
+    process_preview_jobs(once=args.once, poll_interval=args.poll_interval)
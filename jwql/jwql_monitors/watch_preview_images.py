@@ -0,0 +1,585 @@
+#! /usr/bin/env python
+
+"""Watch the ``jwql`` filesystem and create preview images as files
+arrive.
+
+``generate_preview_images`` is run periodically over the whole
+filesystem, so new data can wait up to a full period before preview
+images are available. This module instead runs as a long-lived service
+that watches the ``filesystem`` tree and renders each exposure group
+soon after its files arrive, using the same rendering code and
+manifest as ``generate_preview_images``.
+
+Changes are detected with ``inotify`` on Linux, and by periodically
+scanning the filesystem otherwise (or if ``--poll`` is given, e.g. for
+network filesystems, on which ``inotify`` does not see changes made by
+other hosts). A file is only considered once it has not been modified
+for ``--settle-time`` seconds, so that partially written files are not
+read. NIRCam exposure groups are held until all detectors that the
+exposure uses have arrived, or until no file of the group has changed
+for ``--group-timeout`` seconds. The detectors that an exposure uses
+are taken from the earlier exposures of the same activity (e.g. the
+other dithers), which share its instrument configuration; the first
+exposure of an activity waits for all detectors of its channel (or the
+timeout, e.g. if it uses a single module). Complete groups are rendered
+by a pool of worker processes; at most ``--max-pending`` groups are
+handed to the pool at a time, and the remaining groups wait until a
+worker becomes available.
+
+Use
+---
+
+    This script is intended to be executed as such:
+
+    ::
+
+        python watch_preview_images.py --workers 4
+
+    To scan the filesystem every 30 seconds instead of using
+    ``inotify``:
+
+    ::
+
+        python watch_preview_images.py --poll --poll-interval 30
+"""
+
+import argparse
+from collections import OrderedDict
+import ctypes
+import ctypes.util
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import struct
+import time
+
+from jwql.jwql_monitors.generate_preview_images import PREVIEW_PARAMETERS, _initialize_worker, \
+    _process_group_in_worker, exposure_group_key
+from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
+from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.preview_manifest import PreviewManifest, get_manifest_filename
+from jwql.utils.utils import filename_parser, get_config
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class _Inotify(object):
+    """Minimal interface to the Linux ``inotify`` API through
+    ``ctypes``.
+    """
+
+    def __init__(self):
+        library = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.watches = {}
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """Watch the directory ``path`` for the events in ``mask``."""
+
+        descriptor = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.watches[descriptor] = path
+
+    def close(self):
+        """Stop watching and release the file descriptor."""
+
+        os.close(self.fd)
+
+    def read(self, timeout):
+        """Wait up to ``timeout`` seconds for events, and return them
+        as a list of ``(directory, mask, name)`` tuples.
+        """
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            descriptor, mask, _, length = struct.unpack_from('iIII', buffer, offset)
+            name = buffer[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            events.append((self.watches.get(descriptor), mask, os.fsdecode(name)))
+
+        return events
+
+
+class PreviewWatcher(object):
+    """Render the preview images of exposure groups as their files
+    arrive in the filesystem.
+
+    Attributes
+    ----------
+    activity_detectors : dict
+        Detectors used by the exposure groups of each activity that
+        have been handed to the worker pool, keyed by the output of
+        ``activity_key``
+    groups : dict
+        Paths of the known files of each exposure group that may still
+        receive files, keyed by the output of ``exposure_group_key``
+    in_flight : list
+        ``(key, file_list, signatures, result)`` tuples of the groups
+        handed to the worker pool
+    pending : OrderedDict
+        Keys of the groups with new or changed files, in the order in
+        which they changed
+    signatures : dict
+        Last seen ``(size, mtime)`` of each file of the pending groups.
+        The files of a group are forgotten once it is handed to the
+        worker pool or found to be up to date.
+
+    Methods
+    -------
+    check_pending(now)
+        Hand the pending groups that are ready to the worker pool
+    collect_results()
+        Record the results of the groups that have been rendered
+    observe(path)
+        Take note of a new or changed file
+    run(duration)
+        Watch the filesystem
+    scan(directory)
+        Observe all files in the filesystem or in one directory
+    stop()
+        Stop watching after the current iteration
+    """
+
+    def __init__(self, filesystem, preview_image_filesystem, thumbnail_filesystem,
+                 workers=1, max_pending=None, settle_time=30., group_timeout=600.,
+                 poll=False, poll_interval=60., manifest_filename=None):
+        """Initialize the watcher.
+
+        Parameters
+        ----------
+        filesystem : str
+            Top-level directory of the FITS files
+        preview_image_filesystem : str
+            Top-level directory of the preview images
+        thumbnail_filesystem : str
+            Top-level directory of the thumbnail images
+        workers : int
+            Number of worker processes
+        max_pending : int
+            Largest number of groups handed to the worker pool at a
+            time. Defaults to twice the number of workers.
+        settle_time : float
+            Number of seconds a file must be left unmodified before it
+            is read
+        group_timeout : float
+            Number of seconds after which an incomplete NIRCam group is
+            rendered if none of its files changed
+        poll : bool
+            If ``True``, scan the filesystem periodically instead of
+            using ``inotify``
+        poll_interval : float
+            Number of seconds between scans when polling
+        manifest_filename : str
+            Path of the preview image manifest. Defaults to the output
+            of ``get_manifest_filename``.
+        """
+
+        self.filesystem = filesystem
+        self.preview_image_filesystem = preview_image_filesystem
+        self.thumbnail_filesystem = thumbnail_filesystem
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.settle_time = settle_time
+        self.group_timeout = group_timeout
+        self.poll_interval = poll_interval
+
+        self.manifest = PreviewManifest(manifest_filename or get_manifest_filename())
+        self.activity_detectors = {}
+        self.groups = {}
+        self.in_flight = []
+        self.pending = OrderedDict()
+        self.signatures = {}
+        self._stopped = False
+
+        self.inotify = None
+        if not poll:
+            try:
+                self.inotify = _Inotify()
+                self.inotify.add_watch(filesystem)
+            except OSError as error:
+                logging.warning('Cannot use inotify ({}), polling every {} seconds instead'.format(
+                    error, poll_interval))
+                self.inotify = None
+
+    def check_pending(self, now):
+        """Hand the pending groups that are ready to the worker pool,
+        as long as fewer than ``max_pending`` groups are in flight. A
+        group is ready if none of its files changed within the last
+        ``settle_time`` seconds, and it is either complete or none of
+        its files changed within the last ``group_timeout`` seconds.
+
+        The manifest entries of the pending groups are read again on
+        every call, since other processes (e.g.
+        ``generate_preview_images``) may have rendered them.
+
+        Parameters
+        ----------
+        now : float
+            The current time
+        """
+
+        in_flight_keys = set(item[0] for item in self.in_flight)
+        waiting = [key for key in self.pending if key not in in_flight_keys]
+        entries = self.manifest.entries([filename for key in waiting
+                                         for filename in self.groups.get(key, [])])
+        for key in waiting:
+            if len(self.in_flight) >= self.max_pending:
+                break
+
+            # Files of the group that were forgotten when it was last
+            # submitted are observed again
+            file_list = sorted(self.groups.get(key, []))
+            for filename in file_list:
+                if filename not in self.signatures:
+                    self.observe(filename)
+            file_list = sorted(self.groups.get(key, []))
+            signatures = {filename: self.signatures[filename] for filename in file_list}
+            if len(file_list) == 0 or self.manifest.is_current(signatures, PREVIEW_PARAMETERS,
+                                                               entries):
+                del self.pending[key]
+                self._forget(key, file_list)
+                continue
+
+            # Make sure that none of the files is still being written
+            stable = True
+            for filename in file_list:
+                self.observe(filename)
+                if self.signatures.get(filename) != signatures[filename]:
+                    stable = False
+                elif now - signatures[filename][1] < self.settle_time:
+                    stable = False
+            if not stable:
+                continue
+
+            newest = max(mtime for size, mtime in signatures.values())
+            expected = self.activity_detectors.get(activity_key(key))
+            if not is_complete_group(file_list, expected) and now - newest < self.group_timeout:
+                continue
+
+            # Files not in the manifest may have images from before
+            # the manifest existed, which process_file_group adopts
+            known = any(filename in entries for filename in file_list)
+            task = (file_list, self.preview_image_filesystem, self.thumbnail_filesystem, known)
+            # The watcher does not coordinate with other hosts, so the
+            # group is rendered without claiming a lease
+            result = self.pool.apply_async(_process_group_in_worker, ((task, None),))
+            self.in_flight.append((key, file_list, signatures, result))
+            del self.pending[key]
+            self.activity_detectors[activity_key(key)] = group_detectors(file_list)
+            self._forget(key, file_list)
+
+    def collect_results(self):
+        """Log the output of the groups that have been rendered, and
+        record them in the manifest unless they failed.
+        """
+
+        for item in list(self.in_flight):
+            key, file_list, signatures, result = item
+            if not result.ready():
+                continue
+            self.in_flight.remove(item)
+
+            try:
+                status, records = result.get()
+            except Exception:
+                logging.exception('Failed to create preview images for {}'.format(file_list[0]))
+                continue
+            for record in records:
+                logging.getLogger().handle(record)
+
+            logging.info('Exposure group {}: {}'.format(file_list[0], status))
+            if status != 'failed':
+                self.manifest.record(signatures, PREVIEW_PARAMETERS)
+
+    def observe(self, path):
+        """Take note of a new or changed file, and mark its exposure
+        group as pending.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file
+        """
+
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            self.signatures.pop(path, None)
+            for files in self.groups.values():
+                files.discard(path)
+            return
+
+        signature = (status.st_size, status.st_mtime)
+        if self.signatures.get(path) == signature:
+            return
+        try:
+            key, canonical = exposure_group_key(path)
+        except ValueError:
+            return
+        if not canonical:
+            return
+
+        self.signatures[path] = signature
+        self.groups.setdefault(key, set()).add(path)
+        self.pending[key] = True
+
+    def run(self, duration=None):
+        """Watch the filesystem until ``stop`` is called (e.g. on
+        ``SIGTERM``), or for ``duration`` seconds.
+
+        Parameters
+        ----------
+        duration : float
+            Number of seconds to watch for. Watch indefinitely if
+            ``None``.
+        """
+
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(processes=self.workers, initializer=_initialize_worker)
+        start = time.time()
+        try:
+            self.scan()
+            last_scan = time.time()
+            while not self._stopped and (duration is None or time.time() - start < duration):
+                if self.inotify is not None:
+                    self._read_events(timeout=1.)
+                else:
+                    time.sleep(1.)
+                    if time.time() - last_scan >= self.poll_interval:
+                        self.scan()
+                        last_scan = time.time()
+                self.collect_results()
+                self.check_pending(time.time())
+        finally:
+            # Let the groups in flight finish
+            self.pool.close()
+            self.pool.join()
+            self.collect_results()
+            if self.inotify is not None:
+                self.inotify.close()
+
+    def scan(self, directory=None):
+        """Observe all FITS files in the proposal directories of the
+        filesystem, or in a single proposal directory.
+
+        Parameters
+        ----------
+        directory : str
+            Proposal directory to scan. The whole filesystem is scanned
+            if ``None``.
+        """
+
+        if directory is None:
+            directories = sorted(entry.path for entry in os.scandir(self.filesystem)
+                                 if entry.is_dir())
+        else:
+            directories = [directory]
+
+        for proposal_directory in directories:
+            if self.inotify is not None and proposal_directory not in self.inotify.watches.values():
+                self.inotify.add_watch(proposal_directory)
+            for entry in sorted(os.scandir(proposal_directory), key=lambda entry: entry.name):
+                if entry.name.endswith('.fits') and entry.is_file():
+                    self.observe(entry.path)
+
+    def _forget(self, key, file_list):
+        """Forget the signatures of the files of a group that has been
+        submitted or is up to date, and the group itself if no more
+        files are expected for it, so that the watcher does not keep
+        every file of the filesystem in memory.
+
+        Parameters
+        ----------
+        key : tuple
+            The key of the group
+        file_list : list
+            The files of the group
+        """
+
+        for filename in file_list:
+            self.signatures.pop(filename, None)
+        expected = self.activity_detectors.get(activity_key(key))
+        if len(file_list) == 0 or is_complete_group(file_list, expected):
+            self.groups.pop(key, None)
+
+    def stop(self, *args):
+        """Stop watching after the current iteration. The arguments
+        are ignored, so that this can be used as a signal handler.
+        """
+
+        self._stopped = True
+
+    def _read_events(self, timeout):
+        """Observe the files reported by ``inotify``, and start
+        watching new proposal directories.
+        """
+
+        for directory, mask, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                logging.warning('inotify event queue overflowed, rescanning the filesystem')
+                self.scan()
+            elif directory is None:
+                continue
+            elif mask & IN_ISDIR:
+                if directory == self.filesystem:
+                    self.scan(os.path.join(directory, name))
+            elif name.endswith('.fits') and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.observe(os.path.join(directory, name))
+
+
+def activity_key(key):
+    """Return the key shared by the exposure groups of an activity,
+    i.e. by exposures taken with the same instrument configuration.
+
+    Parameters
+    ----------
+    key : tuple
+        The key of an exposure group, as returned by
+        ``exposure_group_key``
+
+    Returns
+    -------
+    activity : tuple
+        The directory, the part of the exposure name up to the
+        activity (e.g. ``jw00327001001_02101``), and the channel or
+        detector
+    """
+
+    return key[0], key[1].split('_')[0] + '_' + key[1].split('_')[1], key[2]
+
+
+def define_options():
+    """Create the command line parser for the ``watch_preview_images``
+    script.
+
+    Returns
+    -------
+    parser : obj
+        ``argparse.ArgumentParser`` object
+    """
+
+    parser = argparse.ArgumentParser(description='Watch the jwql filesystem and create preview '
+                                                 'images and thumbnails as files arrive.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes used to render the exposure groups')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='Largest number of groups handed to the workers at a time '
+                             '(default: twice the number of workers)')
+    parser.add_argument('--settle-time', type=float, default=30.,
+                        help='Seconds a file must be left unmodified before it is read '
+                             '(default: 30)')
+    parser.add_argument('--group-timeout', type=float, default=600.,
+                        help='Seconds after which an incomplete NIRCam group is rendered '
+                             '(default: 600)')
+    parser.add_argument('--poll', action='store_true',
+                        help='Scan the filesystem periodically instead of using inotify')
+    parser.add_argument('--poll-interval', type=float, default=60.,
+                        help='Seconds between scans when polling (default: 60)')
+
+    return parser
+
+
+def group_detectors(file_list):
+    """Return the detectors of the files of an exposure group.
+
+    Parameters
+    ----------
+    file_list : list
+        The files of the exposure group
+
+    Returns
+    -------
+    detectors : set
+        Uppercase detector names, e.g. ``NRCA1``
+    """
+
+    return set(filename_parser(filename)['detector'].upper() for filename in file_list)
+
+
+def is_complete_group(file_list, expected=None):
+    """Determine whether all files of an exposure group have arrived.
+    NIRCam groups are complete once all detectors that the exposure
+    uses are present; groups of other instruments contain a single file
+    and are always complete.
+
+    Parameters
+    ----------
+    file_list : list
+        The files of the exposure group
+    expected : set
+        The detectors that the exposure uses, e.g. those of an earlier
+        exposure of the same activity. If ``None``, all detectors of
+        the channel are expected.
+
+    Returns
+    -------
+    complete : bool
+        ``True`` if no more files are expected
+    """
+
+    detectors = group_detectors(file_list)
+    for channel in [NIRCAM_SHORTWAVE_DETECTORS, NIRCAM_LONGWAVE_DETECTORS]:
+        if detectors & set(channel):
+            if expected is not None and expected & set(channel):
+                return detectors >= expected & set(channel)
+            return detectors >= set(channel)
+
+    return True
+
+
+@log_fail
+@log_info
+def watch_preview_images(workers=1, max_pending=None, settle_time=30., group_timeout=600.,
+                         poll=False, poll_interval=60.):
+    """The main function of the ``watch_preview_images`` module. See
+    ``PreviewWatcher`` for a description of the parameters.
+    """
+
+    logging.info('Watching the filesystem for new files')
+    watcher = PreviewWatcher(get_config()['filesystem'],
+                             get_config()['preview_image_filesystem'],
+                             get_config()['thumbnail_filesystem'],
+                             workers=workers, max_pending=max_pending, settle_time=settle_time,
+                             group_timeout=group_timeout, poll=poll, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run()
+    logging.info('Stopped watching the filesystem')
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    parser = define_options()
+    args = parser.parse_args()
+
+    configure_logging(module)
+
+    watch_preview_images(workers=args.workers, max_pending=args.max_pending,
+                         settle_time=args.settle_time, group_timeout=args.group_timeout,
+                         poll=args.poll, poll_interval=args.poll_interval)
@@ -19,11 +19,17 @@ Use
 """
 
 import json
+import os
 import pytest
 import urllib.request
 
+import django
+from django.test import RequestFactory
+
 from jwql.utils.utils import get_base_url
 from jwql.utils.constants import JWST_INSTRUMENT_NAMES
+from jwql.website.apps.jwql.api_views import _decode_cursor, _encode_cursor, _list_response, \
+    paginate, paginate_query, select_fields, stream_json
 
 urls = []
 
@@ -59,6 +65,17 @@ for rootname in rootnames:
     urls.append('api/{}/thumbnails/'.format(rootname))  # thumbnails_by_rootname
 
 
+@pytest.fixture(scope='module')
+def request_factory():
+    """Return a ``RequestFactory`` using the settings of the ``jwql``
+    Django project."""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jwql.website.jwql_proj.settings')
+    django.setup()
+
+    return RequestFactory()
+
+
 @pytest.mark.xfail
 @pytest.mark.parametrize('url', urls)
 def test_api_views(url):
@@ -83,3 +100,133 @@ def test_api_views(url):
     data = json.loads(url.read().decode())
 
     assert len(data[data_type]) > 0
+
+
+def test_paginate():
+    """Make sure that walking the pages by cursor returns every item
+    once, in sorted order."""
+
+    items = ['jw{:05d}001001_02101_00001_nrca1_rate.fits'.format(i) for i in range(25, 0, -1)]
+    pages = []
+    cursor = None
+    while True:
+        page, next_cursor = paginate(items, limit=10, cursor=cursor)
+        pages.append(page)
+        if next_cursor is None:
+            break
+        cursor = _decode_cursor(next_cursor)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == sorted(items)
+    assert paginate(items) == (sorted(items), None)
+
+
+def test_paginate_query(request_factory):
+    """Make sure that pages of a listing of the filesystem index are
+    read one at a time, and that walking them returns every file once.
+
+    Parameters
+    ----------
+    request_factory : obj
+        ``django.test.RequestFactory`` object
+    """
+
+    filepaths = ['/jwql/filesystem/jw{0:05d}/jw{0:05d}001001_02101_00001_nrca1_rate.fits'.format(i)
+                 for i in range(1, 26)]
+    calls = []
+
+    def query(after, limit):
+        calls.append((after, limit))
+        items = [item for item in filepaths if after is None or os.path.basename(item) > after]
+        return items[:limit]
+
+    pages = []
+    cursor = None
+    while True:
+        page, next_cursor = paginate_query(query, limit=10, cursor=cursor)
+        pages.append(page)
+        if next_cursor is None:
+            break
+        cursor = _decode_cursor(next_cursor)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == filepaths
+    assert [limit for after, limit in calls] == [11, 11, 11]
+    assert calls[1][0] == os.path.basename(filepaths[9])
+    assert paginate_query(query) == (filepaths, None)
+
+    # Without a page, the whole listing is returned
+    response = _list_response(request_factory.get('/api/nircam/thumbnails/'), 'thumbnails', query)
+    assert json.loads(response.content.decode())['thumbnails'] == filepaths
+    response = _list_response(request_factory.get('/api/nircam/thumbnails/', {'limit': '20'}),
+                              'thumbnails', query)
+    content = json.loads(response.content.decode())
+    assert content['thumbnails'] == filepaths[:20]
+    assert _decode_cursor(content['next_cursor']) == os.path.basename(filepaths[19])
+
+
+@pytest.mark.parametrize('query, files', [({'limit': '0'}, True),
+                                          ({'limit': 'ten'}, True),
+                                          ({'cursor': '%%%'}, True),
+                                          ({'cursor': _encode_cursor('x')[:-1] + '\u00e9'}, True),
+                                          ({'fields': 'filename,size'}, True),
+                                          ({'fields': 'filename'}, False)])
+def test_list_response_bad_request(request_factory, query, files):
+    """Make sure invalid query parameters are answered with a 400
+    error: a limit that is not a positive integer, a cursor that cannot
+    be decoded, unknown fields, and fields of lists that are not files.
+
+    Parameters
+    ----------
+    request_factory : obj
+        ``django.test.RequestFactory`` object
+    query : dict
+        The query parameters of the request
+    files : bool
+        Whether the items of the list are files
+    """
+
+    request = request_factory.get('/api/proposals/', query)
+    response = _list_response(request, 'items', ['jw00327001001_02101_00001_nrca1_rate.fits'],
+                              files=files)
+    assert response.status_code == 400
+    assert 'error' in json.loads(response.content.decode())
+
+
+def test_list_response_stream(request_factory):
+    """Make sure streamed pages are the same JSON as regular ones.
+
+    Parameters
+    ----------
+    request_factory : obj
+        ``django.test.RequestFactory`` object
+    """
+
+    items = ['jw{:05d}001001_02101_00001_nrca1_rate.fits'.format(i) for i in range(2500)]
+    query = {'limit': '2000', 'fields': 'filename,suffix'}
+    regular = _list_response(request_factory.get('/api/filenames/', query), 'filenames', items)
+    query['stream'] = 'true'
+    streamed = _list_response(request_factory.get('/api/filenames/', query), 'filenames', items)
+
+    assert streamed.streaming
+    assert streamed['Content-Type'] == 'application/json'
+    content = json.loads(b''.join(streamed.streaming_content).decode())
+    assert content == json.loads(regular.content.decode())
+    assert len(content['filenames']) == 2000
+    assert content['filenames'][0] == {'filename': items[0], 'suffix': 'rate'}
+    assert _decode_cursor(content['next_cursor']) == items[1999]
+
+
+def test_select_fields_and_stream_json():
+    """Make sure selected fields are returned for each file, and that
+    streamed responses are the same JSON as regular ones."""
+
+    filepaths = ['/jwql/filesystem/jw00327/jw00327001001_02101_{:05d}_nrca1_rate.fits'.format(i)
+                 for i in range(2500)]
+    selected = select_fields(filepaths[:1], ['filename', 'suffix'])
+    assert selected == [{'filename': 'jw00327001001_02101_00000_nrca1_rate.fits',
+                         'suffix': 'rate'}]
+
+    response = {'next_cursor': None, 'filenames': filepaths}
+    assert json.loads(''.join(stream_json(response, 'filenames'))) == response
+    assert json.loads(''.join(stream_json({'filenames': []}, 'filenames'))) == {'filenames': []}
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""Tests for the ``conditional`` module in the ``jwql`` web
+application, through the views it decorates.
+
+Use
+---
+
+    These tests can be run via the command line (omit the -s to
+    suppress verbose output to stdout):
+
+    ::
+
+        pytest -s test_conditional.py
+"""
+
+import json
+import os
+import time
+
+import django
+from django.test import RequestFactory
+import pytest
+
+
+@pytest.fixture(scope='module')
+def request_factory():
+    """Return a ``RequestFactory`` using the settings of the ``jwql``
+    Django project."""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jwql.website.jwql_proj.settings')
+    django.setup()
+
+    return RequestFactory()
+
+
+def test_listing_condition(request_factory, monkeypatch):
+    """Make sure a listing is answered with a 304 when the client
+    already has its version, and built again once the version changes.
+    """
+
+    from jwql.website.apps.jwql import api_views, conditional
+
+    versions = {'version': ('filesystem:1', 1500000000.)}
+    calls = []
+
+    def get_all_proposals():
+        calls.append(1)
+        return ['86700', '98012']
+
+    monkeypatch.setattr(conditional, 'get_listing_version',
+                        lambda stores, **kwargs: versions['version'])
+    monkeypatch.setattr(api_views, 'get_all_proposals', get_all_proposals)
+
+    response = api_views.all_proposals(request_factory.get('/api/proposals/'))
+    assert response.status_code == 200
+    assert json.loads(response.content.decode('utf-8'))['proposals'] == ['86700', '98012']
+    etag = response['ETag']
+    last_modified = response['Last-Modified']
+    assert etag.startswith('W/"')
+
+    # The client has the current version
+    response = api_views.all_proposals(
+        request_factory.get('/api/proposals/', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 304
+    response = api_views.all_proposals(
+        request_factory.get('/api/proposals/', HTTP_IF_MODIFIED_SINCE=last_modified))
+    assert response.status_code == 304
+    assert len(calls) == 1
+
+    # The filesystem changed
+    versions['version'] = ('filesystem:2', 1500000100.)
+    response = api_views.all_proposals(
+        request_factory.get('/api/proposals/', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    response = api_views.all_proposals(
+        request_factory.get('/api/proposals/', HTTP_IF_MODIFIED_SINCE=last_modified))
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_file_condition(request_factory, monkeypatch, tmpdir):
+    """Make sure a tile is answered with a 304 when the client already
+    has it, and served again once the file changes."""
+
+    from jwql.website.apps.jwql import views
+
+    tiles = tmpdir.mkdir('jw00327').mkdir('image_files').mkdir('0')
+    tile = tiles.join('0_0.jpg')
+    tile.write_binary(b'tile')
+    os.utime(str(tile), (1500000000., 1500000000.))
+    monkeypatch.setattr(views, 'PREVIEW_IMAGE_FILESYSTEM', str(tmpdir))
+
+    url = '/tiles/jw00327/image_files/0/0_0.jpg'
+    filename = 'image_files/0/0_0.jpg'
+    response = views.preview_tiles(request_factory.get(url), 'jw00327', filename)
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content) == b'tile'
+    response.close()
+    etag = response['ETag']
+    last_modified = response['Last-Modified']
+
+    # The client has the current tile
+    response = views.preview_tiles(request_factory.get(url, HTTP_IF_NONE_MATCH=etag),
+                                   'jw00327', filename)
+    assert response.status_code == 304
+    response = views.preview_tiles(request_factory.get(url, HTTP_IF_MODIFIED_SINCE=last_modified),
+                                   'jw00327', filename)
+    assert response.status_code == 304
+
+    # The tile was rendered again
+    tile.write_binary(b'new tile')
+    os.utime(str(tile), (time.time(), time.time()))
+    response = views.preview_tiles(request_factory.get(url, HTTP_IF_NONE_MATCH=etag),
+                                   'jw00327', filename)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert b''.join(response.streaming_content) == b'new tile'
+    response.close()
+
+    # Missing tiles are left to the view
+    with pytest.raises(views.Http404):
+        views.preview_tiles(request_factory.get(url, HTTP_IF_NONE_MATCH=etag),
+                            'jw00327', 'image_files/0/1_0.jpg')
@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+
+"""Tests for the ``dashboard_cache`` module of the MIRI data trending
+dashboard.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_dashboard_cache.py
+"""
+
+import datetime
+import os
+
+from jwql.instrument_monitors.miri_monitors.data_trending.utils.dashboard_cache import \
+    DashboardCache, database_signature, snap_to_day
+
+
+def test_dashboard_cache(tmpdir):
+    """Make sure dashboards are served by time range until the data
+    trending database changes.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    database_file = os.path.join(str(tmpdir), 'miri_database.db')
+    with open(database_file, 'w') as f:
+        f.write('data')
+
+    cache = DashboardCache(os.path.join(str(tmpdir), 'dashboard_cache.db'))
+    assert cache.get('2017-08-15', '', database_file) is None
+
+    cache.put('2017-08-15', '', ['<div>', '<script>'], database_signature(database_file))
+    cache.put('2019-01-01', '2019-02-01', ['<div 2>', '<script 2>'],
+              database_signature(database_file))
+    assert cache.get('2017-08-15', '', database_file) == ['<div>', '<script>']
+    assert cache.get('2019-01-01', '2019-02-01', database_file) == ['<div 2>', '<script 2>']
+    assert cache.get('2019-01-01', '', database_file) is None
+
+    # An ingest invalidates every range
+    with open(database_file, 'a') as f:
+        f.write(' and more data')
+    assert cache.get('2017-08-15', '', database_file) is None
+    cache.put('2017-08-15', '', ['<new div>', '<script>'], database_signature(database_file))
+    assert cache.get('2017-08-15', '', database_file) == ['<new div>', '<script>']
+    with cache.connect() as connection:
+        assert connection.execute('SELECT COUNT(*) FROM dashboards').fetchone()[0] == 1
+
+
+def test_dashboard_cache_ranges(tmpdir):
+    """Make sure only the ``max_ranges`` most recently built dashboards
+    are kept.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    database_file = os.path.join(str(tmpdir), 'miri_database.db')
+    with open(database_file, 'w') as f:
+        f.write('data')
+    signature = database_signature(database_file)
+
+    cache = DashboardCache(os.path.join(str(tmpdir), 'dashboard_cache.db'), max_ranges=2)
+    for day in ['2019-01-01', '2019-01-02', '2019-01-03']:
+        cache.put(day, '', ['<div {}>'.format(day), '<script>'], signature)
+    assert cache.get('2019-01-01', '', database_file) is None
+    assert cache.get('2019-01-02', '', database_file) == ['<div 2019-01-02>', '<script>']
+    assert cache.get('2019-01-03', '', database_file) == ['<div 2019-01-03>', '<script>']
+
+
+def test_snap_to_day():
+    """Make sure equivalent times, and times within the same day, give
+    the same key."""
+
+    assert snap_to_day('2017-08-15') == '2017-08-15 00:00:00.000'
+    assert snap_to_day('2017-08-15 00:00:00.000') == '2017-08-15 00:00:00.000'
+    assert snap_to_day('2017-08-15 13:45:00') == '2017-08-15 00:00:00.000'
+    assert snap_to_day(datetime.datetime(2017, 8, 15, 13, 45)) == '2017-08-15 00:00:00.000'
+    assert snap_to_day('2017-08-15 13:45:00', ceil=True) == '2017-08-16 00:00:00.000'
+    assert snap_to_day('2017-08-15', ceil=True) == '2017-08-15 00:00:00.000'
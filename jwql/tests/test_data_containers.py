@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Tests for the ``data_containers`` module in the ``jwql`` web
+application.
+
+Use
+---
+
+    These tests can be run via the command line (omit the -s to
+    suppress verbose output to stdout):
+
+    ::
+
+        pytest -s test_data_containers.py
+"""
+
+import os
+
+import django
+import pytest
+
+
+@pytest.fixture(scope='module')
+def data_containers():
+    """Return the ``data_containers`` module, after setting up the
+    ``jwql`` Django project it imports forms from."""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jwql.website.jwql_proj.settings')
+    django.setup()
+
+    from jwql.website.apps.jwql import data_containers
+
+    return data_containers
+
+
+def test_get_dashboard_components(data_containers, monkeypatch, tmpdir):
+    """Make sure the dashboard components are read from the top-level
+    monitor directories, and that a component file is only read again
+    once it changes.
+
+    Parameters
+    ----------
+    data_containers : module
+        The ``data_containers`` module
+    monkeypatch : obj
+        ``pytest`` monkeypatch fixture
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    monitor = tmpdir.mkdir('monitor_mast')
+    monitor.join('database_monitor_jwst_component.html').write('<div>jwst</div>')
+    monitor.join('database_monitor_jwst_component.js').write('<script>jwst</script>')
+    monitor.mkdir('nested').join('filecount_component.html').write('<div>nested</div>')
+    tmpdir.mkdir('header_cache')
+
+    reads = []
+
+    def counting_open(path, *args, **kwargs):
+        reads.append(os.path.basename(path))
+        return open(path, *args, **kwargs)
+
+    monkeypatch.setattr(data_containers, 'get_config', lambda: {'outputs': str(tmpdir)})
+    monkeypatch.setattr(data_containers, 'open', counting_open, raising=False)
+    monkeypatch.setattr(data_containers, 'DASHBOARD_DIRECTORIES', {})
+    monkeypatch.setattr(data_containers, 'DASHBOARD_FILES', {})
+
+    # Directories without components, and nested directories, are not
+    # shown. The cron job table is replaced by a notice until it exists.
+    components, html = data_containers.get_dashboard_components()
+    assert components == {'Database Monitor': {'JWST': ['<div>jwst</div>',
+                                                        '<script>jwst</script>']}}
+    assert 'has not been created yet' in html['Cron Job Monitor']
+    assert sorted(reads) == ['database_monitor_jwst_component.html',
+                             'database_monitor_jwst_component.js']
+
+    # Unchanged files are not read again
+    del reads[:]
+    assert data_containers.get_dashboard_components()[0] == components
+    assert reads == []
+
+    # An edited file is read again, along with the new cron job table
+    div = monitor.join('database_monitor_jwst_component.html')
+    div.write('<div>jwst, updated</div>')
+    os.utime(str(div), (os.stat(str(div)).st_atime, os.stat(str(div)).st_mtime + 10.))
+    tmpdir.mkdir('monitor_cron_jobs').join('cron_status_table.html').write('<table></table>')
+    components, html = data_containers.get_dashboard_components()
+    assert components['Database Monitor']['JWST'][0] == '<div>jwst, updated</div>'
+    assert html['Cron Job Monitor'] == '<table></table>'
+    assert sorted(reads) == ['cron_status_table.html', 'database_monitor_jwst_component.html']
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+
+"""Tests for the ``filesystem_index`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_filesystem_index.py
+"""
+
+import os
+import shutil
+
+from jwql.utils.filesystem_index import FilesystemIndex, parse_indexed_filename
+
+
+def test_parse_indexed_filename():
+    """Make sure filenames are split into the columns of the index."""
+
+    columns = parse_indexed_filename('jw00327001001_02101_00001_guider1_rate_integ0.jpg')
+    assert columns == {'rootname': 'jw00327001001_02101_00001_guider1', 'detector': 'guider1',
+                       'instrument': 'fgs', 'suffix': 'rate', 'extension': 'jpg'}
+
+    columns = parse_indexed_filename('notes.txt')
+    assert columns['rootname'] == 'notes'
+    assert columns['instrument'] == ''
+
+
+def test_filesystem_index(tmpdir):
+    """Make sure files are found by their columns and by pattern, and
+    that only changed directories are listed again.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    top = os.path.join(str(tmpdir), 'filesystem')
+    filenames = {'jw00327': ['jw00327001001_02101_00001_nrca1_rate.fits',
+                             'jw00327001001_02101_00001_nrca1_cal.fits',
+                             'jw00327001001_02101_00002_nis_rate.fits'],
+                 'jw01022': ['jw01022001001_02101_00001_mirimage_rateints.fits']}
+    for directory, names in filenames.items():
+        os.makedirs(os.path.join(top, directory))
+        for name in names:
+            open(os.path.join(top, directory, name), 'w').close()
+
+    index = FilesystemIndex(os.path.join(str(tmpdir), 'filesystem_index.db'))
+    assert index.version('filesystem') == (0, 0.)
+    assert index.update('filesystem', top) == (4, 0)
+    assert index.update('filesystem', top) == (0, 0)
+    assert index.version('filesystem')[0] == 1
+    assert index.directories('filesystem') == ['jw00327', 'jw01022']
+
+    assert index.query('filesystem', instrument='NIRCam') == [
+        os.path.join(top, 'jw00327', 'jw00327001001_02101_00001_nrca1_cal.fits'),
+        os.path.join(top, 'jw00327', 'jw00327001001_02101_00001_nrca1_rate.fits')]
+    assert len(index.query('filesystem', program='00327', suffix='rate')) == 2
+    assert len(index.query('filesystem', pattern='jw00327001001_02101_00001*')) == 2
+    assert index.query('filesystem', rootname='jw01022001001_02101_00001_mirimage') == [
+        os.path.join(top, 'jw01022', 'jw01022001001_02101_00001_mirimage_rateints.fits')]
+    assert index.query('thumbnails') == []
+
+    # Listings are read page by page
+    assert index.query('filesystem', limit=2) == index.query('filesystem')[:2]
+    assert index.query('filesystem', after='jw00327001001_02101_00001_nrca1_rate.fits') == [
+        os.path.join(top, 'jw00327', 'jw00327001001_02101_00002_nis_rate.fits'),
+        os.path.join(top, 'jw01022', 'jw01022001001_02101_00001_mirimage_rateints.fits')]
+    assert index.query('filesystem', program='00327', limit=1,
+                       after='jw00327001001_02101_00001_nrca1_cal.fits') == [
+        os.path.join(top, 'jw00327', 'jw00327001001_02101_00001_nrca1_rate.fits')]
+
+    # A file is added to one directory, and another directory removed
+    open(os.path.join(top, 'jw00327', 'jw00327001001_02101_00003_nrs1_rate.fits'), 'w').close()
+    os.utime(os.path.join(top, 'jw00327'), (0, 0))
+    shutil.rmtree(os.path.join(top, 'jw01022'))
+    assert index.update('filesystem', top) == (1, 1)
+    assert index.query('filesystem', instrument='nirspec') == [
+        os.path.join(top, 'jw00327', 'jw00327001001_02101_00003_nrs1_rate.fits')]
+    assert index.directories('filesystem') == ['jw00327']
+    assert index.version('filesystem')[0] == 2
+
+    # Recently updated indexes are not updated again by refresh
+    assert not index.refresh('filesystem', top, max_age=60.)
+    assert index.refresh('filesystem', top, max_age=-1.)
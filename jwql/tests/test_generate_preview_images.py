@@ -0,0 +1,269 @@
+#! /usr/bin/env python
+
+"""Tests for the ``generate_preview_images`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_generate_preview_images.py
+"""
+
+import logging
+import os
+import re
+
+from astropy.io import fits
+import numpy as np
+import pytest
+
+from jwql.jwql_monitors import generate_preview_images
+from jwql.jwql_monitors.generate_preview_images import _check_shared_manifest, create_mosaic, \
+    create_mosaic_stream, group_filenames
+from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
+from jwql.utils.preview_leases import LeaseDirectory
+from jwql.utils.preview_manifest import PreviewManifest
+from jwql.utils.utils import filename_parser
+
+
+def make_filenames(nfiles, seed=0):
+    """Return a shuffled list of synthetic JWST filenames, with the
+    detectors of whole exposures of several instruments.
+
+    Parameters
+    ----------
+    nfiles : int
+        Number of filenames to return
+    seed : int
+        Seed of the random number generator
+
+    Returns
+    -------
+    filenames : list
+        List of filenames
+    """
+
+    detector_sets = [NIRCAM_SHORTWAVE_DETECTORS, NIRCAM_LONGWAVE_DETECTORS,
+                     ['MIRIMAGE'], ['NIS'], ['NRS1', 'NRS2'], ['GUIDER1']]
+    random_state = np.random.RandomState(seed)
+    filenames = []
+    exposure = 0
+    while len(filenames) < nfiles:
+        exposure += 1
+        program = '{:05d}'.format(random_state.randint(1, 100))
+        detectors = detector_sets[random_state.randint(len(detector_sets))]
+        suffix = ['uncal', 'rate', 'rateints', 'cal'][random_state.randint(4)]
+        for detector in detectors:
+            filename = 'jw{}001001_02101_{:05d}_{}_{}.fits'.format(
+                program, exposure, detector.lower(), suffix)
+            filenames.append(os.path.join('/filesystem', 'jw{}'.format(program), filename))
+    filenames = filenames[:nfiles]
+    random_state.shuffle(filenames)
+
+    return filenames
+
+
+def regex_group_filenames(input_files):
+    """The regular expression based implementation of
+    ``group_filenames`` that was used before the single-pass grouping,
+    as a reference for its output.
+
+    Parameters
+    ----------
+    input_files : list
+        list of filenames
+
+    Returns
+    -------
+    grouped : list
+        grouped list of filenames
+    """
+
+    grouped = []
+    input_files = np.array(sorted(input_files))
+    goodindex = np.arange(len(input_files))
+
+    for full_filename in input_files[goodindex]:
+        file_directory, filename = os.path.split(full_filename)
+
+        # Generate string to be matched with other filenames
+        filename_parts = filename_parser(filename)
+        observation_base = 'jw{}{}{}_{}{}{}_{}_'.format(
+            filename_parts['program_id'], filename_parts['observation'], filename_parts['visit'],
+            filename_parts['visit_group'], filename_parts['parallel_seq_id'],
+            filename_parts['activity'], filename_parts['exposure_id'])
+        detector = filename_parts['detector'].upper()
+        if detector in NIRCAM_SHORTWAVE_DETECTORS:
+            detector_str = 'NRC[AB][1234]'
+        elif detector in NIRCAM_LONGWAVE_DETECTORS:
+            detector_str = 'NRC[AB]5'
+        else:
+            detector_str = detector
+        match_str = '{}{}_{}.fits'.format(observation_base, detector_str, filename_parts['suffix'])
+        pattern = re.compile(os.path.join(file_directory, match_str), re.IGNORECASE)
+
+        # Group the remaining files that match, and do not use them as
+        # a basis for matching later
+        matches = [index for index in goodindex if pattern.match(input_files[index])]
+        if len(matches) != 0:
+            goodindex = np.array([index for index in goodindex if index not in matches])
+            grouped.append(list(input_files[matches]))
+
+    return grouped
+
+
+def test_check_shared_manifest(tmpdir):
+    """Make sure coordinated runs refuse a manifest that uses the
+    write-ahead log.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    leases = LeaseDirectory(os.path.join(str(tmpdir), 'leases'))
+    filename = os.path.join(str(tmpdir), 'preview_manifest.db')
+    _check_shared_manifest(PreviewManifest(filename), leases)
+    with pytest.raises(ValueError):
+        _check_shared_manifest(PreviewManifest(filename, wal=True), leases)
+
+
+def test_group_filenames():
+    """Make sure the files of each exposure are grouped by NIRCam
+    channel, and that the grouping matches the earlier regular
+    expression based implementation.
+    """
+
+    filenames = ['/fs/jw00327/jw00327001001_02101_00001_nrcb5_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00001_nrca1_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00001_nrca5_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00001_nrcb2_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00001_nrca1_cal.fits',
+                 '/fs/jw00327/jw00327001001_02101_00001-seg001_nrca1_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00002_nrs1_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00002_nrs2_rate.fits']
+
+    grouped = group_filenames(list(filenames))
+    assert grouped == [['/fs/jw00327/jw00327001001_02101_00001_nrca1_rate.fits',
+                        '/fs/jw00327/jw00327001001_02101_00001_nrcb2_rate.fits'],
+                       ['/fs/jw00327/jw00327001001_02101_00001_nrca1_cal.fits'],
+                       ['/fs/jw00327/jw00327001001_02101_00001_nrca5_rate.fits',
+                        '/fs/jw00327/jw00327001001_02101_00001_nrcb5_rate.fits'],
+                       ['/fs/jw00327/jw00327001001_02101_00002_nrs1_rate.fits'],
+                       ['/fs/jw00327/jw00327001001_02101_00002_nrs2_rate.fits']]
+    assert grouped == regex_group_filenames(list(filenames))
+
+    filenames = make_filenames(500)
+    assert group_filenames(list(filenames)) == regex_group_filenames(list(filenames))
+
+
+def test_create_mosaic_stream(tmpdir):
+    """Make sure the mosaic built one integration at a time matches
+    the mosaic of all integrations built at once.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    filenames = []
+    for detector in ['nrca5', 'nrcb5']:
+        filename = os.path.join(str(tmpdir),
+                                'jw00327001001_02101_00001_{}_uncal.fits'.format(detector))
+        primary = fits.PrimaryHDU()
+        primary.header['SUBSTRT1'] = 1
+        primary.header['SUBSTRT2'] = 1
+        primary.header['SUBSIZE1'] = 2048
+        primary.header['SUBSIZE2'] = 2048
+        data = np.random.RandomState(len(filenames)).randint(0, 1000, (2, 2, 2048, 2048))
+        sci = fits.ImageHDU(data.astype(np.uint16), name='SCI')
+        fits.HDUList([primary, sci]).writeto(filename)
+        filenames.append(filename)
+
+    mosaic, dq = create_mosaic(filenames)
+    for prefetch in [False, True]:
+        integrations = 0
+        for integration, mosaic_frame, mosaic_dq in create_mosaic_stream(filenames,
+                                                                         prefetch=prefetch):
+            assert mosaic_frame.dtype == np.float32
+            assert np.array_equal(mosaic_frame, mosaic[integration], equal_nan=True)
+            assert np.array_equal(mosaic_dq, dq)
+            integrations += 1
+        assert integrations == 2
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_generate_preview_images(workers, caplog, monkeypatch, tmpdir):
+    """Make sure serial and parallel runs give every exposure group the
+    same status and log the same summary, and that a group that raises
+    is counted as failed without stopping the run.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes of the run
+    caplog : obj
+        ``pytest`` log capture fixture
+    monkeypatch : obj
+        ``pytest`` monkeypatch fixture
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    directory = os.path.join(str(tmpdir), 'filesystem', 'jw00327')
+    os.makedirs(directory)
+    for exposure in [1, 3]:
+        filename = os.path.join(
+            directory, 'jw00327001001_02101_{:05d}_mirimage_rate.fits'.format(exposure))
+        primary = fits.PrimaryHDU()
+        primary.header['SUBSTRT1'] = 1
+        primary.header['SUBSTRT2'] = 1
+        primary.header['SUBSIZE1'] = 64
+        primary.header['SUBSIZE2'] = 64
+        data = np.random.RandomState(exposure).uniform(0, 1000, (64, 64)).astype(np.float32)
+        sci = fits.ImageHDU(data, name='SCI')
+        dq = fits.ImageHDU(np.zeros((64, 64), dtype=np.uint32), name='PIXELDQ')
+        fits.HDUList([primary, sci, dq]).writeto(filename)
+
+    # A file that cannot be read at all makes process_file_group raise
+    broken = os.path.join(directory, 'jw00327001001_02101_00002_mirimage_rate.fits')
+    with open(broken, 'w') as broken_file:
+        broken_file.write('not a FITS file')
+
+    settings = {'filesystem': os.path.join(str(tmpdir), 'filesystem'),
+                'preview_image_filesystem': os.path.join(str(tmpdir), 'preview_images'),
+                'thumbnail_filesystem': os.path.join(str(tmpdir), 'thumbnails')}
+    monkeypatch.setattr(generate_preview_images, 'get_config', lambda: settings)
+    monkeypatch.setattr(generate_preview_images, 'get_manifest_filename',
+                        lambda: os.path.join(str(tmpdir), 'preview_manifest.db'))
+
+    statuses = []
+    record_status = generate_preview_images._record_status
+
+    def recording_record_status(manifest, run_statuses, status, file_list, signatures):
+        statuses.append((os.path.basename(file_list[0]), status))
+        record_status(manifest, run_statuses, status, file_list, signatures)
+
+    monkeypatch.setattr(generate_preview_images, '_record_status', recording_record_status)
+
+    # Run the function without the logging decorators, since log_fail
+    # would swallow any exception that escapes the run
+    run = generate_preview_images.generate_preview_images.__wrapped__.__wrapped__
+    with caplog.at_level(logging.INFO):
+        run(workers=workers)
+
+    assert statuses == [('jw00327001001_02101_00001_mirimage_rate.fits', 'rendered'),
+                        ('jw00327001001_02101_00002_mirimage_rate.fits', 'failed'),
+                        ('jw00327001001_02101_00003_mirimage_rate.fits', 'rendered')]
+    messages = [record.getMessage() for record in caplog.records]
+    summary = messages[messages.index('Rendered 2 exposure groups, skipped 0, failed 1'):]
+    assert summary == ['Rendered 2 exposure groups, skipped 0, failed 1',
+                       '\tFailed: {}'.format(broken), 'Completed.']
+    assert 'Failed to create preview images for {}'.format(broken) in messages
+    assert 'No SIMPLE card found' in caplog.text
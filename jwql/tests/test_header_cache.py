@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+
+"""Tests for the ``header_cache`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_header_cache.py
+"""
+
+import os
+
+from astropy.io import fits
+
+from jwql.utils import header_cache
+from jwql.utils.header_cache import HeaderCache
+
+
+def test_header_cache(tmpdir, monkeypatch):
+    """Make sure cached keywords and headers are returned without
+    reading the files, and that changed files are read again.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    monkeypatch : obj
+        ``pytest`` fixture to replace ``fits.getheader``
+    """
+
+    filepaths = []
+    for exposure, expstart in [(1, 58000.5), (2, 58001.5)]:
+        filepath = os.path.join(str(tmpdir), 'jw00327001001_02101_{:05d}_nrca1_rate.fits'.format(
+            exposure))
+        primary = fits.PrimaryHDU()
+        primary.header['EXPSTART'] = expstart
+        primary.header['READPATT'] = 'RAPID'
+        primary.header['OBSERVTN'] = '001'
+        primary.writeto(filepath)
+        filepaths.append(filepath)
+
+    cache = HeaderCache(os.path.join(str(tmpdir), 'header_cache.db'))
+    keywords = cache.keywords(filepaths)
+    assert keywords[filepaths[0]] == {'EXPSTART': 58000.5, 'READPATT': 'RAPID'}
+    assert keywords[filepaths[1]]['EXPSTART'] == 58001.5
+    assert 'OBSERVTN' in cache.header(filepaths[0])
+
+    # Cached files are not read again
+    read = []
+
+    def getheader(path, ext=0):
+        read.append(path)
+        return fits.Header({'EXPSTART': 1.})
+
+    monkeypatch.setattr(header_cache.fits, 'getheader', getheader)
+    assert cache.keywords(filepaths) == keywords
+    assert 'OBSERVTN' in cache.header(filepaths[0])
+    assert read == []
+
+    # Changed files are
+    os.utime(filepaths[1], (0, 0))
+    assert cache.keywords(filepaths)[filepaths[1]] == {'EXPSTART': 1.}
+    assert read == [filepaths[1]]
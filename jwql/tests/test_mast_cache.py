@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+
+"""Tests for the ``mast_cache`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_mast_cache.py
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from jwql.utils.mast_cache import MastCache
+
+
+def test_mast_cache(tmpdir):
+    """Make sure fresh results are served from the cache, and stale
+    results are served while they are refreshed in the background.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    calls = []
+
+    def fetch():
+        calls.append(time.time())
+        return {'rootnames': ['jw00327001001_02101_00001_nrca1'], 'calls': len(calls)}
+
+    cache = MastCache(os.path.join(str(tmpdir), 'mast_cache.db'), ttl=60.)
+    assert cache.get('Nircam:filename', fetch)['calls'] == 1
+    assert cache.get('Nircam:filename', fetch)['calls'] == 1
+    assert cache.refresh_thread is None
+
+    # Stale results are returned, and refreshed once
+    cache.ttl = -1.
+    assert cache.get('Nircam:filename', fetch)['calls'] == 1
+    cache.refresh_thread.join()
+    cache.ttl = 60.
+    assert cache.get('Nircam:filename', fetch)['calls'] == 2
+    assert len(calls) == 2
+    assert cache.fetched('Nircam:filename') >= calls[-1]
+    assert cache.fetched('Niriss:filename') is None
+
+
+def test_mast_cache_revalidate(tmpdir, monkeypatch):
+    """Make sure the time of the last fetch is returned without
+    reading the cached result, and that stale results are refreshed.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    monkeypatch : obj
+        ``pytest`` fixture to make reading the cached result fail
+    """
+
+    calls = []
+
+    def fetch():
+        calls.append(time.time())
+        return ['jw00327001001_02101_00001_nrca1'] * 1000
+
+    cache = MastCache(os.path.join(str(tmpdir), 'mast_cache.db'), ttl=60.)
+    fetched = cache.revalidate('Nircam:filename', fetch)
+    assert len(calls) == 1
+    assert fetched == cache.fetched('Nircam:filename')
+
+    def read(key):
+        raise AssertionError('The cached result was read')
+
+    monkeypatch.setattr(cache, '_read', read)
+    assert cache.revalidate('Nircam:filename', fetch) == fetched
+    assert cache.refresh_thread is None
+
+    cache.ttl = -1.
+    assert cache.revalidate('Nircam:filename', fetch) == fetched
+    cache.refresh_thread.join()
+    assert len(calls) == 2
+    assert cache.fetched('Nircam:filename') > fetched
+
+
+def test_mast_cache_single_flight(tmpdir):
+    """Make sure concurrent requests for a result that is not cached
+    send a single query, and that a failed query is retried.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    filename = os.path.join(str(tmpdir), 'mast_cache.db')
+    calls = []
+
+    def fetch():
+        calls.append(time.time())
+        time.sleep(0.5)
+        return ['00327']
+
+    results = []
+
+    def request():
+        cache = MastCache(filename, poll_interval=0.01)
+        results.append(cache.get('Nircam:program', fetch))
+
+    MastCache(filename)
+    threads = [threading.Thread(target=request) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [['00327']] * 4
+    assert len(calls) == 1
+
+    def fail():
+        raise ValueError('MAST is down')
+
+    cache = MastCache(filename)
+    with pytest.raises(ValueError):
+        cache.get('Niriss:program', fail)
+    assert cache.get('Niriss:program', lambda: ['01022']) == ['01022']
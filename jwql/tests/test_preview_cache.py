@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+
+"""Tests for the ``preview_cache`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_preview_cache.py
+"""
+
+import os
+
+from jwql.utils.preview_cache import PreviewCache, evict, scan_stores, select_evictions
+
+
+def test_preview_cache(tmpdir):
+    """Make sure the least recently viewed exposures are evicted first,
+    that new and never viewed exposures are pinned, and that thumbnails,
+    mosaics and their tile pyramids are never evicted.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    now = 100. * 86400.
+    preview_directory = os.path.join(str(tmpdir), 'preview', 'jw00327')
+    thumbnail_directory = os.path.join(str(tmpdir), 'thumbnails', 'jw00327')
+    tile_directory = os.path.join(preview_directory,
+                                  'jw00327001001_02101_00003_NRC_SW_MOSAIC_rate_integ0_files')
+    os.makedirs(tile_directory)
+    os.makedirs(thumbnail_directory)
+
+    def write(directory, filename, size, age_days):
+        path = os.path.join(directory, filename)
+        with open(path, 'wb') as image_file:
+            image_file.write(b'0' * size)
+        os.utime(path, (now - age_days * 86400., now - age_days * 86400.))
+
+    for exposure, age_days in [(1, 60), (2, 60), (3, 60), (4, 60), (5, 1)]:
+        write(preview_directory, 'jw00327001001_02101_{:05d}_nis_rate_integ0.jpg'.format(exposure),
+              1000, age_days)
+        write(thumbnail_directory,
+              'jw00327001001_02101_{:05d}_nis_rate_integ0.thumb'.format(exposure), 100, age_days)
+    write(tile_directory, '0_0.jpg', 500, 60)
+    os.utime(tile_directory, (now - 60 * 86400., now - 60 * 86400.))
+
+    exposures = scan_stores([os.path.dirname(preview_directory),
+                             os.path.dirname(thumbnail_directory)])
+    assert len(exposures) == 5
+    assert exposures['jw00327001001_02101_00003']['size'] == 1600
+    assert exposures['jw00327001001_02101_00003']['pinned_size'] == 600
+    assert exposures['jw00327001001_02101_00001']['instrument'] == 'niriss'
+
+    # Exposure 4 was never viewed, and exposure 5 is new
+    cache = PreviewCache(os.path.join(str(tmpdir), 'preview_cache.db'))
+    assert cache.touch('jw00327001001_02101_00001_nis')
+    last_access = cache.last_access()
+    assert list(last_access) == ['jw00327001001_02101_00001']
+
+    # Views shortly after the recorded one are not written again
+    assert not cache.touch('jw00327001001_02101_00001_nis_rate.fits')
+    assert cache.last_access() == last_access
+    assert cache.touch('jw00327001001_02101_00001_nis', min_interval=-1.)
+    assert cache.last_access()['jw00327001001_02101_00001'] > \
+        last_access['jw00327001001_02101_00001']
+    last_access = {'jw00327001001_02101_00001': now - 40 * 86400.,
+                   'jw00327001001_02101_00002': now - 50 * 86400.,
+                   'jw00327001001_02101_00003': now - 45 * 86400.,
+                   'jw00327001001_02101_00005': now - 50 * 86400.}
+
+    evictions, remaining = select_evictions(exposures, last_access, 4000, now=now)
+    assert evictions == ['jw00327001001_02101_00002', 'jw00327001001_02101_00003']
+    assert remaining == 4000
+
+    evictions, remaining = select_evictions(exposures, last_access, 0, now=now)
+    assert len(evictions) == 3
+    assert remaining == 3000
+
+    assert evict(exposures, evictions[:2]) == 2000
+    assert sorted(scan_stores([os.path.dirname(preview_directory)])) == \
+        ['jw00327001001_02101_00001', 'jw00327001001_02101_00003', 'jw00327001001_02101_00004',
+         'jw00327001001_02101_00005']
+    assert os.path.exists(os.path.join(tile_directory, '0_0.jpg'))
+    assert len(os.listdir(thumbnail_directory)) == 5
@@ -20,12 +20,19 @@ Use
 """
 
 import glob
+import json
+import logging
+import multiprocessing
 import os
 import pytest
 
 from astropy.io import fits
+import matplotlib.colors as colors
+import matplotlib.pyplot as plt
+import numpy as np
+from PIL import Image
 
-from jwql.utils.preview_image import PreviewImage
+from jwql.utils.preview_image import PreviewImage, block_average, load_statistics
 
 # directory to be created and populated during tests running
 TEST_DIRECTORY = os.path.join(os.environ['HOME'], 'preview_image_test')
@@ -108,3 +115,336 @@ def test_make_image(test_directory):
             # clean up: delete preview images
             for file in preview_image_filenames:
                 os.remove(file)
+
+
+def make_test_file(filename, shape):
+    """Write a small FITS file with the extensions and header keywords
+    that ``PreviewImage`` expects.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the FITS file to create
+    shape : tuple
+        Shape of the ``SCI`` extension (2D, 3D, or 4D)
+    """
+    primary = fits.PrimaryHDU()
+    primary.header['SUBSTRT1'] = 1
+    primary.header['SUBSTRT2'] = 1
+    primary.header['SUBSIZE1'] = shape[-1]
+    primary.header['SUBSIZE2'] = shape[-2]
+    primary.header['NINTS'] = shape[0] if len(shape) > 2 else 1
+    data = np.random.RandomState(0).uniform(0, 1000, shape).astype(np.float32)
+    sci = fits.ImageHDU(data, name='SCI')
+    dq = fits.ImageHDU(np.zeros(shape[-2:], dtype=np.uint32), name='PIXELDQ')
+    fits.HDUList([primary, sci, dq]).writeto(filename)
+
+
+def test_make_image_direct_engine(tmpdir):
+    """Make sure the ``direct`` engine writes one JPEG thumbnail per
+    integration, averaged down to ``thumbnail_size``.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rateints.fits')
+    make_test_file(filename, (3, 300, 200))
+
+    image = PreviewImage(filename, 'SCI')
+    image.engine = 'direct'
+    image.thumbnail_size = 100
+    image.preview_output_directory = str(tmpdir)
+    image.thumbnail_output_directory = str(tmpdir)
+    image.make_image()
+
+    thumbnails = sorted(glob.glob(os.path.join(str(tmpdir), '*.thumb')))
+    assert len(thumbnails) == 3
+    assert len(glob.glob(os.path.join(str(tmpdir), '*.jpg'))) == 3
+    with Image.open(thumbnails[0]) as thumbnail:
+        assert thumbnail.format == 'JPEG'
+        assert thumbnail.size == (67, 100)
+
+
+def test_make_image_parallel(tmpdir):
+    """Make sure integrations rendered by a pool of processes are
+    identical to those rendered one after the other.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rateints.fits')
+    make_test_file(filename, (3, 100, 80))
+
+    outputs = {}
+    for workers in [1, 2]:
+        output_directory = os.path.join(str(tmpdir), 'workers{}'.format(workers))
+        os.mkdir(output_directory)
+        image = PreviewImage(filename, 'SCI')
+        image.engine = 'direct'
+        image.workers = workers
+        image.preview_output_directory = output_directory
+        image.thumbnail_output_directory = output_directory
+        image.make_image()
+
+        outputs[workers] = {}
+        for output in sorted(os.listdir(output_directory)):
+            with open(os.path.join(output_directory, output), 'rb') as image_file:
+                outputs[workers][output] = image_file.read()
+
+    assert len(outputs[1]) == 6
+    assert outputs[1] == outputs[2]
+
+
+def test_make_image_shared_pool(tmpdir, caplog):
+    """Make sure a single pool of processes can render the
+    integrations of several files, and that the log records of its
+    workers are re-emitted in the current process.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    caplog : obj
+        ``pytest`` log capture fixture
+    """
+    filenames = [os.path.join(str(tmpdir), 'jw00327001001_02101_0000{}_nrca1_rateints.fits')
+                 .format(i) for i in [4, 5]]
+    caplog.set_level(logging.INFO)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=2) as pool:
+        for filename in filenames:
+            make_test_file(filename, (3, 100, 80))
+            image = PreviewImage(filename, 'SCI')
+            image.engine = 'direct'
+            image.workers = 2
+            image.pool = pool
+            image.preview_output_directory = str(tmpdir)
+            image.thumbnail_output_directory = str(tmpdir)
+            image.make_image()
+
+    assert len(glob.glob(os.path.join(str(tmpdir), '*.jpg'))) == 6
+    saved = [record for record in caplog.records if record.getMessage().startswith('Saved image')]
+    assert len(saved) == 12
+
+
+def test_make_image_statistics(tmpdir):
+    """Make sure the statistics of each integration are saved to the
+    sidecar file, that their limits are reused by the next render of
+    the same file, and that they are ignored once the file changes.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00003_nrca1_rateints.fits')
+    make_test_file(filename, (2, 100, 80))
+
+    image = PreviewImage(filename, 'SCI')
+    image.engine = 'direct'
+    image.preview_output_directory = str(tmpdir)
+    image.thumbnail_output_directory = str(tmpdir)
+    image.stats_output_directory = str(tmpdir)
+    image.make_image()
+
+    statistics = load_statistics(filename, str(tmpdir))
+    assert sorted(statistics['integrations']) == ['0', '1']
+    integration = statistics['integrations']['0']
+    assert integration['science_pixels'] == 8000
+    assert sum(integration['histogram']['counts']) + integration['histogram']['below'] + \
+        integration['histogram']['above'] == 8000
+    assert integration['percentiles']['50.0'] == pytest.approx(
+        np.median(image.data[0]), rel=1e-4)
+
+    # Limits saved by the earlier render are used instead of new ones
+    statistics['integrations']['0']['limits'] = [-1., 1.]
+    with open(os.path.join(str(tmpdir), 'jw00327001001_02101_00003_nrca1_rateints_stats.json'),
+              'w') as json_file:
+        json.dump(statistics, json_file)
+    image = PreviewImage(filename, 'SCI')
+    image.stats_output_directory = str(tmpdir)
+    assert image.find_saved_statistics(0)['limits'] == [-1., 1.]
+    image.clip_percent = 0.1
+    assert image.find_saved_statistics(0) is None
+
+    os.utime(filename, (0, 0))
+    assert load_statistics(filename, str(tmpdir)) is None
+
+
+@pytest.mark.parametrize('scale', ['linear', 'log'])
+def test_make_image_thumbnail_from_preview(tmpdir, scale):
+    """Make sure thumbnails derived from the preview buffer are the
+    block average of the rendered frame.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    scale : str
+        Image scaling (``log``, ``linear``)
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rate.fits')
+    make_test_file(filename, (300, 200))
+
+    image = PreviewImage(filename, 'SCI')
+    image.scaling = scale
+    image.thumbnail_source = 'preview'
+    image.thumbnail_size = 100
+    image.preview_output_directory = str(tmpdir)
+    image.thumbnail_output_directory = str(tmpdir)
+    image.make_image()
+
+    assert len(glob.glob(os.path.join(str(tmpdir), '*.jpg'))) == 1
+    thumbnails = glob.glob(os.path.join(str(tmpdir), '*.thumb'))
+    assert len(thumbnails) == 1
+    with Image.open(thumbnails[0]) as thumbnail:
+        assert thumbnail.size == (67, 100)
+
+    rgb = np.arange(5 * 7 * 3, dtype=np.uint8).reshape(5, 7, 3)
+    averaged = block_average(rgb, 2)
+    assert averaged.shape == (3, 4, 3)
+    assert averaged.dtype == np.uint8
+    assert np.array_equal(averaged[0, 0], np.round(rgb[:2, :2].mean(axis=(0, 1))))
+    assert np.array_equal(averaged[-1, -1], rgb[-1, -1])
+
+
+@pytest.mark.parametrize('scale', ['linear', 'log'])
+def test_make_rgb(tmpdir, scale):
+    """Compare the lookup table rendering with the ``matplotlib``
+    normalization and colormap.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    scale : str
+        Image scaling (``log``, ``linear``)
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rate.fits')
+    make_test_file(filename, (50, 40))
+    image = PreviewImage(filename, 'SCI')
+
+    frame = image.data
+    min_value, max_value = image.find_limits(frame, image.dq, 0.01)
+    rgb = image.make_rgb(frame, min_value, max_value, scale)
+
+    if scale == 'log':
+        norm = colors.LogNorm(vmin=1, vmax=max_value - min_value + 1)
+        expected = plt.get_cmap('viridis')(norm(np.clip(frame, min_value, None) - min_value + 1))
+        expected = expected[::-1]
+    else:
+        norm = colors.Normalize(vmin=min_value, vmax=max_value)
+        expected = plt.get_cmap('viridis')(norm(frame))
+    expected = np.round(expected[:, :, :3] * 255).astype(np.uint8)
+
+    assert rgb.shape == (50, 40, 3)
+    assert np.array_equal(rgb, expected)
+
+
+def test_find_limits(tmpdir):
+    """Make sure the selection-based display limits are identical to
+    those found by sorting all science pixels, and that the sampled
+    estimate is close to them.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rate.fits')
+    make_test_file(filename, (50, 40))
+    image = PreviewImage(filename, 'SCI')
+
+    random_state = np.random.RandomState(1)
+    data = random_state.lognormal(size=(400, 300))
+    data[random_state.uniform(size=data.shape) < 0.001] = np.nan
+    pixmap = random_state.uniform(size=data.shape) > 0.1
+
+    for clip_percent in [0., 0.01, 0.2]:
+        pixels = np.sort(data[pixmap])
+        numclip = int(clip_percent * pixels.size)
+        expected = (pixels[numclip], pixels[-numclip - 1])
+        assert np.array_equal(image.find_limits(data, pixmap, clip_percent), expected,
+                              equal_nan=True)
+
+    image.limits_method = 'sampled'
+    image.limits_sample_size = 20000
+    pixels = np.sort(data[pixmap])
+    minval, maxval = image.find_limits(data, pixmap, 0.01)
+    assert abs(np.searchsorted(pixels, minval) / pixels.size - 0.01) < 0.005
+    assert abs(np.searchsorted(pixels, maxval) / pixels.size - 0.99) < 0.005
+
+
+def test_get_data_4d(tmpdir):
+    """Make sure only the first and last group of each integration are
+    read from 4D data, correctly scaled and as ``float32``.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_uncal.fits')
+    make_test_file(filename, (2, 5, 30, 20))
+
+    # Store the ramp as unsigned integers, which are scaled with BZERO
+    ramp = np.random.RandomState(2).randint(0, 65535, (2, 5, 30, 20)).astype(np.uint16)
+    with fits.open(filename, mode='update') as hdulist:
+        hdulist['SCI'].data = ramp
+
+    image = PreviewImage(filename, 'SCI')
+    assert image.data.dtype == np.float32
+    assert image.data.shape == (2, 2, 30, 20)
+    assert np.array_equal(image.data[:, 0], ramp[:, 0])
+    assert np.array_equal(image.data[:, 1], ramp[:, -1])
+    assert np.array_equal(image.difference_image(image.data),
+                          ramp[:, -1].astype(np.float32) - ramp[:, 0])
+
+    # Over the memory limit, only the difference images are read, in
+    # blocks of rows, into memory or into a memory-mapped scratch file
+    for memory_limit, memory_mapped in [(14399, False), (8000, True)]:
+        image = PreviewImage(filename, 'SCI', read_data=False)
+        image.memory_limit = memory_limit
+        image.data, image.dq = image.get_data(filename, 'SCI')
+        assert image.data.dtype == np.float32
+        assert image.data.shape == (2, 30, 20)
+        assert isinstance(image.data, np.memmap) == memory_mapped
+        assert np.array_equal(image.data, ramp[:, -1].astype(np.float32) - ramp[:, 0])
+
+
+def test_save_tiles(tmpdir):
+    """Make sure the tile pyramid has power-of-two levels of fixed-size
+    tiles, with the full resolution image at the top level.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+    filename = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rate.fits')
+    make_test_file(filename, (300, 600))
+
+    image = PreviewImage(filename, 'SCI')
+    image.thumbnail_source = 'preview'
+    image.tile_size = 128
+    image.preview_output_directory = str(tmpdir)
+    image.thumbnail_output_directory = str(tmpdir)
+    image.tile_output_directory = str(tmpdir)
+    image.make_image()
+
+    descriptor = os.path.join(str(tmpdir), 'jw00327001001_02101_00002_nrca1_rate_integ0.dzi')
+    with open(descriptor) as descriptor_file:
+        assert '<Size Width="600" Height="300"/>' in descriptor_file.read()
+
+    tile_directory = descriptor.replace('.dzi', '_files')
+    assert sorted(os.listdir(tile_directory), key=int) == [str(level) for level in range(11)]
+    assert len(os.listdir(os.path.join(tile_directory, '10'))) == 5 * 3
+    assert os.listdir(os.path.join(tile_directory, '0')) == ['0_0.jpg']
+    with Image.open(os.path.join(tile_directory, '10', '4_2.jpg')) as tile:
+        assert tile.size == (600 - 4 * 128, 300 - 2 * 128)
+    with Image.open(os.path.join(tile_directory, '9', '2_1.jpg')) as tile:
+        assert tile.size == (300 - 2 * 128, 150 - 128)
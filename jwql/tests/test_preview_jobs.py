@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+
+"""Tests for the ``preview_jobs`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_preview_jobs.py
+"""
+
+import os
+
+from jwql.utils.preview_jobs import PreviewJobQueue
+
+
+def test_preview_job_queue(tmpdir):
+    """Make sure duplicate requests are coalesced, that jobs are
+    claimed once in submission order, and that finished jobs can be
+    submitted again.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    queue = PreviewJobQueue(os.path.join(str(tmpdir), 'preview_jobs.db'))
+    assert queue.status('jw00327001001_02101_00001_nrca1') is None
+
+    assert queue.submit('jw00327001001_02101_00001_nrca1') == 'queued'
+    assert queue.submit('jw00327001001_02101_00002_nrca1') == 'queued'
+    assert queue.submit('jw00327001001_02101_00001_nrca1', rewrite=True) == 'queued'
+
+    assert queue.claim() == ('jw00327001001_02101_00001_nrca1', True)
+    assert queue.submit('jw00327001001_02101_00001_nrca1') == 'running'
+    assert queue.claim() == ('jw00327001001_02101_00002_nrca1', False)
+    assert queue.claim() is None
+
+    queue.finish('jw00327001001_02101_00001_nrca1', 'done', 'Created')
+    job = queue.status('jw00327001001_02101_00001_nrca1')
+    assert job['status'] == 'done'
+    assert job['message'] == 'Created'
+
+    # Running jobs of workers that died are claimed again
+    assert queue.claim(stale_after=-1.) == ('jw00327001001_02101_00002_nrca1', False)
+
+    assert queue.submit('jw00327001001_02101_00001_nrca1') == 'queued'
+    assert queue.claim() == ('jw00327001001_02101_00001_nrca1', False)
+
+
+def test_preview_job_queue_rewrite(tmpdir):
+    """Make sure a rewrite requested while a job is running queues the
+    job again once it finishes.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    queue = PreviewJobQueue(os.path.join(str(tmpdir), 'preview_jobs.db'))
+    assert queue.submit('jw00327001001_02101_00001_nrca1') == 'queued'
+    assert queue.claim() == ('jw00327001001_02101_00001_nrca1', False)
+
+    # A plain request is covered by the running job
+    assert queue.submit('jw00327001001_02101_00001_nrca1') == 'running'
+    queue.finish('jw00327001001_02101_00001_nrca1', 'done')
+    assert queue.status('jw00327001001_02101_00001_nrca1')['status'] == 'done'
+    assert queue.claim() is None
+
+    # A rewrite is not
+    assert queue.submit('jw00327001001_02101_00001_nrca1') == 'queued'
+    assert queue.claim() == ('jw00327001001_02101_00001_nrca1', False)
+    assert queue.submit('jw00327001001_02101_00001_nrca1', rewrite=True) == 'running'
+    queue.finish('jw00327001001_02101_00001_nrca1', 'done')
+    assert queue.status('jw00327001001_02101_00001_nrca1')['status'] == 'queued'
+    assert queue.claim() == ('jw00327001001_02101_00001_nrca1', True)
+    queue.finish('jw00327001001_02101_00001_nrca1', 'done')
+    assert queue.status('jw00327001001_02101_00001_nrca1')['status'] == 'done'
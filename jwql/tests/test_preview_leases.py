@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+
+"""Tests for the ``preview_leases`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_preview_leases.py
+"""
+
+import os
+import time
+
+from jwql.utils import preview_leases
+from jwql.utils.preview_leases import LeaseDirectory, lease_name
+
+
+def test_lease_directory(tmpdir):
+    """Make sure a lease is held by one host at a time, that renewed
+    leases are kept, and that expired leases are taken over.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    name = lease_name(['/filesystem/jw00327/jw00327001001_02101_00001_nrca1_rate.fits'])
+    assert name == 'jw00327001001_02101_00001_nrca1_rate'
+
+    first = LeaseDirectory(str(tmpdir), duration=60., owner='first', settle_time=0.)
+    second = LeaseDirectory(str(tmpdir), duration=60., owner='second', settle_time=0.)
+
+    assert first.acquire(name)
+    assert first.acquire(name)
+    assert not second.acquire(name)
+    assert second.holder(name)['owner'] == 'first'
+
+    # Releasing a lease held by another host has no effect
+    second.release(name)
+    assert not second.acquire(name)
+    first.release(name)
+    assert second.acquire(name)
+
+    # A lease that is not renewed expires and is taken over
+    path = os.path.join(str(tmpdir), '{}.lease'.format(name))
+    os.utime(path, (time.time() - 120., time.time() - 120.))
+    assert first.renew() == 0
+    assert second.renew() == 1
+    assert not first.acquire(name)
+    os.utime(path, (time.time() - 120., time.time() - 120.))
+    assert first.acquire(name)
+    assert first.holder(name)['owner'] == 'first'
+    assert sorted(os.listdir(str(tmpdir))) == ['{}.lease'.format(name)]
+
+
+def test_lease_take_over(tmpdir, monkeypatch):
+    """Make sure that of two hosts that take over the same expired
+    lease at the same time, only the last one to replace it holds it.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    monkeypatch : obj
+        ``pytest`` fixture to replace the wait after a takeover
+    """
+
+    name = 'jw00327001001_02101_00001_nrca1_rate'
+    crashed = LeaseDirectory(str(tmpdir), duration=60., owner='crashed')
+    first = LeaseDirectory(str(tmpdir), duration=60., owner='first')
+    second = LeaseDirectory(str(tmpdir), duration=60., owner='second')
+    assert crashed.acquire(name)
+    path = os.path.join(str(tmpdir), '{}.lease'.format(name))
+    os.utime(path, (time.time() - 120., time.time() - 120.))
+
+    # The second host finds the lease expired while the first one
+    # waits after its takeover, and replaces it too
+    acquired = []
+
+    def sleep(seconds):
+        if len(acquired) == 0:
+            acquired.append(None)
+            os.utime(path, (time.time() - 120., time.time() - 120.))
+            acquired.append(second.acquire(name))
+
+    monkeypatch.setattr(preview_leases.time, 'sleep', sleep)
+    assert not first.acquire(name)
+    assert acquired == [None, True]
+    assert first.holder(name)['owner'] == 'second'
+    assert sorted(os.listdir(str(tmpdir))) == ['{}.lease'.format(name)]
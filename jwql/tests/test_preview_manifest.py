@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+
+"""Tests for the ``preview_manifest`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_preview_manifest.py
+"""
+
+import os
+
+from jwql.utils.preview_manifest import PreviewManifest, file_signatures
+
+
+def test_preview_manifest(tmpdir):
+    """Make sure an exposure is only reported as up to date if none of
+    its files or rendering parameters have changed.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    file_list = []
+    for detector in ['nrca1', 'nrca2']:
+        filename = os.path.join(str(tmpdir),
+                                'jw00327001001_02101_00001_{}_rate.fits'.format(detector))
+        with open(filename, 'w') as fits_file:
+            fits_file.write('data')
+        file_list.append(filename)
+    parameters = {'scaling': 'log', 'cmap': 'viridis'}
+
+    manifest = PreviewManifest(os.path.join(str(tmpdir), 'manifest', 'preview_manifest.db'))
+    signatures = file_signatures(file_list)
+    assert not manifest.is_current(signatures, parameters)
+
+    manifest.record(signatures, parameters)
+    entries = PreviewManifest(manifest.filename).entries()
+    assert sorted(entries) == file_list
+    assert manifest.entries(file_list[:1] + ['missing.fits']) == {
+        file_list[0]: entries[file_list[0]]}
+    assert manifest.is_current(signatures, parameters, entries)
+    assert manifest.is_current(signatures, parameters)
+    assert not manifest.is_current(signatures, {'scaling': 'linear', 'cmap': 'viridis'}, entries)
+
+    # A reprocessed file, or a file added to the exposure
+    with open(file_list[1], 'a') as fits_file:
+        fits_file.write('more data')
+    assert not manifest.is_current(file_signatures(file_list), parameters, entries)
+    assert not manifest.is_current(file_signatures(file_list), parameters)
+    new_file = file_list[0].replace('nrca1', 'nrca3')
+    with open(new_file, 'w') as fits_file:
+        fits_file.write('data')
+    assert not manifest.is_current(file_signatures(file_list[:1] + [new_file]), parameters, entries)
@@ -0,0 +1,44 @@
+#! /usr/bin/env python
+
+"""Tests for the ``sqlite_store`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_sqlite_store.py
+"""
+
+import os
+
+from jwql.utils.sqlite_store import SQLiteStore
+
+
+class ItemStore(SQLiteStore):
+    schema = ['CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY)']
+
+
+def test_journal_mode(tmpdir):
+    """Make sure the rollback journal is used unless the write-ahead
+    log is requested, and that a database is switched back from it.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    filename = os.path.join(str(tmpdir), 'items.db')
+
+    def journal_mode(store):
+        with store.connect() as connection:
+            return connection.execute('PRAGMA journal_mode').fetchone()[0]
+
+    assert journal_mode(ItemStore(filename)) == 'delete'
+    assert journal_mode(ItemStore(filename, wal=True)) == 'wal'
+    assert journal_mode(ItemStore(filename)) == 'delete'
+    assert not os.path.exists(filename + '-wal')
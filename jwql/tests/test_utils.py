@@ -22,7 +22,7 @@ import os
 
 import pytest
 
-from jwql.utils.utils import get_config, filename_parser
+from jwql.utils.utils import get_config, filename_parser, format_size, parse_size
 
 
 FILENAME_PARSER_TEST_DATA = [
@@ -297,3 +297,14 @@ def test_filename_parser_nonJWST():
     with pytest.raises(ValueError):
         filename = 'not_a_jwst_file.fits'
         filename_parser(filename)
+
+
+def test_parse_size():
+    """Make sure sizes with and without units are converted to bytes,
+    and back to a readable form."""
+
+    assert parse_size('100') == 100
+    assert parse_size('2K') == 2048
+    assert parse_size('1.5G') == int(1.5 * 2**30)
+    assert parse_size('500gb') == 500 * 2**30
+    assert format_size(int(1.5 * 2**30)) == '1.5 G'
@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+
+"""Tests for the ``watch_preview_images`` module.
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to ``stdout``):
+
+    ::
+
+        pytest -s test_watch_preview_images.py
+"""
+
+import glob
+import os
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.jwql_monitors.generate_preview_images import PREVIEW_PARAMETERS
+from jwql.jwql_monitors.watch_preview_images import PreviewWatcher, is_complete_group
+from jwql.utils.preview_manifest import file_signatures
+
+
+class _RecordingPool(object):
+    """Stand-in for the worker pool that records the calls handed to
+    it instead of rendering the groups.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    @property
+    def tasks(self):
+        """The ``process_file_group`` arguments of each call"""
+        return [args[0][0] for function, args in self.calls]
+
+    def apply_async(self, function, args):
+        self.calls.append((function, args))
+
+
+def test_is_complete_group():
+    """Make sure NIRCam groups are only complete once all detectors of
+    the channel, or all expected detectors, are present.
+    """
+
+    base = '/fs/jw00327/jw00327001001_02101_00001_{}_rate.fits'
+    short_wave = [base.format('nrc{}{}'.format(module, number))
+                  for module in 'ab' for number in range(1, 5)]
+
+    assert is_complete_group([base.format('mirimage')])
+    assert not is_complete_group(short_wave[:4])
+    assert is_complete_group(short_wave)
+    assert not is_complete_group([base.format('nrca5')])
+    assert is_complete_group([base.format('nrca5'), base.format('nrcb5')])
+
+    module_a = set('NRCA{}'.format(number) for number in range(1, 6))
+    assert is_complete_group(short_wave[:4], expected=module_a)
+    assert not is_complete_group(short_wave[:3], expected=module_a)
+    assert is_complete_group([base.format('nrca5')], expected=module_a)
+
+
+def test_preview_watcher(tmpdir):
+    """Make sure files are only rendered once they have settled, that
+    incomplete NIRCam groups are held, and that the number of groups
+    in flight is bounded.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    filesystem = os.path.join(str(tmpdir), 'filesystem')
+    directory = os.path.join(filesystem, 'jw00327')
+    os.makedirs(directory)
+
+    def write(exposure, detector, age):
+        filename = os.path.join(directory, 'jw00327001001_02101_{:05d}_{}_rate.fits'.format(
+            exposure, detector))
+        with open(filename, 'w') as fits_file:
+            fits_file.write('data')
+        os.utime(filename, (now - age, now - age))
+        return filename
+
+    now = os.stat(directory).st_mtime
+    old_file = write(1, 'mirimage', 100.)
+    new_file = write(2, 'mirimage', 1.)
+    nircam_file = write(3, 'nrca5', 100.)
+    write(4, 'nis', 100.)
+
+    watcher = PreviewWatcher(filesystem, str(tmpdir), str(tmpdir), max_pending=1, settle_time=30.,
+                             group_timeout=600., poll=True,
+                             manifest_filename=os.path.join(str(tmpdir), 'manifest.db'))
+    watcher.pool = _RecordingPool()
+    watcher.scan()
+    assert len(watcher.pending) == 4
+
+    # Only one group may be in flight, and the new file is still settling
+    watcher.check_pending(now)
+    assert [task[0] for task in watcher.pool.tasks] == [[old_file]]
+    watcher.in_flight = []
+    watcher.check_pending(now)
+    assert len(watcher.pool.tasks) == 2
+    assert watcher.pool.tasks[1][0][0].endswith('nis_rate.fits')
+    watcher.in_flight = []
+
+    # The NIRCam group waits for its second detector, or for the timeout
+    watcher.check_pending(now)
+    assert len(watcher.pool.tasks) == 2
+    watcher.check_pending(now + 600.)
+    watcher.in_flight = []
+    watcher.check_pending(now + 600.)
+    assert [task[0] for task in watcher.pool.tasks[2:]] == [[new_file], [nircam_file]]
+    assert len(watcher.pending) == 0
+
+    # The files of submitted groups are forgotten
+    assert watcher.signatures == {}
+
+    # The next exposure of the activity only waits for the detectors
+    # the first one used
+    watcher.in_flight = []
+    next_file = write(5, 'nrca5', 100.)
+    watcher.observe(next_file)
+    watcher.check_pending(now)
+    assert watcher.pool.tasks[4][0] == [next_file]
+
+    # Groups rendered by another process are not rendered again
+    watcher.in_flight = []
+    rendered_file = write(6, 'mirimage', 100.)
+    watcher.manifest.record(file_signatures([rendered_file]), PREVIEW_PARAMETERS)
+    watcher.observe(rendered_file)
+    watcher.check_pending(now)
+    assert len(watcher.pool.tasks) == 5
+    assert len(watcher.pending) == 0
+
+
+def test_preview_watcher_worker(tmpdir):
+    """Make sure the calls the watcher hands to the pool render the
+    group with the actual worker function.
+
+    Parameters
+    ----------
+    tmpdir : obj
+        ``pytest`` temporary directory
+    """
+
+    filesystem = os.path.join(str(tmpdir), 'filesystem')
+    directory = os.path.join(filesystem, 'jw00327')
+    os.makedirs(directory)
+    filename = os.path.join(directory, 'jw00327001001_02101_00001_mirimage_rate.fits')
+    primary = fits.PrimaryHDU()
+    primary.header['SUBSTRT1'] = 1
+    primary.header['SUBSTRT2'] = 1
+    primary.header['SUBSIZE1'] = 64
+    primary.header['SUBSIZE2'] = 64
+    data = np.random.RandomState(0).uniform(0, 1000, (64, 64)).astype(np.float32)
+    sci = fits.ImageHDU(data, name='SCI')
+    dq = fits.ImageHDU(np.zeros((64, 64), dtype=np.uint32), name='PIXELDQ')
+    fits.HDUList([primary, sci, dq]).writeto(filename)
+
+    preview_filesystem = os.path.join(str(tmpdir), 'preview_images')
+    thumbnail_filesystem = os.path.join(str(tmpdir), 'thumbnails')
+    watcher = PreviewWatcher(filesystem, preview_filesystem, thumbnail_filesystem,
+                             settle_time=0., poll=True,
+                             manifest_filename=os.path.join(str(tmpdir), 'manifest.db'))
+    watcher.pool = _RecordingPool()
+    watcher.scan()
+    watcher.check_pending(os.stat(filename).st_mtime + 1.)
+    assert watcher.pool.tasks[0][0] == [filename]
+
+    function, args = watcher.pool.calls[0]
+    status, records = function(*args)
+    assert status == 'rendered'
+    assert len(glob.glob(os.path.join(preview_filesystem, 'jw00327', '*.jpg'))) == 1
+    assert len(glob.glob(os.path.join(thumbnail_filesystem, 'jw00327', '*.thumb'))) == 1
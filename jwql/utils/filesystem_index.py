@@ -0,0 +1,364 @@
+"""Persistent index of the files in the ``jwql`` filesystem and the
+preview image and thumbnail stores.
+
+The files of each store are recorded in a SQLite database, indexed by
+program, rootname, detector, instrument and suffix. Updates are
+incremental: only the proposal directories whose modification time has
+changed are listed again.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.filesystem_index import FilesystemIndex, get_index_filename
+
+        index = FilesystemIndex(get_index_filename())
+        index.refresh('filesystem', '/path/to/filesystem', max_age=60.)
+        filepaths = index.query('filesystem', instrument='nircam', extension='fits')
+"""
+
+import os
+import time
+
+from jwql.utils.constants import JWST_INSTRUMENT_NAMES_SHORTHAND
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+# Columns of the files table that can be filtered on by FilesystemIndex.query
+QUERY_COLUMNS = ['program', 'rootname', 'detector', 'instrument', 'suffix', 'extension']
+
+
+def get_index_filename():
+    """Return the location of the filesystem index. This is the
+    ``filesystem_index`` entry of the config file, if present, and
+    ``<outputs>/index_filesystem/filesystem_index.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the index database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'index_filesystem', 'filesystem_index.db')
+
+    return settings.get('filesystem_index', default)
+
+
+def parse_indexed_filename(filename):
+    """Split a filename into the columns of the index, without
+    requiring it to follow the JWST naming convention exactly.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file, e.g.
+        ``jw00327001001_02101_00001_nrca1_rate_integ0.jpg``
+
+    Returns
+    -------
+    columns : dict
+        The ``rootname`` (the first four parts of the name, e.g.
+        ``jw00327001001_02101_00001_nrca1``), lowercase ``detector``,
+        ``instrument``, ``suffix`` (e.g. ``rate``) and ``extension``
+        (e.g. ``jpg``) of the file. Parts that are missing are empty
+        strings.
+    """
+
+    stem, extension = os.path.splitext(filename)
+    parts = stem.split('_')
+    detector = parts[3].lower() if len(parts) > 3 else ''
+
+    return {'rootname': '_'.join(parts[:4]),
+            'detector': detector,
+            'instrument': JWST_INSTRUMENT_NAMES_SHORTHAND.get(detector[:3], ''),
+            'suffix': parts[4].lower() if len(parts) > 4 else '',
+            'extension': extension[1:].lower()}
+
+
+class FilesystemIndex(SQLiteStore):
+    """The files of the ``jwql`` filesystem and image stores.
+
+    Methods
+    -------
+    directories(store)
+        Return the indexed proposal directories of a store
+    query(store, pattern, **filters)
+        Return the paths of the indexed files that match
+    refresh(store, top, max_age)
+        Update the index of a store if its last update is too old
+    update(store, top, full)
+        Bring the index of a store up to date
+    version(store)
+        Return the generation of the index of a store
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS stores ('
+              'store TEXT PRIMARY KEY, '
+              'top TEXT NOT NULL, '
+              'updated REAL NOT NULL)',
+              'CREATE TABLE IF NOT EXISTS generations ('
+              'store TEXT PRIMARY KEY, '
+              'generation INTEGER NOT NULL, '
+              'changed REAL NOT NULL)',
+              'CREATE TABLE IF NOT EXISTS directories ('
+              'store TEXT NOT NULL, '
+              'directory TEXT NOT NULL, '
+              'mtime REAL NOT NULL, '
+              'PRIMARY KEY (store, directory))',
+              'CREATE TABLE IF NOT EXISTS files ('
+              'store TEXT NOT NULL, '
+              'directory TEXT NOT NULL, '
+              'filename TEXT NOT NULL, '
+              'program TEXT NOT NULL, '
+              'rootname TEXT NOT NULL, '
+              'detector TEXT NOT NULL, '
+              'instrument TEXT NOT NULL, '
+              'suffix TEXT NOT NULL, '
+              'extension TEXT NOT NULL, '
+              'PRIMARY KEY (store, filename))',
+              'CREATE INDEX IF NOT EXISTS files_program ON files (store, program)',
+              'CREATE INDEX IF NOT EXISTS files_rootname ON files (store, rootname)',
+              'CREATE INDEX IF NOT EXISTS files_detector ON files (store, detector)',
+              'CREATE INDEX IF NOT EXISTS files_instrument ON files (store, instrument)',
+              'CREATE INDEX IF NOT EXISTS files_suffix ON files (store, suffix)']
+
+    def _forget_directory(self, store, directory):
+        """Remove a directory and its files from the index.
+
+        Returns
+        -------
+        removed : int
+            Number of files removed
+        """
+
+        with self.connect() as connection:
+            connection.execute('DELETE FROM directories WHERE store = ? AND directory = ?',
+                               (store, directory))
+            cursor = connection.execute('DELETE FROM files WHERE store = ? AND directory = ?',
+                                        (store, directory))
+            return cursor.rowcount
+
+    def _index_directory(self, store, top, directory, mtime):
+        """List a directory, and add its new files to and remove its
+        deleted files from the index in one transaction.
+
+        Returns
+        -------
+        added : int
+            Number of files added
+        removed : int
+            Number of files removed
+        """
+
+        program = directory[2:] if directory.startswith('jw') else directory
+        filenames = set(entry.name for entry in os.scandir(os.path.join(top, directory))
+                        if entry.is_file())
+
+        with self.connect() as connection:
+            indexed = set(row[0] for row in connection.execute(
+                'SELECT filename FROM files WHERE store = ? AND directory = ?', (store, directory)))
+
+            new_rows = []
+            for filename in sorted(filenames - indexed):
+                columns = parse_indexed_filename(filename)
+                new_rows.append((store, directory, filename, program, columns['rootname'],
+                                 columns['detector'], columns['instrument'], columns['suffix'],
+                                 columns['extension']))
+            connection.executemany('INSERT OR REPLACE INTO files (store, directory, filename, '
+                                   'program, rootname, detector, instrument, suffix, extension) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', new_rows)
+
+            deleted = sorted(indexed - filenames)
+            connection.executemany('DELETE FROM files WHERE store = ? AND directory = ? '
+                                   'AND filename = ?',
+                                   [(store, directory, filename) for filename in deleted])
+            connection.execute('INSERT OR REPLACE INTO directories VALUES (?, ?, ?)',
+                               (store, directory, mtime))
+
+        return len(new_rows), len(deleted)
+
+    def directories(self, store):
+        """Return the indexed proposal directories of a store.
+
+        Parameters
+        ----------
+        store : str
+            Name of the store, e.g. ``filesystem``
+
+        Returns
+        -------
+        directories : list
+            Sorted names of the directories, e.g. ``jw00327``
+        """
+
+        with self.connect() as connection:
+            rows = connection.execute('SELECT directory FROM directories WHERE store = ? '
+                                      'ORDER BY directory', (store,))
+            return [row[0] for row in rows]
+
+    def query(self, store, pattern=None, after=None, limit=None, **filters):
+        """Return the paths of the indexed files of a store that match
+        the given filters.
+
+        Parameters
+        ----------
+        store : str
+            Name of the store
+        pattern : str
+            Glob pattern (e.g. ``jw00327*rate*.thumb``) that the
+            filenames must match. Patterns that begin with a fixed
+            prefix are answered from the primary key index.
+        after : str
+            If given, only the files whose names sort after it are
+            returned, so that a listing can be read page by page
+        limit : int
+            If given, the largest number of files to return
+        **filters : dict
+            Values of the columns listed in ``QUERY_COLUMNS`` that the
+            files must have, e.g. ``instrument='nircam'``
+
+        Returns
+        -------
+        filepaths : list
+            Full paths of the matching files, sorted by filename
+        """
+
+        unknown = set(filters) - set(QUERY_COLUMNS)
+        if unknown:
+            raise ValueError('Cannot filter the index on {}'.format(', '.join(sorted(unknown))))
+
+        conditions = ['files.store = ?']
+        values = [store]
+        for column in QUERY_COLUMNS:
+            if filters.get(column) is not None:
+                conditions.append('files.{} = ?'.format(column))
+                values.append(filters[column].lower() if column != 'rootname' else filters[column])
+        if pattern is not None:
+            conditions.append('files.filename GLOB ?')
+            values.append(pattern)
+        if after is not None:
+            conditions.append('files.filename > ?')
+            values.append(after)
+        query = ('SELECT stores.top, files.directory, files.filename FROM files '
+                 'JOIN stores ON stores.store = files.store WHERE {} '
+                 'ORDER BY files.filename'.format(' AND '.join(conditions)))
+        if limit is not None:
+            query += ' LIMIT ?'
+            values.append(limit)
+
+        with self.connect() as connection:
+            rows = connection.execute(query, values)
+            return [os.path.join(*row) for row in rows]
+
+    def refresh(self, store, top, max_age=60.):
+        """Update the index of a store if it was last updated more than
+        ``max_age`` seconds ago, or never.
+
+        Parameters
+        ----------
+        store : str
+            Name of the store
+        top : str
+            Top-level directory of the store
+        max_age : float
+            Largest age in seconds of the index
+
+        Returns
+        -------
+        updated : bool
+            ``True`` if the index was updated
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT top, updated FROM stores WHERE store = ?',
+                                     (store,)).fetchone()
+        if row is not None and row[0] == top and time.time() - row[1] <= max_age:
+            return False
+
+        self.update(store, top)
+        return True
+
+    def update(self, store, top, full=False):
+        """Bring the index of a store up to date. Only the proposal
+        directories whose modification time has changed since the last
+        update are listed, unless ``full`` is ``True``.
+
+        Parameters
+        ----------
+        store : str
+            Name of the store, e.g. ``filesystem``
+        top : str
+            Top-level directory of the store
+        full : bool
+            If ``True``, list every directory again
+
+        Returns
+        -------
+        added : int
+            Number of files added to the index
+        removed : int
+            Number of files removed from the index
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT top FROM stores WHERE store = ?', (store,)).fetchone()
+            if row is not None and row[0] != top:
+                # The store has moved, so the whole index of it is stale
+                full = True
+            indexed = dict(connection.execute('SELECT directory, mtime FROM directories '
+                                              'WHERE store = ?', (store,)))
+
+        current = {}
+        if os.path.isdir(top):
+            for entry in os.scandir(top):
+                if entry.is_dir():
+                    current[entry.name] = entry.stat().st_mtime
+
+        added, removed = 0, 0
+        for directory in sorted(set(indexed) - set(current)):
+            removed += self._forget_directory(store, directory)
+        for directory, mtime in sorted(current.items()):
+            if full or indexed.get(directory) != mtime:
+                directory_added, directory_removed = self._index_directory(store, top, directory,
+                                                                           mtime)
+                added += directory_added
+                removed += directory_removed
+
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO stores VALUES (?, ?, ?)', (store, top, now))
+            if row is None or added + removed > 0:
+                connection.execute('INSERT OR IGNORE INTO generations VALUES (?, 0, 0)', (store,))
+                connection.execute('UPDATE generations SET generation = generation + 1, '
+                                   'changed = ? WHERE store = ?', (now, store))
+
+        return added, removed
+
+    def version(self, store):
+        """Return the generation of the index of a store, which is
+        incremented by every update that adds or removes files, so that
+        listings of the store can be validated without querying it.
+
+        Parameters
+        ----------
+        store : str
+            Name of the store
+
+        Returns
+        -------
+        generation : int
+            Number of updates that changed the index, 0 if the store
+            was never indexed
+        changed : float
+            Time of the last change, 0 if the store was never indexed
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT generation, changed FROM generations WHERE store = ?',
+                                     (store,)).fetchone()
+
+        return (0, 0.) if row is None else row
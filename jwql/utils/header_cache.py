@@ -0,0 +1,180 @@
+"""Persistent cache of the primary header keywords of FITS files.
+
+The values of ``HEADER_KEYWORDS`` are kept in a SQLite database keyed
+by the path, size and modification time of each file, so that a
+replaced file is read again. The full header text is only kept for
+files whose header page has been viewed.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.header_cache import HeaderCache, get_header_cache_filename
+
+        cache = HeaderCache(get_header_cache_filename())
+        keywords = cache.keywords(filepaths)
+        expstart = keywords[filepaths[0]]['EXPSTART']
+        header = cache.header(filepaths[0])
+"""
+
+import json
+import os
+
+from astropy.io import fits
+
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+# Keywords of the primary header whose values are cached
+HEADER_KEYWORDS = ['DATE-OBS', 'DETECTOR', 'EFFEXPTM', 'EXPEND', 'EXPSTART', 'FILTER',
+                   'INSTRUME', 'NGROUPS', 'NINTS', 'PUPIL', 'READPATT', 'SUBARRAY', 'TIME-OBS']
+
+# Largest number of paths looked up in a single query
+QUERY_CHUNK_SIZE = 500
+
+
+def get_header_cache_filename():
+    """Return the location of the header cache database. This is the
+    ``header_cache`` entry of the config file, if present, and
+    ``<outputs>/header_cache/header_cache.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the cache database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'header_cache', 'header_cache.db')
+
+    return settings.get('header_cache', default)
+
+
+def header_keywords(header):
+    """Return the values of the ``HEADER_KEYWORDS`` that are present in
+    a header.
+
+    Parameters
+    ----------
+    header : obj
+        ``astropy.io.fits.Header`` object
+
+    Returns
+    -------
+    keywords : dict
+        Values of the keywords, keyed by keyword. Values that cannot be
+        stored as JSON (e.g. undefined values) are converted to
+        strings.
+    """
+
+    keywords = {}
+    for keyword in HEADER_KEYWORDS:
+        if keyword in header:
+            value = header[keyword]
+            if not isinstance(value, (str, int, float, bool)):
+                value = str(value)
+            keywords[keyword] = value
+
+    return keywords
+
+
+class HeaderCache(SQLiteStore):
+    """The primary header keywords of FITS files.
+
+    Methods
+    -------
+    header(path)
+        Return the full primary header of a file as text
+    keywords(paths)
+        Return the cached keywords of several files
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS headers ('
+              'path TEXT PRIMARY KEY, '
+              'size INTEGER NOT NULL, '
+              'mtime REAL NOT NULL, '
+              'keywords TEXT NOT NULL, '
+              'header TEXT)']
+
+    def header(self, path):
+        """Return the full primary header of a file as text, reading
+        the file only if its header is not cached or the file has
+        changed.
+
+        Parameters
+        ----------
+        path : str
+            Path of the FITS file
+
+        Returns
+        -------
+        header : str
+            The primary header, one card per line
+        """
+
+        status = os.stat(path)
+        with self.connect() as connection:
+            row = connection.execute('SELECT size, mtime, header FROM headers WHERE path = ?',
+                                     (path,)).fetchone()
+        if row is not None and row[:2] == (status.st_size, status.st_mtime) and row[2] is not None:
+            return row[2]
+
+        header = fits.getheader(path, ext=0)
+        text = header.tostring(sep='\n')
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?)',
+                               (path, status.st_size, status.st_mtime,
+                                json.dumps(header_keywords(header)), text))
+
+        return text
+
+    def keywords(self, paths):
+        """Return the values of the ``HEADER_KEYWORDS`` of several
+        files. Only the files that are not cached, or that have changed
+        since they were cached, are read, and they are added to the
+        cache in a single transaction.
+
+        Parameters
+        ----------
+        paths : list
+            Paths of the FITS files
+
+        Returns
+        -------
+        keywords : dict
+            The output of ``header_keywords`` for each file, keyed by
+            path
+        """
+
+        signatures = {}
+        for path in paths:
+            status = os.stat(path)
+            signatures[path] = (status.st_size, status.st_mtime)
+        unique_paths = list(signatures)
+
+        keywords = {}
+        with self.connect() as connection:
+            for start in range(0, len(unique_paths), QUERY_CHUNK_SIZE):
+                chunk = unique_paths[start:start + QUERY_CHUNK_SIZE]
+                rows = connection.execute(
+                    'SELECT path, size, mtime, keywords FROM headers WHERE path IN ({})'.format(
+                        ', '.join(['?'] * len(chunk))), chunk)
+                for path, size, mtime, values in rows:
+                    if signatures[path] == (size, mtime):
+                        keywords[path] = json.loads(values)
+
+        new_rows = []
+        for path in unique_paths:
+            if path not in keywords:
+                keywords[path] = header_keywords(fits.getheader(path, ext=0))
+                new_rows.append((path, signatures[path][0], signatures[path][1],
+                                 json.dumps(keywords[path]), None))
+        if len(new_rows) > 0:
+            with self.connect() as connection:
+                connection.executemany('INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?)',
+                                       new_rows)
+
+        return keywords
@@ -72,6 +72,27 @@ LOG_FILE_LOC = ''
 PRODUCTION_BOOL = ''
 
 
+class RecordCollector(logging.Handler):
+    """Logging handler that keeps the records emitted by a worker
+    process so that they can be sent back to the parent process, and
+    re-emitted there with ``logging.getLogger().handle(record)``.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+        self.records = []
+
+    def emit(self, record):
+        # Format the message and traceback now, since the arguments
+        # and exception info may not survive pickling
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
 def configure_logging(module, production_mode=True, path='./'):
     """Configure the log file with a standard logging format.
 
@@ -0,0 +1,338 @@
+"""Stale-while-revalidate cache of the results of MAST queries.
+
+Results are kept in a SQLite database along with the time they were
+fetched. A result younger than the time to live (TTL) is returned as
+is; an older one is returned immediately while a single background
+thread fetches a new one. Only one process fetches a given result at a
+time, and its claim is taken over once it is older than
+``refresh_timeout``.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.mast_cache import MastCache, get_mast_cache_filename
+
+        cache = MastCache(get_mast_cache_filename(), ttl=600.)
+        rootnames = cache.get('rootnames:Nircam', fetch_function)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+
+def get_mast_cache_filename():
+    """Return the location of the MAST cache database. This is the
+    ``mast_cache`` entry of the config file, if present, and
+    ``<outputs>/mast_cache/mast_cache.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the cache database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'mast_cache', 'mast_cache.db')
+
+    return settings.get('mast_cache', default)
+
+
+class MastCache(SQLiteStore):
+    """Results of MAST queries, refreshed after a time to live.
+
+    Attributes
+    ----------
+    ttl : float
+        Number of seconds after which a cached result is refreshed
+    refresh_timeout : float
+        Number of seconds after which a fetch that has not completed is
+        assumed to have failed, and may be claimed by another request
+    poll_interval : float
+        Number of seconds between checks of a fetch made by another
+        request
+    refresh_thread : obj
+        ``threading.Thread`` of the last background refresh started by
+        this object, or ``None``
+
+    Methods
+    -------
+    fetched(key)
+        Return the time a cached result was fetched
+    get(key, fetch)
+        Return the cached result of a query
+    invalidate(key)
+        Mark a cached result as stale
+    revalidate(key, fetch)
+        Return the time a cached result was fetched, refreshing it if
+        it is stale
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS results ('
+              'key TEXT PRIMARY KEY, '
+              'value TEXT, '
+              'fetched REAL NOT NULL, '
+              'refreshing REAL)']
+
+    def __init__(self, filename, ttl=600., refresh_timeout=300., poll_interval=0.1, timeout=30.,
+                 wal=False):
+        """Create the database if it does not exist.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the database file
+        ttl : float
+            Number of seconds after which a cached result is refreshed
+        refresh_timeout : float
+            Number of seconds after which an unfinished fetch may be
+            claimed by another request
+        poll_interval : float
+            Number of seconds between checks of a fetch made by
+            another request
+        timeout : float
+            Number of seconds to wait for a lock held by another
+            process
+        wal : bool
+            If ``True``, use the write-ahead log (see
+            ``jwql.utils.sqlite_store``)
+        """
+
+        super(MastCache, self).__init__(filename, timeout=timeout, wal=wal)
+        self.ttl = ttl
+        self.refresh_timeout = refresh_timeout
+        self.poll_interval = poll_interval
+        self.refresh_thread = None
+
+    def _claim(self, key):
+        """Claim the fetch of a result, unless another request has
+        claimed it less than ``refresh_timeout`` seconds ago.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+
+        Returns
+        -------
+        claimed : bool
+            ``True`` if the caller must fetch the result
+        """
+
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute('INSERT OR IGNORE INTO results VALUES (?, NULL, 0, NULL)', (key,))
+            cursor = connection.execute(
+                'UPDATE results SET refreshing = ? WHERE key = ? '
+                'AND (refreshing IS NULL OR refreshing < ?)',
+                (now, key, now - self.refresh_timeout))
+
+        return cursor.rowcount == 1
+
+    def _read(self, key):
+        """Return the cached entry of a result.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+
+        Returns
+        -------
+        entry : tuple
+            The value (``None`` if the result was never fetched), the
+            time it was fetched, and the time its current fetch was
+            claimed (``None`` if there is none), or ``None`` if the
+            key is not in the cache
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT value, fetched, refreshing FROM results WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+
+        value = None if row[0] is None else json.loads(row[0])
+
+        return value, row[1], row[2]
+
+    def _refresh(self, key, fetch):
+        """Fetch a result and store it, releasing the claim on its
+        fetch whether or not it succeeds.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+        fetch : func
+            Function without arguments that returns the result, which
+            must be serializable as JSON
+
+        Returns
+        -------
+        value : obj
+            The result, as it will be read back from the cache
+        """
+
+        try:
+            value = json.loads(json.dumps(fetch()))
+        except Exception:
+            with self.connect() as connection:
+                connection.execute('UPDATE results SET refreshing = NULL WHERE key = ?', (key,))
+            raise
+
+        with self.connect() as connection:
+            connection.execute('UPDATE results SET value = ?, fetched = ?, refreshing = NULL '
+                               'WHERE key = ?', (json.dumps(value), time.time(), key))
+
+        return value
+
+    def _start_refresh(self, key, fetch):
+        """Refresh a cached result in a background thread, if no
+        other request is already refreshing it.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+        fetch : func
+            Function that returns the result
+        """
+
+        if self._claim(key):
+            self.refresh_thread = threading.Thread(target=self._refresh_in_background,
+                                                   args=(key, fetch))
+            self.refresh_thread.daemon = True
+            self.refresh_thread.start()
+
+    def _refresh_in_background(self, key, fetch):
+        """The target of the background refresh threads. Errors are
+        logged, and the stale result is kept.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+        fetch : func
+            Function that returns the result
+        """
+
+        try:
+            self._refresh(key, fetch)
+        except Exception:
+            logging.exception('Could not refresh the cached MAST result {}'.format(key))
+
+    def fetched(self, key):
+        """Return the time a cached result was fetched, which changes
+        only when the result is refreshed.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+
+        Returns
+        -------
+        fetched : float
+            Time of the last fetch, or ``None`` if the result was never
+            fetched
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT fetched FROM results '
+                                     'WHERE key = ? AND value IS NOT NULL', (key,)).fetchone()
+
+        return None if row is None else row[0]
+
+    def get(self, key, fetch):
+        """Return the cached result of a query.
+
+        A result younger than ``ttl`` is returned as is. An older one
+        is returned too, after starting a background refresh if no
+        other request is already refreshing it. A result that is not
+        cached is fetched, unless another request is already fetching
+        it, in which case its result is awaited.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+        fetch : func
+            Function without arguments that sends the query and returns
+            the result, which must be serializable as JSON. Tuples and
+            sets are therefore returned as lists.
+
+        Returns
+        -------
+        value : obj
+            The result of the query
+        """
+
+        entry = self._read(key)
+        if entry is not None and entry[0] is not None:
+            value, fetched, refreshing = entry
+            if time.time() - fetched > self.ttl:
+                self._start_refresh(key, fetch)
+            return value
+
+        # Nothing to serve: fetch the result, or wait for the request
+        # that is fetching it
+        while True:
+            if self._claim(key):
+                return self._refresh(key, fetch)
+            time.sleep(self.poll_interval)
+            entry = self._read(key)
+            if entry is not None and entry[0] is not None:
+                return entry[0]
+
+    def invalidate(self, key):
+        """Mark a cached result as stale, so that the next request for
+        it starts a refresh.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+        """
+
+        with self.connect() as connection:
+            connection.execute('UPDATE results SET fetched = 0 WHERE key = ?', (key,))
+
+    def revalidate(self, key, fetch):
+        """Return the time a cached result was fetched, starting a
+        background refresh if it is stale, as ``get`` does, but without
+        reading the result itself. A result that is not cached yet is
+        fetched first.
+
+        Parameters
+        ----------
+        key : str
+            Name of the cached result
+        fetch : func
+            Function without arguments that sends the query and returns
+            the result
+
+        Returns
+        -------
+        fetched : float
+            Time of the last fetch
+        """
+
+        fetched = self.fetched(key)
+        if fetched is None:
+            self.get(key, fetch)
+            return self.fetched(key)
+
+        if time.time() - fetched > self.ttl:
+            self._start_refresh(key, fetch)
+
+        return fetched
@@ -0,0 +1,336 @@
+"""Track the use of preview images and thumbnails, and evict the least
+recently used ones when their stores exceed a size budget.
+
+``generate_preview_images`` writes one JPEG per integration of every
+file, so the ``preview_image_filesystem`` and ``thumbnail_filesystem``
+only ever grow. This module records when the images of an exposure
+were last viewed in the web app, measures the stores, and selects the
+exposures whose images can be removed to bring the stores back under a
+budget, least recently viewed first.
+
+The images of an exposure are pinned (never evicted) if they were
+created or viewed recently, or if they have never been viewed, so that
+new data are always available to be looked at. The preview manifest
+is left untouched when images are evicted, so ``generate_preview_images``
+does not create them again; instead, the web app re-renders them
+through the preview job queue when the exposure is viewed. The job
+queue only renders the preview images of single files, so thumbnails
+(which are listed before any exposure is viewed) and NIRCam mosaics,
+along with their tile pyramids, are always pinned.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.preview_cache import PreviewCache, get_cache_filename, scan_stores, \
+            select_evictions
+
+        cache = PreviewCache(get_cache_filename())
+        cache.touch('jw00327001001_02101_00001_nrca1')
+
+        exposures = scan_stores([preview_image_filesystem, thumbnail_filesystem])
+        evictions, remaining = select_evictions(exposures, cache.last_access(), budget)
+"""
+
+import os
+import shutil
+import time
+
+from jwql.utils.constants import JWST_INSTRUMENT_NAMES_SHORTHAND
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+
+def directory_size(directory):
+    """Return the total size of the files in a directory tree.
+
+    Parameters
+    ----------
+    directory : str
+        Path of the directory
+
+    Returns
+    -------
+    size : int
+        Size in bytes
+    """
+
+    size = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            size += os.path.getsize(os.path.join(root, filename))
+
+    return size
+
+
+def evict(exposures, keys):
+    """Remove the images of the given exposures, except for the
+    pinned thumbnails and mosaics (see ``is_pinned``).
+
+    Parameters
+    ----------
+    exposures : dict
+        The output of ``scan_stores``
+    keys : list
+        The exposures to evict
+
+    Returns
+    -------
+    size : int
+        Number of bytes removed
+    """
+
+    size = 0
+    for key in keys:
+        for path in exposures[key]['paths']:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        size += exposures[key]['size'] - exposures[key]['pinned_size']
+
+    return size
+
+
+def exposure_root(filename):
+    """Return the part of a filename that identifies the exposure, e.g.
+    ``jw00327001001_02101_00001`` for the preview image
+    ``jw00327001001_02101_00001_nrca1_rate_integ0.jpg`` or the mosaic
+    ``jw00327001001_02101_00001_NRC_SW_MOSAIC_rate_integ0.jpg``.
+
+    Parameters
+    ----------
+    filename : str
+        Name or path of a file, or a file root
+
+    Returns
+    -------
+    root : str
+        The exposure part of the filename
+    """
+
+    return '_'.join(os.path.basename(filename).split('_')[:3])
+
+
+def get_cache_filename():
+    """Return the location of the preview cache database. This is the
+    ``preview_cache`` entry of the config file, if present, and
+    ``<outputs>/manage_preview_cache/preview_cache.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the cache database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'manage_preview_cache', 'preview_cache.db')
+
+    return settings.get('preview_cache', default)
+
+
+def instrument_from_filename(filename):
+    """Return the instrument of a preview image or thumbnail, based on
+    the detector part of its name.
+
+    Parameters
+    ----------
+    filename : str
+        Name or path of the image
+
+    Returns
+    -------
+    instrument : str
+        Name of the instrument, e.g. ``nircam``, or ``unknown``
+    """
+
+    parts = os.path.basename(filename).split('_')
+    if len(parts) < 4:
+        return 'unknown'
+
+    return JWST_INSTRUMENT_NAMES_SHORTHAND.get(parts[3][:3].lower(), 'unknown')
+
+
+def is_pinned(filename):
+    """Return whether an image is never evicted, because it would not
+    be rendered again when its exposure is viewed. This is the case for
+    thumbnails, and for NIRCam mosaics and their tile pyramids and
+    statistics.
+
+    Parameters
+    ----------
+    filename : str
+        Name or path of the image
+
+    Returns
+    -------
+    pinned : bool
+        ``True`` if the image is never evicted
+    """
+
+    filename = os.path.basename(filename)
+
+    return filename.endswith('.thumb') or '_MOSAIC_' in filename
+
+
+class PreviewCache(SQLiteStore):
+    """The times at which the images of each exposure were last viewed.
+
+    Methods
+    -------
+    last_access()
+        Return the time of the last view of each exposure
+    touch(file_root, min_interval)
+        Record that the images of an exposure are being viewed
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS access ('
+              'exposure TEXT PRIMARY KEY, '
+              'accessed REAL NOT NULL)']
+
+    def last_access(self):
+        """Return the time of the last view of each exposure.
+
+        Returns
+        -------
+        last_access : dict
+            Times in seconds since the epoch, keyed by exposure root
+        """
+
+        with self.connect() as connection:
+            return dict(connection.execute('SELECT exposure, accessed FROM access'))
+
+    def touch(self, file_root, min_interval=300.):
+        """Record that the images of an exposure are being viewed. The
+        time is not written again if the recorded view is more recent
+        than ``min_interval``, which is far below the time scale of
+        eviction, so that repeated views do not take the write lock.
+
+        Parameters
+        ----------
+        file_root : str
+            The file root (or any filename) of the exposure
+        min_interval : float
+            Number of seconds during which a recorded view is not
+            updated
+
+        Returns
+        -------
+        recorded : bool
+            ``True`` if the time of the view was written
+        """
+
+        exposure = exposure_root(file_root)
+        now = time.time()
+        with self.connect() as connection:
+            row = connection.execute('SELECT accessed FROM access WHERE exposure = ?',
+                                     (exposure,)).fetchone()
+            if row is not None and now - row[0] < min_interval:
+                return False
+            connection.execute('INSERT OR REPLACE INTO access VALUES (?, ?)', (exposure, now))
+
+        return True
+
+
+def scan_stores(directories):
+    """Measure the images in the preview image and thumbnail stores,
+    per exposure.
+
+    Parameters
+    ----------
+    directories : list
+        Top-level directories of the stores. Each holds one
+        subdirectory per proposal.
+
+    Returns
+    -------
+    exposures : dict
+        For each exposure root, a dictionary with its ``proposal``,
+        ``instrument``, total ``size`` in bytes, the ``pinned_size`` of
+        its pinned images, number of ``files``, the most recent
+        modification time ``mtime`` of its images, and the ``paths`` of
+        its images that may be evicted
+    """
+
+    exposures = {}
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for proposal in os.scandir(directory):
+            if not proposal.is_dir():
+                continue
+            for entry in os.scandir(proposal.path):
+                if not entry.name.startswith('jw'):
+                    continue
+                key = exposure_root(entry.name)
+                instrument = instrument_from_filename(entry.name)
+                exposure = exposures.setdefault(key, {'proposal': proposal.name,
+                                                      'instrument': instrument,
+                                                      'size': 0, 'pinned_size': 0, 'files': 0,
+                                                      'mtime': 0., 'paths': []})
+                status = entry.stat()
+                if entry.is_dir():
+                    size = directory_size(entry.path)
+                else:
+                    size = status.st_size
+                    exposure['files'] += 1
+                exposure['size'] += size
+                exposure['mtime'] = max(exposure['mtime'], status.st_mtime)
+                if is_pinned(entry.name):
+                    exposure['pinned_size'] += size
+                else:
+                    exposure['paths'].append(entry.path)
+
+    return exposures
+
+
+def select_evictions(exposures, last_access, budget, pin_days=30., now=None):
+    """Select the exposures whose images are removed to bring the total
+    size of the stores within ``budget``, least recently viewed first.
+    Exposures are pinned if they have never been viewed, or if their
+    images were created or viewed within the last ``pin_days`` days.
+    Only the images that are not pinned by ``is_pinned`` are evicted.
+
+    Parameters
+    ----------
+    exposures : dict
+        The output of ``scan_stores``
+    last_access : dict
+        The output of ``PreviewCache.last_access``
+    budget : int
+        Largest total size of the stores in bytes
+    pin_days : float
+        Number of days during which new or viewed images are pinned
+    now : float
+        The current time. Defaults to ``time.time()``.
+
+    Returns
+    -------
+    evictions : list
+        Exposure roots to evict, in order of eviction
+    remaining : int
+        Total size in bytes of the stores after the evictions. It
+        exceeds ``budget`` if the pinned images alone do.
+    """
+
+    if now is None:
+        now = time.time()
+    pinned_since = now - pin_days * 86400.
+
+    candidates = [key for key, exposure in exposures.items()
+                  if key in last_access and last_access[key] < pinned_since
+                  and exposure['mtime'] < pinned_since and len(exposure['paths']) > 0]
+    candidates.sort(key=lambda key: last_access[key])
+
+    remaining = sum(exposure['size'] for exposure in exposures.values())
+    evictions = []
+    for key in candidates:
+        if remaining <= budget:
+            break
+        evictions.append(key)
+        remaining -= exposures[key]['size'] - exposures[key]['pinned_size']
+
+    return evictions, remaining
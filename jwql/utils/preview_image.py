@@ -14,6 +14,40 @@ The lower and upper limits to be displayed are defined as the
 version of the image, with accompanying colorbar. The image is then
 saved.
 
+Thumbnails can alternatively be rendered without ``matplotlib`` by
+setting the ``engine`` attribute to ``direct``. In that case the
+clipped and scaled frame is mapped through a precomputed colormap
+lookup table straight into an 8-bit RGB buffer, which is written with
+``Pillow``. Full preview images carry axes, a title and a colorbar, so
+they are always created with ``matplotlib``.
+
+For large images (e.g. NIRCam mosaics), a deep-zoom (DZI) tile pyramid
+of the rendered frame can be written alongside the preview image by
+setting ``tile_output_directory``, so that a browser only needs to
+fetch the tiles in view.
+
+If ``stats_output_directory`` is set, statistics of each integration
+(the display limits, a set of percentiles, a compact histogram and the
+number of science pixels) are saved to a JSON sidecar file, keyed by
+the size and modification time of the input file. Later renders of the
+same file reuse the display limits from the sidecar, and other tools
+can read the statistics with ``load_statistics`` without opening the
+FITS file.
+
+The memory taken by the data of a file can be bounded by setting
+``memory_limit``. If the first and last groups of all integrations of
+a ramp would not fit within the limit, the difference images are
+instead computed straight from the file, a block of rows at a time,
+into a single preallocated ``float32`` array. That array is itself
+memory-mapped to a scratch file if it would take more than half of the
+limit.
+
+Files with many integrations (e.g. time series observations) can be
+rendered by several processes at once by setting ``workers``. The
+difference images are written once to a memory-mapped scratch file,
+from which each worker process reads only the integrations it renders.
+The same pool of processes can serve many files by setting ``pool``.
+
 Authors:
 --------
 
@@ -34,25 +68,326 @@ Use:
         im.make_image()
 """
 
+from contextlib import ExitStack
+from functools import lru_cache
+import json
 import logging
+import multiprocessing
 import os
+import shutil
 import socket
+import tempfile
 
 from astropy.io import fits
 import numpy as np
+from PIL import Image
 
 from jwql.utils import permissions
+from jwql.utils.logging_functions import RecordCollector
 
 # Use the 'Agg' backend to avoid invoking $DISPLAY
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import matplotlib.cm as cm
 import matplotlib.colors as colors
 
 # Only import jwst if not running from readthedocs
 if 'build' and 'project' and 'jwql' not in socket.gethostname():
     from jwst.datamodels import dqflags
 
+# Number of pixels sampled to bracket the display limits in find_limits
+BRACKET_SAMPLE_SIZE = 20000
+
+# Number of bins of the histogram in the statistics sidecar files
+HISTOGRAM_BINS = 64
+
+# Number of entries in the colormap lookup table of the direct engine
+LUT_SIZE = 256
+
+# Percentiles of the science pixels in the statistics sidecar files
+STATISTICS_PERCENTILES = [0.1, 0.5, 1., 5., 25., 50., 75., 95., 99., 99.5, 99.9]
+
+
+def block_average(image, factor):
+    """Downsample ``image`` by averaging blocks of ``factor`` x
+    ``factor`` pixels. Images whose dimensions are not a multiple of
+    ``factor`` are padded by repeating their edge pixels.
+
+    Parameters
+    ----------
+    image : obj
+        2D ``numpy`` ``ndarray``, or 3D ``ndarray`` whose last axis
+        holds color channels (e.g. the output of
+        ``PreviewImage.make_rgb``)
+    factor : int
+        Downsampling factor
+
+    Returns
+    -------
+    downsampled : obj
+        ``numpy`` ``ndarray`` with the same dtype as ``image``
+    """
+    if factor <= 1:
+        return image
+
+    ny, nx = image.shape[:2]
+    pad_y = -ny % factor
+    pad_x = -nx % factor
+    if pad_y or pad_x:
+        padding = [(0, pad_y), (0, pad_x)] + [(0, 0)] * (image.ndim - 2)
+        image = np.pad(image, padding, mode='edge')
+
+    blocks = image.reshape(((ny + pad_y) // factor, factor, (nx + pad_x) // factor, factor)
+                           + image.shape[2:])
+    if np.issubdtype(image.dtype, np.integer):
+        # Integer mean with rounding, avoiding a floating point copy
+        npix = factor * factor
+        total = blocks.sum(axis=(1, 3), dtype=np.uint64)
+        return ((total + npix // 2) // npix).astype(image.dtype)
+    else:
+        return blocks.mean(axis=(1, 3), dtype=image.dtype)
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(cmap, ncolors=LUT_SIZE):
+    """Return a lookup table that maps indices ``0`` to ``ncolors - 1``
+    onto the RGB values of the given ``matplotlib`` colormap.
+
+    Parameters
+    ----------
+    cmap : str
+        Name of the ``matplotlib`` colormap
+    ncolors : int
+        Number of entries in the lookup table
+
+    Returns
+    -------
+    lut : obj
+        ``(ncolors, 3)`` ``numpy`` ``ndarray`` of ``uint8`` RGB values
+    """
+    colormap = plt.get_cmap(cmap, ncolors)
+    lut = np.round(colormap(np.arange(ncolors))[:, :3] * 255)
+    return lut.astype(np.uint8)
+
+
+def frame_statistics(frame, pixmap, min_value, max_value):
+    """Compute the statistics of the science pixels of a frame that are
+    saved in the statistics sidecar files.
+
+    Parameters
+    ----------
+    frame : obj
+        2D ``numpy`` ``ndarray`` of the frame
+    pixmap : obj
+        2D boolean ``ndarray``, ``True`` for science pixels
+    min_value : float
+        Minimum value for display
+    max_value : float
+        Maximum value for display
+
+    Returns
+    -------
+    statistics : dict
+        The display ``limits``, the number of finite
+        ``science_pixels``, the ``percentiles`` listed in
+        ``STATISTICS_PERCENTILES`` (keyed by their string
+        representation), and a ``histogram`` of ``HISTOGRAM_BINS``
+        bins between the display limits, with the number of pixels
+        ``below`` and ``above`` them
+    """
+    pixels = frame[pixmap]
+    pixels = pixels[np.isfinite(pixels)]
+
+    statistics = {'limits': [float(min_value), float(max_value)],
+                  'science_pixels': int(pixels.size),
+                  'percentiles': {},
+                  'histogram': {'counts': [], 'below': 0, 'above': 0}}
+    if pixels.size == 0:
+        return statistics
+
+    values = np.percentile(pixels, STATISTICS_PERCENTILES)
+    statistics['percentiles'] = {str(percentile): float(value)
+                                 for percentile, value in zip(STATISTICS_PERCENTILES, values)}
+
+    if max_value > min_value:
+        counts, _ = np.histogram(pixels, bins=HISTOGRAM_BINS, range=(min_value, max_value))
+        statistics['histogram'] = {'counts': counts.tolist(),
+                                   'below': int(np.sum(pixels < min_value)),
+                                   'above': int(np.sum(pixels > max_value))}
+
+    return statistics
+
+
+def load_statistics(filename, directory):
+    """Read the statistics sidecar file of a FITS file, if it exists
+    and was made from the current version of the file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file
+    directory : str
+        Directory of the sidecar file
+
+    Returns
+    -------
+    statistics : dict
+        The contents of the sidecar file: the ``file``, its ``size``
+        and ``mtime``, and the statistics of each integration (see
+        ``frame_statistics``) keyed by integration number, along with
+        the ``clip_percent`` and ``limits_method`` used to find the
+        display limits. ``None`` if there is no sidecar file or the
+        FITS file has changed since it was written.
+    """
+    stats_file = statistics_filename(filename, directory)
+    if not os.path.isfile(stats_file) or not os.path.isfile(filename):
+        return None
+
+    try:
+        with open(stats_file) as json_file:
+            statistics = json.load(json_file)
+    except ValueError:
+        logging.warning('Ignoring unreadable statistics file {}'.format(stats_file))
+        return None
+
+    status = os.stat(filename)
+    if statistics.get('size') != status.st_size or statistics.get('mtime') != status.st_mtime:
+        return None
+
+    return statistics
+
+
+def scale_image(image, min_value, max_value, scale):
+    """Clip ``image`` to the given display limits and scale it to the
+    range ``0`` to ``1``, reproducing the normalization used for the
+    ``matplotlib`` figures.
+
+    Parameters
+    ----------
+    image : obj
+        2D ``numpy`` ``ndarray`` of floats
+    min_value : float
+        Minimum value for display
+    max_value : float
+        Maximum value for display
+    scale : str
+        Image scaling (``log``, ``linear``)
+
+    Returns
+    -------
+    scaled : obj
+        2D ``numpy`` ``ndarray`` of ``float32`` values between ``0``
+        and ``1``. Pixels that are ``NaN`` in ``image`` remain ``NaN``.
+    """
+    if scale not in ['linear', 'log']:
+        raise ValueError(('WARNING: scaling option {} not supported.'.format(scale)))
+
+    scaled = np.clip(image, min_value, max_value).astype(np.float32)
+    scaled -= min_value
+    if max_value <= min_value:
+        scaled *= 0.
+    elif scale == 'log':
+        # Same shift as in make_figure, so that the data range starts at 1
+        shiftmax = max_value - min_value + 1
+        np.log1p(scaled, out=scaled)
+        scaled /= np.log(shiftmax)
+    else:
+        scaled /= (max_value - min_value)
+
+    return scaled
+
+
+def sample_size_for_error(error, confidence=0.99):
+    """Return the number of pixels to sample so that, with probability
+    ``confidence``, the rank of a sampled percentile is within
+    ``error`` (a fraction of the pixels) of the requested rank.
+
+    The bound follows from the Dvoretzky-Kiefer-Wolfowitz inequality
+    and does not depend on the number of pixels in the image.
+
+    Parameters
+    ----------
+    error : float
+        Tolerated rank error, e.g. ``0.001`` for 0.1% of the pixels
+    confidence : float
+        Probability that the rank error is within ``error``
+
+    Returns
+    -------
+    sample_size : int
+        Number of pixels to sample
+    """
+    return int(np.ceil(np.log(2. / (1. - confidence)) / (2. * error ** 2)))
+
+
+def statistics_filename(filename, directory):
+    """Return the path of the statistics sidecar file of a FITS file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file
+    directory : str
+        Directory of the sidecar file
+
+    Returns
+    -------
+    stats_file : str
+        ``<directory>/<rootname>_stats.json``
+    """
+    return os.path.join(directory, os.path.basename(filename).split('.')[0] + '_stats.json')
+
+
+def _render_integration(task):
+    """Render one integration in a worker process of
+    ``PreviewImage.make_image``.
+
+    Parameters
+    ----------
+    task : tuple
+        The attributes of the ``PreviewImage`` (except ``data`` and
+        ``dq``), the names of the memory-mapped files holding the
+        difference images and the DQ map, the integration number, and
+        the maximum image size
+
+    Returns
+    -------
+    integration_number : int
+        The integration number
+    statistics : dict
+        The statistics of the integration, or ``None`` if they are not
+        saved
+    records : list
+        The ``logging.LogRecord`` objects emitted while rendering, to
+        be re-emitted by the parent process
+    """
+    state, frames_file, dq_file, integration_number, max_img_size = task
+
+    # Spawned processes start without logging configured, so records
+    # are collected at the INFO level and sent back with the result
+    collector = RecordCollector()
+    root = logging.getLogger()
+    level = root.level
+    root.addHandler(collector)
+    root.setLevel(logging.INFO)
+    try:
+        image = PreviewImage(state['file'], None, read_data=False)
+        image.__dict__.update(state)
+        # The memmaps are opened read-only; indexing one returns a
+        # view, which np.asarray turns into a plain ndarray still backed
+        # by the file, so only the integration being rendered is read
+        image.dq = np.asarray(np.load(dq_file, mmap_mode='r'))
+        frames = np.load(frames_file, mmap_mode='r')
+        image.make_integration_image(np.asarray(frames[integration_number]), integration_number,
+                                     max_img_size=max_img_size)
+    finally:
+        root.removeHandler(collector)
+        root.setLevel(level)
+        plt.close('all')
+
+    return integration_number, image.statistics.get(integration_number), collector.records
+
 
 class PreviewImage():
     """An object for generating and saving preview images, used by
@@ -70,17 +405,70 @@ class PreviewImage():
         The data used to generate the preview image.
     dq : obj
         The DQ data used to generate the preview image.
+    engine : str
+        The engine used to render thumbnails. ``matplotlib`` (default)
+        draws a ``matplotlib`` figure, ``direct`` maps the data through
+        a colormap lookup table and writes the JPEG with ``Pillow``.
     file : str
         The filename to generate the preview image from.
+    limits_error : float
+        Tolerated error, as a fraction of the science pixels, in the
+        rank of the display limits found by the ``sampled`` method.
+        Used to set the sample size when ``limits_sample_size`` is
+        ``None``. Default is ``0.002``.
+    limits_method : str
+        How the display limits are found. ``exact`` (default) selects
+        them from all science pixels, ``sampled`` estimates them from a
+        random sample of the science pixels.
+    limits_sample_size : int or None
+        Number of science pixels sampled by the ``sampled`` method.
+    memory_limit : int or None
+        Number of bytes that the data of a 4D file may take in memory.
+        If the group pairs (see ``read_group_pairs``) and difference
+        images would exceed it, only the difference images are read
+        (see ``read_difference_images``), and ``data`` is 3D. Default
+        is ``None``, i.e. no limit.
     output_format : str
         The format to which the preview image is saved.  Options are
         ``jpg`` and ``thumb``
+    pool : obj or None
+        ``multiprocessing.pool.Pool`` used to render the integrations
+        when ``workers`` is greater than one, so that a single pool can
+        serve many files. It must use the ``spawn`` start method. If
+        ``None`` (default), a pool is created for each file.
     preview_output_directory : str or None
         The output directory to which the preview image is saved.
     scaling : str
         The scaling used in the preview image.  Default is ``log``.
+    statistics : dict
+        Statistics of the integrations rendered so far (see
+        ``frame_statistics``), keyed by integration number. Only
+        collected if ``stats_output_directory`` is set.
+    stats_output_directory : str or None
+        The output directory to which the statistics sidecar file is
+        saved. If ``None`` (default), no statistics are saved or
+        reused.
     thumbnail_output_directory : str or None
         The output directory to which the thumbnail is saved.
+    thumbnail_size : int
+        Maximum length in pixels of the longest side of thumbnails
+        created by the ``direct`` engine or from the preview image.
+        Default is ``480``.
+    thumbnail_source : str
+        ``frame`` (default) to render the thumbnail from the frame
+        with the selected ``engine``. ``preview`` to map the frame
+        onto the colormap once, show that buffer in the preview image,
+        and make the thumbnail by block-averaging the same buffer, so
+        that no second ``matplotlib`` figure is needed.
+    tile_output_directory : str or None
+        The output directory to which the deep-zoom tile pyramid is
+        saved. No tiles are created if ``None`` (default).
+    tile_size : int
+        Length in pixels of the sides of the tiles. Default is ``256``.
+    workers : int
+        Number of processes used by ``make_image`` to render the
+        integrations. Default is ``1``, i.e. render them one after the
+        other in the current process.
 
     Methods
     -------
@@ -89,17 +477,38 @@ class PreviewImage():
     find_limits(data, pixmap, clipperc)
         Find the min and max signal levels after clipping by
         ``clipperc``
+    find_saved_statistics(integration_number)
+        Return the statistics of an integration saved by an earlier
+        render
     get_data(filename, ext)
         Read in data from the given ``filename`` and ``ext``
-    make_figure(image, integration_number, min_value, max_value, scale, maxsize, thumbnail)
+    make_figure(image, integration_number, min_value, max_value, scale, maxsize, thumbnail, rgb)
         Create the ``matplotlib`` figure
     make_image(max_img_size)
         Main function
+    make_integration_image(frame, integration_number, max_img_size)
+        Create the preview image and thumbnail of one integration
+    make_integration_images_in_pool(frames, workers, max_img_size)
+        Render several integrations in parallel
+    make_rgb(image, min_value, max_value, scale)
+        Map the image onto an 8-bit RGB buffer
+    read_difference_images(hdu)
+        Read the difference images of a 4D extension in row blocks
+    read_group_pairs(hdu)
+        Read the first and last group of each integration
+    sample_limits(data, pixmap, clipperc, sample_size)
+        Estimate the display limits from a sample of the pixels
     save_image(fname, thumbnail)
         Save the figure
+    save_statistics()
+        Save the statistics of the rendered integrations
+    save_rgb_image(rgb, fname, thumbnail)
+        Save an 8-bit RGB buffer as a JPEG
+    save_tiles(rgb, fname)
+        Save an 8-bit RGB buffer as a deep-zoom tile pyramid
     """
 
-    def __init__(self, filename, extension):
+    def __init__(self, filename, extension, read_data=True):
         """Initialize the class.
 
         Parameters
@@ -108,17 +517,37 @@ class PreviewImage():
             Name of fits file containing data
         extension : str
             Extension name to be read in
+        read_data : bool
+            If ``False``, the file is not read and ``data`` and ``dq``
+            are left as ``None``, to be set by the caller (e.g. for
+            frames passed to ``make_integration_image``)
         """
         self.clip_percent = 0.01
         self.cmap = 'viridis'
+        self.engine = 'matplotlib'
         self.file = filename
+        self.limits_error = 0.002
+        self.limits_method = 'exact'
+        self.limits_sample_size = None
+        self.memory_limit = None
         self.output_format = 'jpg'
+        self.pool = None
         self.preview_output_directory = None
         self.scaling = 'log'
+        self.statistics = {}
+        self.stats_output_directory = None
         self.thumbnail_output_directory = None
+        self.thumbnail_size = 480
+        self.thumbnail_source = 'frame'
+        self.tile_output_directory = None
+        self.tile_size = 256
+        self.workers = 1
+        self._saved_statistics = None
 
         # Read in file
-        self.data, self.dq = self.get_data(self.file, extension)
+        self.data, self.dq = None, None
+        if read_data:
+            self.data, self.dq = self.get_data(self.file, extension)
 
     def difference_image(self, data):
         """
@@ -134,16 +563,35 @@ class PreviewImage():
         Returns
         -------
         result : obj
-            3D ``numpy`` ``ndarray`` containing the difference image(s)
-            from the input exposure
+            3D ``numpy`` ``ndarray`` of ``float32`` containing the
+            difference image(s) from the input exposure
         """
-        return data[:, -1, :, :] - data[:, 0, :, :]
+        # Subtract one integration at a time into a preallocated output,
+        # so that no temporary larger than a single frame is made
+        # (e.g. when casting integer data)
+        nint, _, ny, nx = data.shape
+        result = np.empty((nint, ny, nx), dtype=np.float32)
+        for integration in range(nint):
+            np.subtract(data[integration, -1, :, :], data[integration, 0, :, :],
+                        out=result[integration, :, :], dtype=np.float32, casting='unsafe')
+
+        return result
 
     def find_limits(self, data, pixmap, clipperc):
         """
         Find the minimum and maximum signal levels after clipping the
         top and bottom ``clipperc`` of the pixels.
 
+        The two order statistics are selected rather than sorted for.
+        A small random sample of the science pixels gives a bound
+        beyond each of the two limits, only the pixels outside those
+        bounds are extracted, and the limits are picked from them by
+        partial sorting (``numpy.partition``). The result is identical
+        to sorting all science pixels. If ``limits_method`` is
+        ``sampled`` and the frame has more science pixels than the
+        sample size, the limits are instead estimated from a random
+        sample of the science pixels (see ``sample_limits``).
+
         Parameters
         ----------
         data : obj
@@ -161,17 +609,86 @@ class PreviewImage():
         results : tuple
             Tuple of floats, minimum and maximum signal levels
         """
+        if self.limits_method not in ['exact', 'sampled']:
+            raise ValueError(('WARNING: limits method {} not supported.'
+                              .format(self.limits_method)))
+
+        if self.limits_method == 'sampled':
+            sample_size = self.limits_sample_size
+            if sample_size is None:
+                sample_size = sample_size_for_error(self.limits_error)
+            if np.sum(pixmap) > sample_size:
+                return self.sample_limits(data, pixmap, clipperc, sample_size)
+
         nelem = np.sum(pixmap)
-        numclip = np.int(clipperc * nelem)
-        sorted = np.sort(data[pixmap], axis=None)
-        minval = sorted[numclip]
-        maxval = sorted[-numclip-1]
+        numclip = int(clipperc * nelem)
+        upper = nelem - numclip - 1
+
+        # Bound the limits using the order statistics of a sample, with
+        # a margin of several standard deviations of the sample ranks
+        random_state = np.random.RandomState(0)
+        positions = random_state.randint(0, data.size, BRACKET_SAMPLE_SIZE)
+        positions = positions[pixmap.ravel()[positions]]
+        sample = np.sort(data.ravel()[positions])
+        if sample.size > 0:
+            margin = int(4 * np.sqrt(sample.size)) + 1
+            low_index = min(int(numclip / nelem * sample.size) + margin, sample.size - 1)
+            high_index = max(int(upper / nelem * sample.size) - margin, 0)
+
+            # NaNs sort last, so they belong to the upper tail
+            low_tail = data[(data <= sample[low_index]) & pixmap]
+            high_tail = data[~(data < sample[high_index]) & pixmap]
+            high_rank = high_tail.size - (nelem - upper)
+            if low_tail.size > numclip and high_rank >= 0:
+                low_tail.partition(numclip)
+                high_tail.partition(high_rank)
+                return (low_tail[numclip], high_tail[high_rank])
+
+        # Boolean indexing returns a copy, which can be partitioned in place
+        pixels = data[pixmap]
+        pixels.partition([numclip, upper])
+        minval = pixels[numclip]
+        maxval = pixels[upper]
         return (minval, maxval)
 
+    def find_saved_statistics(self, integration_number):
+        """Return the statistics of an integration saved by an earlier
+        render of the same file, if their display limits were found
+        with the current ``clip_percent`` and ``limits_method``.
+
+        Parameters
+        ----------
+        integration_number : int
+            Integration number
+
+        Returns
+        -------
+        statistics : dict
+            The statistics of the integration (see
+            ``frame_statistics``), or ``None`` if they are not
+            available
+        """
+        if self.stats_output_directory is None:
+            return None
+        if self._saved_statistics is None:
+            self._saved_statistics = load_statistics(self.file, self.stats_output_directory) or {}
+
+        statistics = self._saved_statistics.get('integrations', {}).get(str(integration_number))
+        if statistics is None or statistics.get('clip_percent') != self.clip_percent or \
+                statistics.get('limits_method') != self.limits_method:
+            return None
+
+        return statistics
+
     def get_data(self, filename, ext):
         """
         Read in the data from the given file and extension.  Also find
-        how many rows/cols of reference pixels are present.
+        how many rows/cols of reference pixels are present. For 4D
+        data, only the first and last group of each integration are
+        read (see ``read_group_pairs``), or only their difference if
+        the group pairs would exceed ``memory_limit`` (see
+        ``read_difference_images``). The data are returned as
+        ``float32``.
 
         Parameters
         ----------
@@ -183,7 +700,10 @@ class PreviewImage():
         Returns
         -------
         data : obj
-            Science data from file. A 2-, 3-, or 4D numpy ndarray
+            Science data from file. A 2-, 3-, or 4D numpy ndarray. 4D
+            data contain only the first and last group of each
+            integration, and are returned as 3D difference images if
+            they exceed ``memory_limit``.
         dq : obj
             2D ``ndarray`` boolean map of reference pixels. Science
             pixels flagged as ``True`` and non-science pixels are
@@ -198,11 +718,16 @@ class PreviewImage():
                     except:
                         pass
                 if ext in extnames:
-                    dimensions = len(hdulist[ext].data.shape)
+                    dimensions = hdulist[ext].header['NAXIS']
                     if dimensions == 4:
-                        data = hdulist[ext].data[:, [0, -1], :, :].astype(np.float)
+                        nint, _, ny, nx = hdulist[ext].shape
+                        pairs_size = 3 * nint * ny * nx * np.dtype(np.float32).itemsize
+                        if self.memory_limit is not None and pairs_size > self.memory_limit:
+                            data = self.read_difference_images(hdulist[ext])
+                        else:
+                            data = self.read_group_pairs(hdulist[ext])
                     else:
-                        data = hdulist[ext].data.astype(np.float)
+                        data = hdulist[ext].data.astype(np.float32)
                 else:
                     raise ValueError(('WARNING: no {} extension in {}!'.format(ext, filename)))
                 if 'PIXELDQ' in extnames:
@@ -225,7 +750,7 @@ class PreviewImage():
         return data, dq
 
     def make_figure(self, image, integration_number, min_value, max_value,
-                    scale, maxsize=8, thumbnail=False):
+                    scale, maxsize=8, thumbnail=False, rgb=None):
         """
         Create the matplotlib figure of the image
 
@@ -253,6 +778,11 @@ class PreviewImage():
             True to create a thumbnail image, False to create the full
             preview image
 
+        rgb : obj or None
+            The output of ``make_rgb`` for ``image``. If given, the
+            full preview image displays this buffer instead of
+            normalizing and color-mapping ``image`` again.
+
         Returns
         -------
         result : obj
@@ -276,16 +806,15 @@ class PreviewImage():
         if scale == 'log':
 
             # Shift data so everything is positive
-            shiftdata = image - min_value + 1
             shiftmin = 1
             shiftmax = max_value - min_value + 1
+            norm = colors.LogNorm(vmin=shiftmin, vmax=shiftmax)
+            if rgb is None:
+                shiftdata = image - min_value + 1
 
             # If making a thumbnail, make a figure with no axes
             if thumbnail:
-                fig = plt.imshow(shiftdata,
-                                 norm=colors.LogNorm(vmin=shiftmin,
-                                                     vmax=shiftmax),
-                                 cmap=self.cmap)
+                fig = plt.imshow(shiftdata, norm=norm, cmap=self.cmap)
                 # Invert y axis
                 plt.gca().invert_yaxis()
 
@@ -296,10 +825,13 @@ class PreviewImage():
             # If preview image, add axes and colorbars
             else:
                 fig, ax = plt.subplots(figsize=(xsize, ysize))
-                cax = ax.imshow(shiftdata,
-                                norm=colors.LogNorm(vmin=shiftmin,
-                                                    vmax=shiftmax),
-                                cmap=self.cmap)
+                if rgb is None:
+                    cax = ax.imshow(shiftdata, norm=norm, cmap=self.cmap)
+                else:
+                    # make_rgb has already flipped the buffer for display
+                    ax.imshow(rgb[::-1])
+                    cax = cm.ScalarMappable(norm=norm, cmap=self.cmap)
+                    cax.set_array([])
                 # Invert y axis
                 plt.gca().invert_yaxis()
 
@@ -320,7 +852,7 @@ class PreviewImage():
                     dig = 3
                 format_string = "%.{}f".format(dig)
                 tlabelstr = [format_string % number for number in tlabelflt]
-                cbar = fig.colorbar(cax, ticks=tickvals)
+                cbar = fig.colorbar(cax, ax=ax, ticks=tickvals)
                 cbar.ax.set_yticklabels(tlabelstr)
                 cbar.ax.tick_params(labelsize=maxsize * 5./4)
                 # cbar.ax.set_ylabel('Signal', rotation=270, fontsize=maxsize*5./4)
@@ -335,10 +867,16 @@ class PreviewImage():
 
         elif scale == 'linear':
             fig, ax = plt.subplots(figsize=(xsize, ysize))
-            cax = ax.imshow(image, clim=(min_value, max_value), cmap=self.cmap)
+            if rgb is None:
+                cax = ax.imshow(image, clim=(min_value, max_value), cmap=self.cmap)
+            else:
+                ax.imshow(rgb)
+                cax = cm.ScalarMappable(norm=colors.Normalize(vmin=min_value, vmax=max_value),
+                                        cmap=self.cmap)
+                cax.set_array([])
 
             if not thumbnail:
-                cbar = fig.colorbar(cax)
+                cbar = fig.colorbar(cax, ax=ax)
                 ax.set_xlabel('Pixels')
                 ax.set_ylabel('Pixels')
 
@@ -348,7 +886,21 @@ class PreviewImage():
             ax.set_title(filename + ' Int: {}'.format(np.int(integration_number)))
 
     def make_image(self, max_img_size=8):
-        """The main function of the ``PreviewImage`` class."""
+        """The main function of the ``PreviewImage`` class.
+
+        If ``workers`` is greater than one and there are several
+        integrations, the integrations are rendered by a pool of
+        processes, which share the difference images through a
+        memory-mapped scratch file rather than receiving a copy of the
+        data. Daemonic processes (e.g. the workers of
+        ``generate_preview_images``) cannot start a pool, and render the
+        integrations one after the other.
+
+        Parameters
+        ----------
+        max_img_size : float
+            Maximum size in inches of the preview image
+        """
 
         shape = self.data.shape
 
@@ -365,37 +917,320 @@ class PreviewImage():
             diff_img = np.expand_dims(diff_img, axis=0)
         nint, ny, nx = diff_img.shape
 
-        for i in range(nint):
-            frame = diff_img[i, :, :]
+        workers = min(self.workers, nint)
+        if workers > 1 and not multiprocessing.current_process().daemon:
+            self.make_integration_images_in_pool(diff_img, workers, max_img_size=max_img_size)
+        else:
+            for i in range(nint):
+                self.make_integration_image(diff_img[i, :, :], i, max_img_size=max_img_size)
 
-            # Find signal limits for the display
-            minval, maxval = self.find_limits(frame, self.dq,
-                                              self.clip_percent)
+        self.save_statistics()
 
-            # Create preview image matplotlib object
-            indir, infile = os.path.split(self.file)
-            suffix = '_integ{}.{}'.format(i, self.output_format)
-            if self.preview_output_directory is None:
-                outdir = indir
-            else:
-                outdir = self.preview_output_directory
-            outfile = os.path.join(outdir, infile.split('.')[0] + suffix)
-            self.make_figure(frame, i, minval, maxval, self.scaling.lower(),
-                             maxsize=max_img_size, thumbnail=False)
-            self.save_image(outfile, thumbnail=False)
-            plt.close()
+    def make_integration_image(self, frame, integration_number, max_img_size=8):
+        """Create and save the preview image and thumbnail of a single
+        integration. ``make_image`` calls this for each integration of
+        ``data``, but it can also be given frames that are produced one
+        at a time, e.g. the integrations of a NIRCam mosaic.
 
-            # Create thumbnail image matplotlib object
-            if self.thumbnail_output_directory is None:
-                outdir = indir
-            else:
-                outdir = self.thumbnail_output_directory
-            outfile = os.path.join(outdir, infile.split('.')[0] + suffix)
-            self.make_figure(frame, i, minval, maxval, self.scaling.lower(),
+        Parameters
+        ----------
+        frame : obj
+            2D ``numpy`` ``ndarray`` (difference image) of the
+            integration, with the same shape as ``dq``
+
+        integration_number : int
+            Integration number, used in the title and output filenames
+
+        max_img_size : float
+            Maximum size in inches of the preview image
+        """
+        if self.thumbnail_source not in ['frame', 'preview']:
+            raise ValueError(('WARNING: thumbnail source {} not supported.'
+                              .format(self.thumbnail_source)))
+
+        i = integration_number
+        ny, nx = frame.shape
+        scale = self.scaling.lower()
+
+        # Find signal limits for the display, unless an earlier render
+        # of the same file saved them
+        statistics = self.find_saved_statistics(i)
+        if statistics is not None:
+            minval, maxval = statistics['limits']
+        else:
+            minval, maxval = self.find_limits(frame, self.dq,
+                                              self.clip_percent)
+            if self.stats_output_directory is not None:
+                statistics = frame_statistics(frame, self.dq, minval, maxval)
+                statistics['clip_percent'] = self.clip_percent
+                statistics['limits_method'] = self.limits_method
+        if statistics is not None:
+            self.statistics[i] = statistics
+
+        # Map the frame onto the colormap once, for use by both the
+        # preview image and the thumbnail
+        rgb = None
+        if self.thumbnail_source == 'preview':
+            rgb = self.make_rgb(frame, minval, maxval, scale)
+
+        # Create preview image matplotlib object
+        indir, infile = os.path.split(self.file)
+        suffix = '_integ{}.{}'.format(i, self.output_format)
+        if self.preview_output_directory is None:
+            outdir = indir
+        else:
+            outdir = self.preview_output_directory
+        outfile = os.path.join(outdir, infile.split('.')[0] + suffix)
+        self.make_figure(frame, i, minval, maxval, scale,
+                         maxsize=max_img_size, thumbnail=False, rgb=rgb)
+        self.save_image(outfile, thumbnail=False)
+        plt.close()
+
+        # Create the tile pyramid of the frame
+        if self.tile_output_directory is not None:
+            if rgb is None:
+                rgb = self.make_rgb(frame, minval, maxval, scale)
+            outfile = os.path.join(self.tile_output_directory,
+                                   infile.split('.')[0] + '_integ{}.dzi'.format(i))
+            self.save_tiles(rgb, outfile)
+
+        # Create thumbnail image
+        if self.thumbnail_output_directory is None:
+            outdir = indir
+        else:
+            outdir = self.thumbnail_output_directory
+        outfile = os.path.join(outdir, infile.split('.')[0] + suffix)
+        factor = int(np.ceil(max(ny, nx) / self.thumbnail_size))
+        if rgb is not None:
+            self.save_rgb_image(block_average(rgb, factor), outfile, thumbnail=True)
+        elif self.engine == 'direct':
+            # Average the frame down to the thumbnail size before
+            # rendering, so that only the output pixels are mapped
+            thumbnail = self.make_rgb(block_average(frame, factor), minval, maxval, scale)
+            self.save_rgb_image(thumbnail, outfile, thumbnail=True)
+        else:
+            self.make_figure(frame, i, minval, maxval, scale,
                              maxsize=max_img_size, thumbnail=True)
             self.save_image(outfile, thumbnail=True)
             plt.close()
 
+    def make_integration_images_in_pool(self, frames, workers, max_img_size=8):
+        """Render the integrations of ``frames`` with a pool of
+        ``workers`` processes, or with ``pool`` if it is set. ``frames``
+        and ``dq`` are written to memory-mapped files in a scratch
+        directory, which is removed afterwards. The log records of the
+        workers are re-emitted in the current process.
+
+        Parameters
+        ----------
+        frames : obj
+            3D ``numpy`` ``ndarray`` of the difference images of all
+            integrations
+        workers : int
+            Number of worker processes
+        max_img_size : float
+            Maximum size in inches of the preview image
+        """
+        scratch_directory = tempfile.mkdtemp(prefix='preview_image_')
+        try:
+            frames_file = os.path.join(scratch_directory, 'frames.npy')
+            shared_frames = np.lib.format.open_memmap(frames_file, mode='w+', dtype=frames.dtype,
+                                                      shape=frames.shape)
+            shared_frames[:] = frames
+            shared_frames.flush()
+            del shared_frames
+
+            dq_file = os.path.join(scratch_directory, 'dq.npy')
+            np.save(dq_file, self.dq)
+
+            state = {key: value for key, value in vars(self).items()
+                     if key not in ['data', 'dq', 'pool', 'statistics']}
+            tasks = [(state, frames_file, dq_file, i, max_img_size) for i in range(len(frames))]
+
+            with ExitStack() as stack:
+                pool = self.pool
+                if pool is None:
+                    context = multiprocessing.get_context('spawn')
+                    pool = stack.enter_context(context.Pool(processes=workers))
+                for i, statistics, records in pool.imap_unordered(_render_integration, tasks):
+                    for record in records:
+                        logging.getLogger().handle(record)
+                    if statistics is not None:
+                        self.statistics[i] = statistics
+            logging.info('Rendered {} integrations of {} with {} processes'.format(
+                len(frames), self.file, workers))
+        finally:
+            shutil.rmtree(scratch_directory, ignore_errors=True)
+
+    def make_rgb(self, image, min_value, max_value, scale):
+        """
+        Map the image onto an 8-bit RGB buffer using a lookup table of
+        the colormap, without creating a ``matplotlib`` figure. As in
+        the figures, the y axis of log-scaled images is inverted and
+        ``NaN`` pixels are shown in white. Pixels below ``min_value``
+        are shown in the lowest color of the colormap.
+
+        Parameters
+        ----------
+        image : obj
+            2D ``numpy`` ``ndarray`` of floats
+
+        min_value : float
+            Minimum value for display
+
+        max_value : float
+            Maximum value for display
+
+        scale : str
+            Image scaling (``log``, ``linear``)
+
+        Returns
+        -------
+        rgb : obj
+            3D ``numpy`` ``ndarray`` of ``uint8`` with shape
+            ``(ny, nx, 3)``
+        """
+        scaled = scale_image(image, min_value, max_value, scale)
+        invalid = np.isnan(scaled)
+
+        # Same binning as matplotlib colormaps, with 1.0 in the top bin
+        scaled *= LUT_SIZE
+        scaled[invalid] = 0
+        indexes = np.minimum(scaled.astype(np.int32), LUT_SIZE - 1)
+        rgb = colormap_lut(self.cmap)[indexes]
+        rgb[invalid] = 255
+
+        if scale == 'log':
+            rgb = rgb[::-1]
+
+        return rgb
+
+    def read_difference_images(self, hdu):
+        """
+        Compute the difference images of a 4D extension straight from
+        the file, one block of rows of one integration at a time, into
+        a preallocated ``float32`` array. The rows of a block are
+        chosen so that the block temporaries take no more than
+        1/16th of ``memory_limit``. If the output itself would take
+        more than half of ``memory_limit``, it is memory-mapped to an
+        anonymous scratch file.
+
+        Parameters
+        ----------
+        hdu : obj
+            ``astropy.io.fits`` image HDU containing 4D data
+
+        Returns
+        -------
+        data : obj
+            3D ``numpy`` ``ndarray`` (or ``numpy.memmap``) of
+            ``float32`` with shape ``(nint, ny, nx)``
+        """
+        nint, ngroup, ny, nx = hdu.shape
+        shape = (nint, ny, nx)
+        itemsize = np.dtype(np.float32).itemsize
+        if self.memory_limit is not None and nint * ny * nx * itemsize > self.memory_limit / 2:
+            data = np.memmap(tempfile.TemporaryFile(prefix='preview_image_'), dtype=np.float32,
+                             mode='w+', shape=shape)
+        else:
+            data = np.empty(shape, dtype=np.float32)
+
+        # The groups read through hdu.section may be unsigned integers,
+        # which are subtracted as float32, or scaled float64 values
+        block_rows = ny
+        if self.memory_limit is not None:
+            block_rows = int(min(ny, max(1, self.memory_limit / 16 / (3 * 8 * nx))))
+        for integration in range(nint):
+            for row in range(0, ny, block_rows):
+                rows = slice(row, min(row + block_rows, ny))
+                np.subtract(hdu.section[integration, ngroup - 1, rows, :],
+                            hdu.section[integration, 0, rows, :],
+                            out=data[integration, rows, :], dtype=np.float32, casting='unsafe')
+
+        logging.info('Read the difference images of {} in blocks of {} rows'.format(
+            self.file, block_rows))
+
+        return data
+
+    def read_group_pairs(self, hdu):
+        """
+        Read the first and last group of each integration of a 4D
+        extension into a ``float32`` array.
+
+        The groups are read through ``hdu.section``, so that only the
+        requested parts of the file are read (and scaled, e.g. for
+        unsigned integer ramps) rather than the whole cube. The memory
+        needed therefore scales with the number of integrations, not
+        with the number of groups.
+
+        Parameters
+        ----------
+        hdu : obj
+            ``astropy.io.fits`` image HDU containing 4D data
+
+        Returns
+        -------
+        data : obj
+            4D ``numpy`` ``ndarray`` of ``float32`` with shape
+            ``(nint, 2, ny, nx)``
+        """
+        nint, ngroup, ny, nx = hdu.shape
+        data = np.empty((nint, 2, ny, nx), dtype=np.float32)
+        for integration in range(nint):
+            data[integration, 0, :, :] = hdu.section[integration, 0, :, :]
+            data[integration, 1, :, :] = hdu.section[integration, ngroup - 1, :, :]
+
+        return data
+
+    def sample_limits(self, data, pixmap, clipperc, sample_size):
+        """
+        Estimate the clipped minimum and maximum signal levels from a
+        random sample of ``sample_size`` science pixels.
+
+        By the Dvoretzky-Kiefer-Wolfowitz inequality, the rank of the
+        returned values in the full frame differs from the requested
+        rank by more than a fraction ``epsilon`` of the science pixels
+        with probability at most ``2 * exp(-2 * sample_size * epsilon**2)``
+        (see ``sample_size_for_error``). The sample is drawn with a
+        fixed seed, so that repeated renderings give the same limits.
+
+        Parameters
+        ----------
+        data : obj
+            2D numpy ndarray of floats
+        pixmap : obj
+            2D numpy ndarray boolean array of science pixel locations
+        clipperc : float
+            Fraction of top and bottom signal levels to clip
+        sample_size : int
+            Number of science pixels to sample
+
+        Returns
+        -------
+        results : tuple
+            Tuple of floats, estimated minimum and maximum signal levels
+        """
+        flat_data = data.ravel()
+        flat_pixmap = pixmap.ravel()
+        science_fraction = np.sum(flat_pixmap) / flat_pixmap.size
+
+        # Draw positions over the whole frame and keep the science pixels,
+        # oversampling to make up for the non-science pixels
+        random_state = np.random.RandomState(0)
+        sample = np.empty(0, dtype=flat_data.dtype)
+        while sample.size < sample_size:
+            ndraw = int((sample_size - sample.size) / science_fraction * 1.1) + 1
+            positions = random_state.randint(0, flat_data.size, ndraw)
+            positions = positions[flat_pixmap[positions]]
+            sample = np.concatenate([sample, flat_data[positions]])
+        sample = sample[:sample_size]
+
+        numclip = int(clipperc * sample_size)
+        lower = numclip
+        upper = sample_size - numclip - 1
+        sample.partition([lower, upper])
+        return (sample[lower], sample[upper])
+
     def save_image(self, fname, thumbnail=False):
         """
         Save an image in the requested output format and sets the
@@ -424,3 +1259,109 @@ class PreviewImage():
             logging.info('Saved image to {}'.format(thumb_fname))
         else:
             logging.info('Saved image to {}'.format(fname))
+
+    def save_rgb_image(self, rgb, fname, thumbnail=False):
+        """
+        Save an 8-bit RGB buffer as a JPEG using ``Pillow`` and set the
+        appropriate permissions
+
+        Parameters
+        ----------
+        rgb : obj
+            3D ``numpy`` ``ndarray`` of ``uint8`` with shape
+            ``(ny, nx, 3)``
+
+        fname : str
+            Output filename
+
+        thumbnail : bool
+            True if saving a thumbnail image, in which case the file
+            is given the ``.thumb`` extension.
+        """
+        if thumbnail:
+            fname = fname.replace('.jpg', '.thumb')
+
+        image = Image.fromarray(np.ascontiguousarray(rgb), mode='RGB')
+        image.save(fname, format='JPEG', quality=90)
+        permissions.set_permissions(fname)
+        logging.info('Saved image to {}'.format(fname))
+
+    def save_statistics(self):
+        """Save the statistics of the integrations rendered so far to
+        the sidecar file in ``stats_output_directory``, along with the
+        size and modification time of the input file. Nothing is saved
+        if ``stats_output_directory`` is ``None``.
+        """
+        if self.stats_output_directory is None or len(self.statistics) == 0:
+            return
+
+        size, mtime = None, None
+        if os.path.isfile(self.file):
+            status = os.stat(self.file)
+            size, mtime = status.st_size, status.st_mtime
+        contents = {'file': os.path.basename(self.file), 'size': size, 'mtime': mtime,
+                    'integrations': {str(i): self.statistics[i] for i in sorted(self.statistics)}}
+
+        # Write to a temporary file first, so that readers never see a
+        # partially written file
+        stats_file = statistics_filename(self.file, self.stats_output_directory)
+        temporary_file = stats_file + '.tmp'
+        with open(temporary_file, 'w') as json_file:
+            json.dump(contents, json_file)
+        os.replace(temporary_file, stats_file)
+        permissions.set_permissions(stats_file)
+        self._saved_statistics = contents
+        logging.info('Saved statistics to {}'.format(stats_file))
+
+    def save_tiles(self, rgb, fname):
+        """
+        Save an 8-bit RGB buffer as a deep-zoom (DZI) tile pyramid and
+        set the appropriate permissions. Level ``n`` of the pyramid has
+        ``2 ** n`` pixels along the longest side (rounded up), up to
+        the full resolution of ``rgb``; each level is split into
+        JPEG tiles of ``tile_size`` pixels named
+        ``<fname>_files/<level>/<column>_<row>.jpg``.
+
+        Parameters
+        ----------
+        rgb : obj
+            3D ``numpy`` ``ndarray`` of ``uint8`` with shape
+            ``(ny, nx, 3)``
+
+        fname : str
+            Output filename of the DZI descriptor
+        """
+        ny, nx = rgb.shape[:2]
+        tile_directory = os.path.splitext(fname)[0] + '_files'
+        if not os.path.exists(tile_directory):
+            os.makedirs(tile_directory)
+            permissions.set_permissions(tile_directory)
+
+        max_level = int(np.ceil(np.log2(max(ny, nx))))
+        level_image = rgb
+        for level in range(max_level, -1, -1):
+            level_directory = os.path.join(tile_directory, str(level))
+            if not os.path.exists(level_directory):
+                os.makedirs(level_directory)
+                permissions.set_permissions(level_directory)
+
+            level_ny, level_nx = level_image.shape[:2]
+            for row, y0 in enumerate(range(0, level_ny, self.tile_size)):
+                for column, x0 in enumerate(range(0, level_nx, self.tile_size)):
+                    tile = level_image[y0:y0 + self.tile_size, x0:x0 + self.tile_size]
+                    tile_name = os.path.join(level_directory, '{}_{}.jpg'.format(column, row))
+                    Image.fromarray(np.ascontiguousarray(tile), mode='RGB').save(
+                        tile_name, format='JPEG', quality=90)
+
+            # Halve the resolution for the next level
+            if level > 0:
+                level_image = block_average(level_image, 2)
+
+        with open(fname, 'w') as descriptor:
+            descriptor.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                              '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                              'TileSize="{}" Overlap="0" Format="jpg">\n'
+                              '  <Size Width="{}" Height="{}"/>\n'
+                              '</Image>\n').format(self.tile_size, nx, ny))
+        permissions.set_permissions(fname)
+        logging.info('Saved tile pyramid to {}'.format(fname))
@@ -0,0 +1,211 @@
+"""Queue of preview image rendering jobs requested by the web app.
+
+Rendering the preview images of a large file can take a minute, which
+is too long to keep a web server worker busy. Instead of rendering
+inside the request, the web app submits a job for the file root it is
+showing, and the ``process_preview_jobs`` script renders the queued
+jobs in the background while the page polls for their status. The
+queue is kept in a SQLite database, so no external broker is needed.
+
+Requests for a file root that is already queued or being rendered are
+coalesced into the existing job. A request to rewrite the images of a
+job that is already being rendered queues the job again once it
+finishes.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.preview_jobs import PreviewJobQueue, get_job_queue_filename
+
+        queue = PreviewJobQueue(get_job_queue_filename())
+        queue.submit('jw00327001001_02101_00001_nrca1')
+
+        # In the worker
+        job = queue.claim()
+        if job is not None:
+            file_root, rewrite = job
+            # render the preview images, then
+            queue.finish(file_root, 'done')
+"""
+
+import os
+import time
+
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+# Statuses of a job that has not been completed yet
+ACTIVE_STATUSES = ['queued', 'running']
+
+
+def get_job_queue_filename():
+    """Return the location of the preview job queue. This is the
+    ``preview_job_queue`` entry of the config file, if present, and
+    ``<outputs>/process_preview_jobs/preview_jobs.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the queue database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'process_preview_jobs', 'preview_jobs.db')
+
+    return settings.get('preview_job_queue', default)
+
+
+class PreviewJobQueue(SQLiteStore):
+    """The preview image rendering jobs, keyed by file root. A job is
+    ``queued`` when submitted, ``running`` once claimed by a worker,
+    and ``done`` or ``failed`` when finished.
+
+    Methods
+    -------
+    claim(stale_after)
+        Take the oldest queued job
+    finish(file_root, status, message)
+        Record the outcome of a job
+    status(file_root)
+        Return the state of the job of a file root
+    submit(file_root, rewrite)
+        Queue the rendering of a file root
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS jobs ('
+              'file_root TEXT PRIMARY KEY, '
+              'rewrite INTEGER NOT NULL, '
+              'status TEXT NOT NULL, '
+              'submitted REAL NOT NULL, '
+              'started REAL, '
+              'finished REAL, '
+              'message TEXT NOT NULL)',
+              'CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, submitted)']
+
+    def claim(self, stale_after=3600.):
+        """Mark the oldest queued job as running and return it. Jobs
+        that have been running for longer than ``stale_after`` seconds
+        are assumed to belong to a worker that died, and are claimed
+        again.
+
+        Parameters
+        ----------
+        stale_after : float
+            Number of seconds after which a running job is claimed
+            again
+
+        Returns
+        -------
+        job : tuple
+            ``(file_root, rewrite)`` of the claimed job, or ``None`` if
+            no job is waiting
+        """
+
+        now = time.time()
+        with self.connect() as connection:
+            # Take the write lock first, so that two workers cannot
+            # claim the same job
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                "SELECT file_root, rewrite FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND started < ?) "
+                "ORDER BY submitted LIMIT 1", (now - stale_after,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET status = 'running', started = ? "
+                               "WHERE file_root = ?", (now, row[0]))
+
+        return row[0], bool(row[1])
+
+    def finish(self, file_root, status, message=''):
+        """Record the outcome of a job. A job that was submitted again
+        with ``rewrite`` while it was running is queued again instead.
+
+        Parameters
+        ----------
+        file_root : str
+            The file root of the job
+        status : str
+            ``done`` or ``failed``
+        message : str
+            Description of the outcome, shown by the web app
+        """
+
+        with self.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            cursor = connection.execute("UPDATE jobs SET status = 'queued', started = NULL "
+                                        "WHERE file_root = ? AND status = 'running' "
+                                        "AND submitted > started", (file_root,))
+            if cursor.rowcount == 0:
+                connection.execute('UPDATE jobs SET status = ?, finished = ?, message = ? '
+                                   'WHERE file_root = ?',
+                                   (status, time.time(), message, file_root))
+
+    def status(self, file_root):
+        """Return the state of the job of a file root.
+
+        Parameters
+        ----------
+        file_root : str
+            The file root of the job
+
+        Returns
+        -------
+        job : dict
+            The ``status``, ``message``, and ``submitted``, ``started``
+            and ``finished`` times of the job, or ``None`` if no job
+            was submitted for ``file_root``
+        """
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT status, message, submitted, started, finished '
+                                     'FROM jobs WHERE file_root = ?', (file_root,)).fetchone()
+        if row is None:
+            return None
+
+        return dict(zip(['status', 'message', 'submitted', 'started', 'finished'], row))
+
+    def submit(self, file_root, rewrite=False):
+        """Queue the rendering of the preview images of a file root. If
+        a job for the file root is already queued or running, no new
+        job is created. A ``rewrite`` of a running job is recorded by
+        moving its submission time past its start time, so that
+        ``finish`` queues it again.
+
+        Parameters
+        ----------
+        file_root : str
+            The file root whose preview images are rendered
+        rewrite : bool
+            If ``True``, render all preview images of the file root,
+            rather than only the missing ones
+
+        Returns
+        -------
+        status : str
+            The status of the job after submission, i.e. ``queued`` or
+            ``running``
+        """
+
+        with self.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT status FROM jobs WHERE file_root = ?',
+                                     (file_root,)).fetchone()
+            if row is not None and row[0] in ACTIVE_STATUSES:
+                if row[0] == 'queued' and rewrite:
+                    connection.execute('UPDATE jobs SET rewrite = 1 WHERE file_root = ?',
+                                       (file_root,))
+                elif rewrite:
+                    connection.execute('UPDATE jobs SET rewrite = 1, submitted = ? '
+                                       'WHERE file_root = ?', (time.time(), file_root))
+                return row[0]
+
+            connection.execute("INSERT OR REPLACE INTO jobs "
+                               "VALUES (?, ?, 'queued', ?, NULL, NULL, '')",
+                               (file_root, int(rewrite), time.time()))
+
+        return 'queued'
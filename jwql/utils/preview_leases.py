@@ -0,0 +1,334 @@
+"""Lease files with which several hosts split the rendering of preview
+images between them.
+
+When ``generate_preview_images`` runs on more than one render host at
+once, the hosts share the ``filesystem`` and the preview image stores,
+and would otherwise all render the same exposure groups and write to
+the same output files. Instead, a host that runs in coordinated mode
+claims each exposure group by creating a lease file in a shared
+directory before rendering it, and removes the file once the group is
+rendered and recorded in the preview manifest. The lease file is
+created with ``O_CREAT | O_EXCL``, so only one host can hold it.
+
+While a host renders, it renews its leases (by updating their
+modification time) at regular intervals. A lease that has not been
+renewed for longer than the lease duration belongs to a host that has
+crashed or hung, and is taken over by the next host that tries to
+claim the group: it writes its own lease to a temporary file, moves it
+over the expired one with ``os.replace``, and only renders the group if
+it still holds the lease a moment later, since of several hosts taking
+over the same lease the last one to replace it wins.
+
+The age of a lease is the difference between the clock of the host
+that checks it and the modification time set by the host (or file
+server) that last renewed it. A lease is renewed every quarter of the
+lease duration by default, so the clocks may differ by up to about
+half the lease duration before a lease that is still renewed is taken
+over, e.g. five minutes for the default duration of ten minutes.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.preview_leases import LeaseDirectory, get_lease_directory, lease_name
+
+        leases = LeaseDirectory(get_lease_directory(), duration=600.)
+        with leases.keep_alive():
+            if leases.acquire(lease_name(file_list)):
+                # render the preview images, then
+                leases.release(lease_name(file_list))
+"""
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from jwql.utils.utils import ensure_dir_exists, get_config
+
+
+def get_lease_directory():
+    """Return the directory of the lease files. This is the
+    ``preview_lease_directory`` entry of the config file, if present,
+    and ``<outputs>/generate_preview_images/leases`` otherwise. It must
+    be on a filesystem shared by all render hosts.
+
+    Returns
+    -------
+    directory : str
+        Path of the lease directory
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'generate_preview_images', 'leases')
+
+    return settings.get('preview_lease_directory', default)
+
+
+def lease_name(file_list):
+    """Return the name of the lease of an exposure group, i.e. the
+    name of its first file without the extension.
+
+    Parameters
+    ----------
+    file_list : list
+        The files of the exposure group
+
+    Returns
+    -------
+    name : str
+        Name of the lease, e.g. ``jw00327001001_02101_00001_nrca1_rate``
+    """
+
+    return os.path.splitext(os.path.basename(file_list[0]))[0]
+
+
+class LeaseDirectory(object):
+    """A directory of lease files, seen from a single host. The
+    processes of the host that share the same ``owner`` (e.g. the
+    workers of a ``multiprocessing`` pool, which receive a pickled copy
+    of the object) share the leases.
+
+    Attributes
+    ----------
+    directory : str
+        Path of the lease directory
+    duration : float
+        Number of seconds after the last renewal at which a lease
+        expires
+    owner : str
+        Identifier of the holder of the leases, made of the host name,
+        process ID, and a random part
+    settle_time : float
+        Number of seconds to wait after taking over an expired lease
+        before checking which host holds it
+
+    Methods
+    -------
+    acquire(name)
+        Claim a lease
+    holder(name)
+        Return the contents of a lease file
+    keep_alive(interval)
+        Renew the leases in a background thread
+    release(name)
+        Give up a lease
+    renew()
+        Renew every lease held by ``owner``
+    """
+
+    def __init__(self, directory, duration=600., owner=None, settle_time=1.):
+        """Create the lease directory if it does not exist.
+
+        Parameters
+        ----------
+        directory : str
+            Path of the lease directory
+        duration : float
+            Number of seconds after the last renewal at which a lease
+            expires
+        owner : str
+            Identifier of the holder of the leases. A new one is made
+            if not given.
+        settle_time : float
+            Number of seconds to wait after taking over an expired
+            lease before checking which host holds it
+        """
+
+        self.directory = directory
+        self.duration = duration
+        self.settle_time = settle_time
+        if owner is None:
+            owner = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.owner = owner
+
+        ensure_dir_exists(directory)
+
+    def _path(self, name):
+        """Return the path of the lease file with the given name."""
+
+        return os.path.join(self.directory, '{}.lease'.format(name))
+
+    def _take_over(self, name, contents):
+        """Replace an expired lease file with a lease of ``owner``.
+        Several hosts that take over the same lease at the same time
+        replace it within moments of each other, so the lease is read
+        again after ``settle_time``, and only the host whose lease was
+        the last to replace it holds it.
+
+        Parameters
+        ----------
+        name : str
+            Name of the lease
+        contents : str
+            The contents of the lease file of ``owner``
+
+        Returns
+        -------
+        taken : bool
+            ``True`` if the lease is now held by ``owner``
+        """
+
+        path = self._path(name)
+        temporary_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex[:8])
+        with open(temporary_path, 'w') as lease_file:
+            lease_file.write(contents)
+
+        # Another host may have taken over the lease since it was
+        # found to be expired, or the late holder may have finished the
+        # group and released it
+        previous = self.holder(name)
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            age = None
+        if age is None or age <= self.duration:
+            os.remove(temporary_path)
+            return False
+
+        os.replace(temporary_path, path)
+        time.sleep(self.settle_time)
+        holder = self.holder(name)
+        if holder is None or holder['owner'] != self.owner:
+            return False
+
+        owner = 'unknown' if previous is None else previous.get('owner', 'unknown')
+        logging.info('Took over the expired lease {} of {}'.format(name, owner))
+        return True
+
+    def acquire(self, name):
+        """Claim a lease, taking it over if it has expired.
+
+        Parameters
+        ----------
+        name : str
+            Name of the lease (see ``lease_name``)
+
+        Returns
+        -------
+        acquired : bool
+            ``True`` if the lease is now held by ``owner``, and
+            ``False`` if it is held by another host
+        """
+
+        path = self._path(name)
+        contents = json.dumps({'owner': self.owner, 'acquired': time.time()})
+
+        for _ in range(2):
+            try:
+                descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o664)
+            except FileExistsError:
+                try:
+                    age = time.time() - os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+                if age > self.duration:
+                    return self._take_over(name, contents)
+                holder = self.holder(name)
+                return holder is not None and holder['owner'] == self.owner
+
+            with os.fdopen(descriptor, 'w') as lease_file:
+                lease_file.write(contents)
+            return True
+
+        return False
+
+    def holder(self, name):
+        """Return the contents of a lease file.
+
+        Parameters
+        ----------
+        name : str
+            Name of the lease
+
+        Returns
+        -------
+        holder : dict
+            The ``owner`` of the lease and the time at which it was
+            ``acquired``, or ``None`` if the lease is not held
+        """
+
+        try:
+            with open(self._path(name)) as lease_file:
+                return json.load(lease_file)
+        except (FileNotFoundError, ValueError):
+            # A lease file that is being written is not held yet
+            return None
+
+    @contextmanager
+    def keep_alive(self, interval=None):
+        """Renew the leases of ``owner`` in a background thread for the
+        duration of the ``with`` block.
+
+        Parameters
+        ----------
+        interval : float
+            Number of seconds between renewals. Defaults to a quarter
+            of ``duration``.
+        """
+
+        if interval is None:
+            interval = self.duration / 4.
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            while not stop.wait(interval):
+                try:
+                    self.renew()
+                except OSError as error:
+                    logging.warning('Could not renew the leases: {}'.format(error))
+
+        thread = threading.Thread(target=renew_until_stopped, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def release(self, name):
+        """Give up a lease, if it is held by ``owner``.
+
+        Parameters
+        ----------
+        name : str
+            Name of the lease
+        """
+
+        holder = self.holder(name)
+        if holder is not None and holder['owner'] == self.owner:
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def renew(self):
+        """Renew every lease held by ``owner``, by updating the
+        modification time of its file.
+
+        Returns
+        -------
+        renewed : int
+            Number of leases renewed
+        """
+
+        renewed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.lease'):
+                continue
+            holder = self.holder(entry.name[:-len('.lease')])
+            if holder is not None and holder['owner'] == self.owner:
+                try:
+                    os.utime(entry.path)
+                    renewed += 1
+                except FileNotFoundError:
+                    pass
+
+        return renewed
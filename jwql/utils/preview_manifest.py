@@ -0,0 +1,195 @@
+"""Persistent record of the preview images that have been generated.
+
+The manifest stores the size and modification time of the input files
+of every rendered exposure, along with the rendering parameters. An
+exposure is rendered again only if one of its files is new or has
+changed, or if the parameters have changed.
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.preview_manifest import PreviewManifest, file_signatures
+
+        manifest = PreviewManifest('/path/to/preview_manifest.db')
+        entries = manifest.entries()
+        signatures = file_signatures(file_list)
+        if not manifest.is_current(signatures, parameters, entries):
+            # render the preview images, then
+            manifest.record(signatures, parameters)
+"""
+
+import datetime
+import json
+import os
+
+from jwql.utils.sqlite_store import SQLiteStore
+from jwql.utils.utils import get_config
+
+# Largest number of filenames looked up in a single query
+QUERY_CHUNK_SIZE = 500
+
+
+def file_signatures(file_list):
+    """Return the size and modification time of each file.
+
+    Parameters
+    ----------
+    file_list : list
+        List of filenames
+
+    Returns
+    -------
+    signatures : dict
+        ``(size, mtime)`` tuples keyed by filename
+    """
+
+    signatures = {}
+    for filename in file_list:
+        status = os.stat(filename)
+        signatures[filename] = (status.st_size, status.st_mtime)
+
+    return signatures
+
+
+def get_manifest_filename():
+    """Return the location of the preview image manifest. This is the
+    ``preview_manifest`` entry of the config file, if present, and
+    ``<outputs>/generate_preview_images/preview_manifest.db`` otherwise.
+
+    Returns
+    -------
+    filename : str
+        Path of the manifest database
+    """
+
+    settings = get_config()
+    default = os.path.join(settings['outputs'], 'generate_preview_images', 'preview_manifest.db')
+
+    return settings.get('preview_manifest', default)
+
+
+class PreviewManifest(SQLiteStore):
+    """The inputs of the preview images that have been generated.
+
+    Methods
+    -------
+    entries(filenames)
+        Return the contents of the manifest
+    is_current(signatures, parameters, entries)
+        Determine whether the previews of a set of files are up to date
+    record(signatures, parameters)
+        Store the inputs of newly generated previews
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS previews ('
+              'filename TEXT PRIMARY KEY, '
+              'size INTEGER NOT NULL, '
+              'mtime REAL NOT NULL, '
+              'parameters TEXT NOT NULL, '
+              'rendered TEXT NOT NULL)']
+
+    def entries(self, filenames=None):
+        """Return the contents of the manifest. Loading every entry at
+        once is much faster than one query per exposure.
+
+        Parameters
+        ----------
+        filenames : list
+            If given, only the entries of these files are returned
+
+        Returns
+        -------
+        entries : dict
+            ``(size, mtime, parameters)`` tuples keyed by filename
+        """
+
+        with self.connect() as connection:
+            if filenames is None:
+                rows = connection.execute('SELECT filename, size, mtime, parameters FROM previews')
+                return {row[0]: tuple(row[1:]) for row in rows}
+
+            filenames = sorted(set(filenames))
+            entries = {}
+            for start in range(0, len(filenames), QUERY_CHUNK_SIZE):
+                chunk = filenames[start:start + QUERY_CHUNK_SIZE]
+                rows = connection.execute(
+                    'SELECT filename, size, mtime, parameters FROM previews '
+                    'WHERE filename IN ({})'.format(', '.join(['?'] * len(chunk))), chunk)
+                entries.update((row[0], tuple(row[1:])) for row in rows)
+            return entries
+
+    def is_current(self, signatures, parameters, entries=None):
+        """Determine whether the previews made from a set of files are
+        up to date, i.e. whether all of the files are in the manifest
+        with the same size, modification time, and rendering
+        parameters.
+
+        Parameters
+        ----------
+        signatures : dict
+            ``(size, mtime)`` tuples keyed by filename, as returned by
+            ``file_signatures``
+        parameters : dict
+            The rendering parameters
+        entries : dict
+            The output of ``entries``. If not given, the entries of the
+            files of ``signatures`` are read from the manifest.
+
+        Returns
+        -------
+        current : bool
+            ``True`` if the previews do not need to be generated again
+        """
+
+        if entries is None:
+            entries = self.entries(list(signatures))
+        parameters = serialize_parameters(parameters)
+
+        for filename, (size, mtime) in signatures.items():
+            if entries.get(filename) != (size, mtime, parameters):
+                return False
+
+        return True
+
+    def record(self, signatures, parameters):
+        """Store the inputs of newly generated previews, replacing any
+        previous entries for the same files.
+
+        Parameters
+        ----------
+        signatures : dict
+            ``(size, mtime)`` tuples keyed by filename, as returned by
+            ``file_signatures`` before the previews were generated
+        parameters : dict
+            The rendering parameters
+        """
+
+        parameters = serialize_parameters(parameters)
+        rendered = datetime.datetime.now().isoformat()
+        rows = [(filename, size, mtime, parameters, rendered)
+                for filename, (size, mtime) in signatures.items()]
+
+        with self.connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO previews VALUES (?, ?, ?, ?, ?)', rows)
+
+
+def serialize_parameters(parameters):
+    """Return a canonical string representation of the rendering
+    parameters, so that they can be stored and compared.
+
+    Parameters
+    ----------
+    parameters : dict
+        The rendering parameters
+
+    Returns
+    -------
+    serialized : str
+        JSON representation of ``parameters`` with sorted keys
+    """
+
+    return json.dumps(parameters, sort_keys=True)
@@ -0,0 +1,125 @@
+"""Base class for the small SQLite databases kept by ``jwql``.
+
+Several ``jwql`` scripts keep bookkeeping (which previews are up to
+date, which jobs are queued, etc.) that must survive between runs and
+be shared between processes. Rather than each of them managing its own
+connections, they subclass ``SQLiteStore``, which creates the database
+and its tables on first use and hands out short-lived connections that
+commit on success and roll back on error.
+
+Use
+---
+
+    Subclasses define their tables in ``schema``:
+
+    ::
+
+        from jwql.utils.sqlite_store import SQLiteStore
+
+        class MyStore(SQLiteStore):
+            schema = ['CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY)']
+
+        store = MyStore('/path/to/store.db')
+        with store.connect() as connection:
+            connection.execute('INSERT INTO items VALUES (?)', ('name',))
+
+Notes
+-----
+
+    By default, the databases use SQLite's rollback journal, which only
+    relies on file locks. They may therefore be kept in the shared
+    ``outputs`` directory, which is opened by every process of the web
+    server and, for the coordinated mode of ``generate_preview_images``,
+    by several hosts, provided that the network filesystem supports
+    POSIX locks. A store may opt in to the write-ahead log with
+    ``wal=True``, so that readers are not blocked while another process
+    writes. The write-ahead log relies on shared memory, so such a
+    database must be on a local disk and only be opened by processes of
+    a single host. None of the stores of ``jwql`` use it by default.
+"""
+
+from contextlib import contextmanager
+import os
+import sqlite3
+
+from jwql.utils import permissions
+from jwql.utils.utils import ensure_dir_exists
+
+
+class SQLiteStore(object):
+    """Base class of a SQLite database with a fixed schema.
+
+    Attributes
+    ----------
+    filename : str
+        Path of the database file
+    schema : list
+        SQL statements that create the tables and indexes of the
+        database. They are executed every time the store is opened and
+        must therefore be idempotent (``CREATE ... IF NOT EXISTS``).
+    timeout : float
+        Number of seconds to wait for a lock held by another process
+        before giving up
+    wal : bool
+        ``True`` if the database uses the write-ahead log
+
+    Methods
+    -------
+    connect()
+        Open a connection to the database
+    """
+
+    schema = []
+
+    def __init__(self, filename, timeout=30., wal=False):
+        """Create the database and its tables if they do not exist.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the database file
+        timeout : float
+            Number of seconds to wait for a lock held by another
+            process
+        wal : bool
+            If ``True``, use the write-ahead log. The database must
+            then be on a local disk.
+        """
+
+        self.filename = filename
+        self.timeout = timeout
+        self.wal = wal
+
+        directory = os.path.dirname(filename)
+        if directory:
+            ensure_dir_exists(directory)
+        new_database = not os.path.exists(filename)
+
+        with self.connect() as connection:
+            # The journal mode is persistent, so a database that used
+            # the write-ahead log is switched back if it no longer does
+            connection.execute('PRAGMA journal_mode={}'.format('WAL' if wal else 'DELETE'))
+            for statement in self.schema:
+                connection.execute(statement)
+
+        if new_database:
+            permissions.set_permissions(filename)
+
+    @contextmanager
+    def connect(self):
+        """Open a connection to the database. The transaction is
+        committed when the ``with`` block exits normally and rolled
+        back if it raises, and the connection is then closed.
+
+        Yields
+        ------
+        connection : obj
+            ``sqlite3.Connection`` object
+        """
+
+        connection = sqlite3.connect(self.filename, timeout=self.timeout)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
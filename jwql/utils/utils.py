@@ -29,6 +29,7 @@ References
     - JWST TR JWST-STScI-004800, SM-12
  """
 
+from collections import OrderedDict
 import getpass
 import json
 import os
@@ -39,6 +40,9 @@ from jwql.utils.constants import FILE_SUFFIX_TYPES
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
+# Multipliers of the size suffixes accepted by parse_size
+SIZE_UNITS = OrderedDict([('T', 2**40), ('G', 2**30), ('M', 2**20), ('K', 2**10), ('B', 1)])
+
 
 def ensure_dir_exists(fullpath):
     """Creates dirs from ``fullpath`` if they do not already exist.
@@ -214,6 +218,27 @@ def filename_parser(filename):
     return filename_dict
 
 
+def format_size(size):
+    """Return a human readable representation of a number of bytes.
+
+    Parameters
+    ----------
+    size : int
+        Number of bytes
+
+    Returns
+    -------
+    formatted : str
+        The size, e.g. ``12.3 G``
+    """
+
+    for suffix, multiplier in SIZE_UNITS.items():
+        if size >= multiplier:
+            return '{:.1f} {}'.format(size / multiplier, suffix)
+
+    return '0 B'
+
+
 def get_base_url():
     """Return the beginning part of the URL to the ``jwql`` web app
     based on which user is running the software.
@@ -259,3 +284,31 @@ def get_config():
         settings = json.load(config_file)
 
     return settings
+
+
+def parse_size(size):
+    """Convert a size such as ``500G`` or ``1.5T`` to bytes.
+
+    Parameters
+    ----------
+    size : str
+        A number, optionally followed by ``K``, ``M``, ``G``, or ``T``
+
+    Returns
+    -------
+    size : int
+        Number of bytes
+    """
+
+    number = size.strip().upper()
+    if len(number) > 1 and number.endswith('B') and number[-2] in SIZE_UNITS:
+        number = number[:-1]
+    multiplier = 1
+    if number[-1:] in SIZE_UNITS:
+        multiplier = SIZE_UNITS[number[-1]]
+        number = number[:-1]
+
+    try:
+        return int(float(number) * multiplier)
+    except ValueError:
+        raise ValueError('Invalid size: {}'.format(size))
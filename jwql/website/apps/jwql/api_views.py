@@ -22,6 +22,31 @@ not be the full rootname, but can be any shortened version, (e.g.
 ``jw8660000801_02101``, or ``jw8660``); using an abbreviated version
 will return all filenames associated with the rootname up to that point.
 
+Every service accepts the following optional query parameters:
+
+    - ``limit``: the largest number of items to return. The response
+      then includes a ``next_cursor``, to be passed as ``cursor`` to get
+      the next page, which is ``null`` on the last page.
+    - ``cursor``: the ``next_cursor`` of the previous page
+    - ``fields``: a comma-separated list of fields of the files to
+      return instead of their names (any of ``path``, ``filename``,
+      ``rootname``, ``instrument``, ``detector``, ``suffix``, and
+      ``extension``), e.g. ``?fields=filename,suffix``. Each item is
+      then a JSON object.
+    - ``stream``: if ``true``, the response is sent in chunks as it is
+      serialized, rather than built in memory first
+
+For example, ``/api/nircam/thumbnails/?limit=1000`` returns the first
+1000 thumbnails of NIRCam, and a script can walk all of them by passing
+each ``next_cursor`` back until it is ``null``. The pages of the
+listings of files are read from the filesystem index directly, so a
+request only reads the files of its page.
+
+The responses carry ``ETag`` and ``Last-Modified`` headers, derived from
+the version of the filesystem index and of the MAST cache, so that a
+client that sends them back with ``If-None-Match`` or
+``If-Modified-Since`` gets ``304 Not Modified`` until the files change.
+
 Authors
 -------
 
@@ -44,7 +69,16 @@ References
         ``https://docs.djangoproject.com/en/2.0/topics/http/views/``
 """
 
-from django.http import JsonResponse
+import base64
+import bisect
+from functools import partial
+import json
+import os
+
+from django.http import JsonResponse, StreamingHttpResponse
+
+from jwql.utils.filesystem_index import parse_indexed_filename
+from .conditional import listing_condition
 
 from .data_containers import get_all_proposals
 from .data_containers import get_filenames_by_proposal
@@ -57,7 +91,117 @@ from .data_containers import get_thumbnails_by_instrument
 from .data_containers import get_thumbnails_by_proposal
 from .data_containers import get_thumbnails_by_rootname
 
+# The fields of the files that can be selected with ``fields``
+FILE_FIELDS = ['path', 'filename', 'rootname', 'instrument', 'detector', 'suffix', 'extension']
+
+# Number of items serialized at a time in streamed responses
+STREAM_CHUNK_SIZE = 1000
+
+
+def _decode_cursor(cursor):
+    """Return the item after which a page starts.
+
+    Parameters
+    ----------
+    cursor : str
+        The ``next_cursor`` of the previous page
+
+    Returns
+    -------
+    item : str
+        The last item of the previous page
+
+    Raises
+    ------
+    ValueError
+        If the cursor is not valid URL-safe base64 of UTF-8 text
+    """
+
+    # Characters outside of the alphabet are rejected rather than
+    # silently dropped
+    return base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+
+
+def _encode_cursor(item):
+    """Return the cursor of the page that follows ``item``.
+
+    Parameters
+    ----------
+    item : str
+        The last item of a page
 
+    Returns
+    -------
+    cursor : str
+        Opaque, URL-safe cursor
+    """
+
+    return base64.urlsafe_b64encode(item.encode('utf-8')).decode('ascii')
+
+
+def _list_response(request, key, items, files=True):
+    """Return a list of items, paginated, reduced to the selected
+    fields, and streamed as requested by the query parameters (see the
+    module docstring).
+
+    Parameters
+    ----------
+    request : HttpRequest object
+        Incoming request from the webpage
+    key : str
+        Key of the list in the JSON object (e.g. ``thumbnails``)
+    items : list or func
+        The items to return, or, for listings of the filesystem index,
+        a function that returns the items sorted by filename given the
+        ``after`` and ``limit`` arguments of ``FilesystemIndex.query``,
+        so that only a page is read (see ``paginate_query``)
+    files : bool
+        ``True`` if the items are files, whose fields may be selected
+
+    Returns
+    -------
+    JsonResponse or StreamingHttpResponse object
+        Outgoing response sent to the webpage
+    """
+
+    try:
+        limit = request.GET.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = int(limit)
+        cursor = request.GET.get('cursor')
+        if cursor is not None:
+            cursor = _decode_cursor(cursor)
+        fields = request.GET.get('fields')
+        if fields is not None:
+            fields = fields.split(',')
+            unknown = [field for field in fields if field not in FILE_FIELDS]
+            if not files or len(unknown) > 0:
+                raise ValueError('Unknown fields: {}'.format(', '.join(unknown or fields)))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    response = {}
+    if limit is not None or cursor is not None:
+        if callable(items):
+            items, next_cursor = paginate_query(items, limit=limit, cursor=cursor)
+        else:
+            items, next_cursor = paginate(items, limit=limit, cursor=cursor)
+        response['next_cursor'] = next_cursor
+    elif callable(items):
+        items = items(None, None)
+    if fields is not None:
+        items = select_fields(items, fields)
+    response[key] = items
+
+    if request.GET.get('stream', '').lower() in ['1', 'true', 'yes']:
+        return StreamingHttpResponse(stream_json(response, key), content_type='application/json')
+
+    return JsonResponse(response, json_dumps_params={'indent': 2})
+
+
+@listing_condition(['filesystem'])
 def all_proposals(request):
     """Return a list of proposals for the mission
 
@@ -68,14 +212,15 @@ def all_proposals(request):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
     proposals = get_all_proposals()
-    return JsonResponse({'proposals': proposals}, json_dumps_params={'indent': 2})
+    return _list_response(request, 'proposals', proposals, files=False)
 
 
+@listing_condition(['filesystem'])
 def filenames_by_proposal(request, proposal):
     """Return a list of filenames for the given ``proposal``
 
@@ -88,14 +233,15 @@ def filenames_by_proposal(request, proposal):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    filenames = get_filenames_by_proposal(proposal)
-    return JsonResponse({'filenames': filenames}, json_dumps_params={'indent': 2})
+    filenames = partial(get_filenames_by_proposal, proposal)
+    return _list_response(request, 'filenames', filenames)
 
 
+@listing_condition(['filesystem'])
 def filenames_by_rootname(request, rootname):
     """Return a list of filenames for the given ``rootname``
 
@@ -108,14 +254,15 @@ def filenames_by_rootname(request, rootname):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    filenames = get_filenames_by_rootname(rootname)
-    return JsonResponse({'filenames': filenames}, json_dumps_params={'indent': 2})
+    filenames = partial(get_filenames_by_rootname, rootname)
+    return _list_response(request, 'filenames', filenames)
 
 
+@listing_condition([], mast_column='program')
 def instrument_proposals(request, inst):
     """Return a list of proposals for the given instrument
 
@@ -131,14 +278,15 @@ def instrument_proposals(request, inst):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
     proposals = get_instrument_proposals(inst)
-    return JsonResponse({'proposals': proposals}, json_dumps_params={'indent': 2})
+    return _list_response(request, 'proposals', proposals, files=False)
 
 
+@listing_condition(['preview_images'], mast_column='filename')
 def preview_images_by_instrument(request, inst):
     """Return a list of available preview images in the filesystem for
     the given instrument.
@@ -155,14 +303,15 @@ def preview_images_by_instrument(request, inst):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    preview_images = get_preview_images_by_instrument(inst)
-    return JsonResponse({'preview_images': preview_images}, json_dumps_params={'indent': 2})
+    preview_images = partial(get_preview_images_by_instrument, inst)
+    return _list_response(request, 'preview_images', preview_images)
 
 
+@listing_condition(['preview_images'])
 def preview_images_by_proposal(request, proposal):
     """Return a list of available preview images in the filesystem for
     the given ``proposal``.
@@ -176,14 +325,15 @@ def preview_images_by_proposal(request, proposal):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    preview_images = get_preview_images_by_proposal(proposal)
-    return JsonResponse({'preview_images': preview_images}, json_dumps_params={'indent': 2})
+    preview_images = partial(get_preview_images_by_proposal, proposal)
+    return _list_response(request, 'preview_images', preview_images)
 
 
+@listing_condition(['preview_images'])
 def preview_images_by_rootname(request, rootname):
     """Return a list of available preview images in the filesystem for
     the given ``rootname``.
@@ -197,14 +347,15 @@ def preview_images_by_rootname(request, rootname):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    preview_images = get_preview_images_by_rootname(rootname)
-    return JsonResponse({'preview_images': preview_images}, json_dumps_params={'indent': 2})
+    preview_images = partial(get_preview_images_by_rootname, rootname)
+    return _list_response(request, 'preview_images', preview_images)
 
 
+@listing_condition(['thumbnails'], mast_column='filename')
 def thumbnails_by_instrument(request, inst):
     """Return a list of available thumbnails in the filesystem for the
     given instrument.
@@ -221,14 +372,15 @@ def thumbnails_by_instrument(request, inst):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    thumbnails = get_thumbnails_by_instrument(inst)
-    return JsonResponse({'thumbnails': thumbnails}, json_dumps_params={'indent': 2})
+    thumbnails = partial(get_thumbnails_by_instrument, inst)
+    return _list_response(request, 'thumbnails', thumbnails)
 
 
+@listing_condition(['thumbnails'])
 def thumbnails_by_proposal(request, proposal):
     """Return a list of available thumbnails in the filesystem for the
     given ``proposal``.
@@ -242,14 +394,15 @@ def thumbnails_by_proposal(request, proposal):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    thumbnails = get_thumbnails_by_proposal(proposal)
-    return JsonResponse({'thumbnails': thumbnails}, json_dumps_params={'indent': 2})
+    thumbnails = partial(get_thumbnails_by_proposal, proposal)
+    return _list_response(request, 'thumbnails', thumbnails)
 
 
+@listing_condition(['thumbnails'])
 def thumbnails_by_rootname(request, rootname):
     """Return a list of available thumbnails in the filesystem for the
     given ``rootname``.
@@ -263,9 +416,130 @@ def thumbnails_by_rootname(request, rootname):
 
     Returns
     -------
-    JsonResponse object
+    JsonResponse or StreamingHttpResponse object
         Outgoing response sent to the webpage
     """
 
-    thumbnails = get_thumbnails_by_rootname(rootname)
-    return JsonResponse({'thumbnails': thumbnails}, json_dumps_params={'indent': 2})
+    thumbnails = partial(get_thumbnails_by_rootname, rootname)
+    return _list_response(request, 'thumbnails', thumbnails)
+
+
+def paginate(items, limit=None, cursor=None):
+    """Return a page of items, in sorted order.
+
+    Parameters
+    ----------
+    items : list
+        The items, as strings
+    limit : int (optional)
+        Largest number of items on the page. All of the remaining items
+        if ``None``.
+    cursor : str (optional)
+        The last item of the previous page, as decoded from its
+        ``next_cursor``. The first page if ``None``.
+
+    Returns
+    -------
+    page : list
+        The items of the page
+    next_cursor : str
+        The cursor of the next page, or ``None`` on the last page
+    """
+
+    items = sorted(items)
+    start = 0 if cursor is None else bisect.bisect_right(items, cursor)
+    stop = len(items) if limit is None else min(start + limit, len(items))
+    page = items[start:stop]
+    next_cursor = _encode_cursor(page[-1]) if stop < len(items) else None
+
+    return page, next_cursor
+
+
+def paginate_query(query, limit=None, cursor=None):
+    """Return a page of files read from the filesystem index, which
+    only reads the files of the page.
+
+    Parameters
+    ----------
+    query : func
+        Function that returns the files (paths or names) sorted by
+        filename, given the filename after which they start (or
+        ``None``) and the largest number of files (or ``None``)
+    limit : int (optional)
+        Largest number of files on the page. All of the remaining files
+        if ``None``.
+    cursor : str (optional)
+        The filename of the last file of the previous page, as decoded
+        from its ``next_cursor``. The first page if ``None``.
+
+    Returns
+    -------
+    page : list
+        The files of the page
+    next_cursor : str
+        The cursor of the next page, or ``None`` on the last page
+    """
+
+    # One more file than the page holds tells whether there is a next
+    # page
+    page = query(cursor, None if limit is None else limit + 1)
+    next_cursor = None
+    if limit is not None and len(page) > limit:
+        page = page[:limit]
+        next_cursor = _encode_cursor(os.path.basename(page[-1]))
+
+    return page, next_cursor
+
+
+def select_fields(filepaths, fields):
+    """Return the selected fields of files.
+
+    Parameters
+    ----------
+    filepaths : list
+        Paths (or names) of the files
+    fields : list
+        Names of the fields, from ``FILE_FIELDS``
+
+    Returns
+    -------
+    selected : list
+        One dictionary of the selected fields per file
+    """
+
+    selected = []
+    for filepath in filepaths:
+        filename = os.path.basename(filepath)
+        values = parse_indexed_filename(filename)
+        values.update({'path': filepath, 'filename': filename})
+        selected.append({field: values[field] for field in fields})
+
+    return selected
+
+
+def stream_json(response, key):
+    """Serialize a JSON object whose ``key`` is a long list in chunks
+    of ``STREAM_CHUNK_SIZE`` items, so that the whole response is never
+    held in memory as text.
+
+    Parameters
+    ----------
+    response : dict
+        The JSON object
+    key : str
+        The key of the list
+
+    Yields
+    ------
+    chunk : str
+        The next part of the serialized object
+    """
+
+    others = {name: value for name, value in response.items() if name != key}
+    yield (json.dumps(others)[:-1] + (', ' if len(others) > 0 else '')
+           + '{}: ['.format(json.dumps(key)))
+    items = response[key]
+    for start in range(0, len(items), STREAM_CHUNK_SIZE):
+        chunk = ', '.join(json.dumps(item) for item in items[start:start + STREAM_CHUNK_SIZE])
+        yield (', ' if start > 0 else '') + chunk
+    yield ']}'
@@ -0,0 +1,117 @@
+"""Conditional GET support for the views of the ``jwql`` web app.
+
+Automated clients poll the REST API and the AJAX views of the archive
+pages, and most polls return the same result as the previous one. The
+decorators of this module set the ``ETag`` and ``Last-Modified``
+headers of the responses of a view, and answer ``304 Not Modified``
+when the client already has the current version, without calling the
+view. The validators are derived from cheap version counters rather
+than from the responses: the generation of the stores of the
+filesystem index and the time the MAST values were fetched into the
+MAST cache for listings, and the size and modification time of the file
+for files.
+
+Use
+---
+
+    The decorators are applied to views as such:
+
+    ::
+
+        from .conditional import listing_condition
+
+        @listing_condition(['thumbnails'], mast_column='filename')
+        def thumbnails_by_instrument(request, inst):
+            ...
+"""
+
+from datetime import datetime
+import hashlib
+import os
+
+from django.views.decorators.http import condition
+
+from .data_containers import get_listing_version
+import jwql
+
+
+def file_condition(path_function):
+    """Return a decorator that validates the responses of a view that
+    serves a file by the size and modification time of the file.
+
+    Parameters
+    ----------
+    path_function : func
+        Function that returns the path of the file from the arguments
+        of the view, excluding the request
+
+    Returns
+    -------
+    decorator : func
+        ``django.views.decorators.http.condition`` decorator
+    """
+
+    def status(request, *args, **kwargs):
+        try:
+            return os.stat(path_function(*args, **kwargs))
+        except OSError:
+            # Let the view answer for missing files
+            return None
+
+    def etag(request, *args, **kwargs):
+        stat = status(request, *args, **kwargs)
+        if stat is None:
+            return None
+        return '"{:x}-{:x}"'.format(stat.st_size, int(stat.st_mtime * 1e6))
+
+    def last_modified(request, *args, **kwargs):
+        stat = status(request, *args, **kwargs)
+        if stat is None:
+            return None
+        return datetime.utcfromtimestamp(stat.st_mtime)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def listing_condition(stores, mast_column=None):
+    """Return a decorator that validates the responses of a view that
+    lists files by the version of the stores and MAST values they are
+    built from (see ``data_containers.get_listing_version``).
+
+    The ``ETag`` is weak, because the same listing may be serialized
+    differently, e.g. when it is streamed.
+
+    Parameters
+    ----------
+    stores : list
+        Names of the stores of the filesystem index the listing is
+        built from
+    mast_column : str (optional)
+        Name of the MAST column the listing is built from. The
+        instrument is then taken from the ``inst`` argument of the
+        view.
+
+    Returns
+    -------
+    decorator : func
+        ``django.views.decorators.http.condition`` decorator
+    """
+
+    def version(request, *args, **kwargs):
+        # The version is computed once per request, for both validators
+        if not hasattr(request, '_listing_version'):
+            request._listing_version = get_listing_version(
+                stores, instrument=kwargs.get('inst'), mast_column=mast_column)
+        return request._listing_version
+
+    def etag(request, *args, **kwargs):
+        listing_version = '{};{}'.format(jwql.__version__, version(request, *args, **kwargs)[0])
+        return 'W/"{}"'.format(hashlib.md5(listing_version.encode('utf-8')).hexdigest())
+
+    def last_modified(request, *args, **kwargs):
+        modified = version(request, *args, **kwargs)[1]
+        if modified == 0:
+            return None
+        return datetime.utcfromtimestamp(modified)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
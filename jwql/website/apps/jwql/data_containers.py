@@ -21,13 +21,13 @@ Use
         from .data_containers import get_proposal_info
 """
 
+from collections import OrderedDict
 import copy
 import glob
 import os
 import re
 import tempfile
 
-from astropy.io import fits
 from astropy.time import Time
 from astroquery.mast import Mast
 from bokeh.embed import components
@@ -36,9 +36,11 @@ import numpy as np
 
 from jwql.edb.edb_interface import mnemonic_inventory
 from jwql.edb.engineering_database import get_mnemonic, get_mnemonic_info
-from jwql.jwql_monitors import monitor_cron_jobs
-from jwql.utils.constants import MONITORS
-from jwql.utils.preview_image import PreviewImage
+from jwql.utils.constants import MONITORS, NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
+from jwql.utils.filesystem_index import FilesystemIndex, get_index_filename
+from jwql.utils.header_cache import HeaderCache, get_header_cache_filename
+from jwql.utils.mast_cache import MastCache, get_mast_cache_filename
+from jwql.utils.preview_jobs import PreviewJobQueue, get_job_queue_filename
 from jwql.utils.utils import get_config, filename_parser
 from .forms import MnemonicSearchForm, MnemonicQueryForm, MnemonicExplorationForm
 
@@ -49,10 +51,217 @@ THUMBNAIL_FILESYSTEM = os.path.join(get_config()['jwql_dir'], 'thumbnails')
 PACKAGE_DIR = os.path.dirname(__location__.split('website')[0])
 REPO_DIR = os.path.split(PACKAGE_DIR)[0]
 
+# The stores of the filesystem index, and the largest age in seconds of
+# their index before it is updated by a request
+INDEXED_STORES = {'filesystem': FILESYSTEM_DIR,
+                  'preview_images': PREVIEW_IMAGE_FILESYSTEM,
+                  'thumbnails': THUMBNAIL_FILESYSTEM}
+INDEX_MAX_AGE = get_config().get('filesystem_index_max_age', 60.)
 
-def data_trending():
+# The number of files read from the index at once when a page of files
+# is filtered by their rootnames
+INDEX_PAGE_SIZE = 1000
+
+# The number of seconds after which the cached results of MAST queries
+# are refreshed in the background
+MAST_CACHE_TTL = get_config().get('mast_cache_ttl', 600.)
+
+# The files read by get_dashboard_components, kept between requests: the
+# component files of each monitor directory, keyed by directory, and the
+# contents of each file, keyed by path, along with the modification
+# times they were read at
+DASHBOARD_DIRECTORIES = {}
+DASHBOARD_FILES = {}
+
+
+def _get_index(store):
+    """Return the filesystem index, after bringing the index of the
+    given store up to date if it is older than ``INDEX_MAX_AGE``.
+
+    Parameters
+    ----------
+    store : str
+        ``filesystem``, ``preview_images``, or ``thumbnails``
+
+    Returns
+    -------
+    index : obj
+        ``FilesystemIndex`` object
+    """
+
+    index = FilesystemIndex(get_index_filename())
+    index.refresh(store, INDEXED_STORES[store], max_age=INDEX_MAX_AGE)
+
+    return index
+
+
+def _get_dashboard_file(path):
+    """Return the contents of a file shown on the dashboard, which are
+    only read again if the modification time of the file has changed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file
+
+    Returns
+    -------
+    contents : str
+        The contents of the file, or ``None`` if it does not exist
+    """
+
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        DASHBOARD_FILES.pop(path, None)
+        return None
+
+    cached = DASHBOARD_FILES.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = (mtime, f.read())
+        DASHBOARD_FILES[path] = cached
+
+    return cached[1]
+
+
+def _query_by_rootnames(store, rootnames, after=None, limit=None, **filters):
+    """Return the paths of the indexed files of a store that belong
+    to the given rootnames. With a ``limit``, the index is read in
+    batches until the page is full, rather than all at once.
+
+    Parameters
+    ----------
+    store : str
+        ``filesystem``, ``preview_images``, or ``thumbnails``
+    rootnames : set
+        The names of the files, up to the ``_integ`` part of the names
+        of preview images and thumbnails
+    after : str (optional)
+        If given, only the files whose names sort after it are returned
+    limit : int (optional)
+        If given, the largest number of files to return
+    **filters : dict
+        Filters of ``FilesystemIndex.query``
+
+    Returns
+    -------
+    filepaths : list
+        Full paths of the matching files, sorted by filename
+    """
+
+    index = _get_index(store)
+    batch_size = None if limit is None else max(limit, INDEX_PAGE_SIZE)
+    filepaths = []
+    while True:
+        batch = index.query(store, after=after, limit=batch_size, **filters)
+        filepaths.extend(item for item in batch
+                         if os.path.basename(item).split('_integ')[0] in rootnames)
+        if limit is None or len(batch) < batch_size or len(filepaths) >= limit:
+            break
+        after = os.path.basename(batch[-1])
+
+    return filepaths[:limit]
+
+
+def _get_mast_column(instrument, column):
+    """Return the distinct values of a column of the MAST table of an
+    instrument, from the MAST cache. Stale values are returned while
+    they are refreshed in the background.
+
+    Parameters
+    ----------
+    instrument : str
+        Name of the JWST instrument (e.g. ``NIRCam``)
+    column : str
+        Name of the column (e.g. ``filename``)
+
+    Returns
+    -------
+    values : list
+        The sorted values of the column
+    """
+
+    key, query = _mast_column_query(instrument, column)
+    cache = MastCache(get_mast_cache_filename(), ttl=MAST_CACHE_TTL)
+
+    return cache.get(key, query)
+
+
+def _get_mast_fetched(instrument, column):
+    """Return the time the values of a column of the MAST table of an
+    instrument were last fetched into the MAST cache. They are
+    refreshed in the background first if they are stale.
+
+    Parameters
+    ----------
+    instrument : str
+        Name of the JWST instrument (e.g. ``NIRCam``)
+    column : str
+        Name of the column (e.g. ``filename``)
+
+    Returns
+    -------
+    fetched : float
+        Time of the last fetch
+    """
+
+    # The cached values themselves are not read
+    key, query = _mast_column_query(instrument, column)
+    cache = MastCache(get_mast_cache_filename(), ttl=MAST_CACHE_TTL)
+
+    return cache.revalidate(key, query)
+
+
+def _mast_column_query(instrument, column):
+    """Return the key of the values of a column of the MAST table of
+    an instrument in the MAST cache, and the function that fetches
+    them.
+
+    Parameters
+    ----------
+    instrument : str
+        Name of the JWST instrument (e.g. ``NIRCam``)
+    column : str
+        Name of the column (e.g. ``filename``)
+
+    Returns
+    -------
+    key : str
+        Key of the values in the MAST cache (e.g. ``Nircam:filename``)
+    query : func
+        Function without arguments that returns the sorted values
+    """
+
+    # Make sure the instrument is of the proper format (e.g. "Nircam")
+    instrument = instrument[0].upper() + instrument[1:].lower()
+
+    def query():
+        service = "Mast.Jwst.Filtered.{}".format(instrument)
+        params = {"columns": column,
+                  "filters": []}
+        response = Mast.service_request_async(service, params)
+        results = response[0].json()['data']
+        return sorted(set(result[column] for result in results))
+
+    return '{}:{}'.format(instrument, column), query
+
+
+def data_trending(start=None, end=None):
     """Container for Miri datatrending dashboard and components
 
+    The dashboard is served from the dashboard cache, which is only
+    built again when the data trending database changes.
+
+    Parameters
+    ----------
+    start : str (optional)
+        Start of the time range of the dashboard. The default start of
+        the dashboard if ``None``.
+    end : str (optional)
+        End of the time range of the dashboard. The current time if
+        ``None``.
+
     Returns
     -------
     variables : int
@@ -62,7 +271,9 @@ def data_trending():
         dashboard
     """
     import jwql.instrument_monitors.miri_monitors.data_trending.dashboard as dash
-    dashboard, variables = dash.data_trending_dashboard()
+    if start is None:
+        start = dash.default_start
+    dashboard, variables = dash.cached_data_trending_dashboard(start, end)
 
     return variables, dashboard
 
@@ -110,7 +321,7 @@ def get_all_proposals():
         filesystem
     """
 
-    proposals = glob.glob(os.path.join(FILESYSTEM_DIR, '*'))
+    proposals = _get_index('filesystem').directories('filesystem')
     proposals = [proposal.split('jw')[-1] for proposal in proposals]
     proposals = [proposal for proposal in proposals if len(proposal) == 5]
 
@@ -121,6 +332,11 @@ def get_dashboard_components():
     """Build and return dictionaries containing components and html
     needed for the dashboard.
 
+    The components are written by the monitors, and the cron job status
+    table by the ``monitor_cron_jobs`` script, which runs as a
+    scheduled job. The files are kept in memory between requests and
+    read again only when they change.
+
     Returns
     -------
     dashboard_components : dict
@@ -143,34 +359,40 @@ def get_dashboard_components():
     # Exclude monitors that can't be saved as components
     exclude_list = ['monitor_cron_jobs']
 
-    # Run the cron job monitor to produce an updated table
-    monitor_cron_jobs.status(production_mode=True)
-
-    # Build dictionary of components
+    # Build dictionary of components from the monitor directories. A
+    # directory is only listed again when files were added to or
+    # removed from it, and files only read again when they changed.
     dashboard_components = {}
-    for dir_name, subdir_list, file_list in os.walk(output_dir):
-        monitor_name = os.path.basename(dir_name)
-        if monitor_name not in exclude_list:
-            dashboard_components[name_dict[monitor_name]] = {}
-            for fname in file_list:
-                if 'component' in fname:
-                    full_fname = '{}/{}'.format(monitor_name, fname)
-                    plot_name = fname.split('_component')[0]
-
-                    # Get the div
-                    html_file = full_fname.split('.')[0] + '.html'
-                    with open(os.path.join(output_dir, html_file)) as f:
-                        div = f.read()
-
-                    # Get the script
-                    js_file = full_fname.split('.')[0] + '.js'
-                    with open(os.path.join(output_dir, js_file)) as f:
-                        script = f.read()
-                    dashboard_components[name_dict[monitor_name]][name_dict[plot_name]] = [div, script]
-
-    # Add HTML that cannot be saved as components to the dictionary
-    with open(os.path.join(output_dir, 'monitor_cron_jobs', 'cron_status_table.html')) as f:
-        cron_status_table_html = f.read()
+    monitor_dirs = sorted((entry for entry in os.scandir(output_dir)
+                           if entry.is_dir() and entry.name not in exclude_list),
+                          key=lambda entry: entry.name)
+    for entry in monitor_dirs:
+        mtime = entry.stat().st_mtime
+        cached = DASHBOARD_DIRECTORIES.get(entry.path)
+        if cached is None or cached[0] != mtime:
+            plot_names = sorted(set(fname.split('_component')[0] for fname in os.listdir(entry.path)
+                                    if '_component' in fname))
+            cached = (mtime, plot_names)
+            DASHBOARD_DIRECTORIES[entry.path] = cached
+
+        monitor_components = {}
+        for plot_name in cached[1]:
+            # Get the div and the script
+            div = _get_dashboard_file(os.path.join(entry.path, plot_name + '_component.html'))
+            script = _get_dashboard_file(os.path.join(entry.path, plot_name + '_component.js'))
+            if div is not None and script is not None:
+                monitor_components[name_dict.get(plot_name, plot_name)] = [div, script]
+        if len(monitor_components) > 0:
+            dashboard_components[name_dict.get(entry.name, entry.name)] = monitor_components
+
+    # Add HTML that cannot be saved as components to the dictionary. The
+    # cron job status table is written by the monitor_cron_jobs script,
+    # which runs as a scheduled job.
+    cron_status_table_html = _get_dashboard_file(
+        os.path.join(output_dir, 'monitor_cron_jobs', 'cron_status_table.html'))
+    if cron_status_table_html is None:
+        cron_status_table_html = ('<p>The cron job status table has not been created yet. It is '
+                                  'created by <code>monitor_cron_jobs.py</code>.</p>')
     dashboard_html = {}
     dashboard_html['Cron Job Monitor'] = cron_status_table_html
 
@@ -328,18 +550,13 @@ def get_filenames_by_instrument(instrument):
 
     # Find all of the matching files in filesytem
     # (TEMPORARY WHILE THE MAST STUFF IS BEING WORKED OUT)
-    instrument_match = {'FGS': 'guider',
-                        'MIRI': 'mir',
-                        'NIRCam': 'nrc',
-                        'NIRISS': 'nis',
-                        'NIRSpec': 'nrs'}
-    search_filepath = os.path.join(FILESYSTEM_DIR, '*', '*.fits')
-    filepaths = [f for f in glob.glob(search_filepath) if instrument_match[instrument] in f]
+    filepaths = _get_index('filesystem').query('filesystem', instrument=instrument.lower(),
+                                               extension='fits')
 
     return filepaths
 
 
-def get_filenames_by_proposal(proposal):
+def get_filenames_by_proposal(proposal, after=None, limit=None):
     """Return a list of filenames that are available in the filesystem
     for the given ``proposal``.
 
@@ -348,20 +565,27 @@ def get_filenames_by_proposal(proposal):
     proposal : str
         The five-digit proposal number (e.g. ``88600``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     filenames : list
         A list of filenames associated with the given ``proposal``.
     """
 
-    filenames = sorted(glob.glob(os.path.join(
-        FILESYSTEM_DIR, 'jw{}'.format(proposal), '*')))
+    filenames = _get_index('filesystem').query('filesystem', program=proposal, after=after,
+                                               limit=limit)
     filenames = [os.path.basename(filename) for filename in filenames]
 
     return filenames
 
 
-def get_filenames_by_rootname(rootname):
+def get_filenames_by_rootname(rootname, after=None, limit=None):
     """Return a list of filenames available in the filesystem that
     are part of the given ``rootname``.
 
@@ -370,6 +594,13 @@ def get_filenames_by_rootname(rootname):
     rootname : str
         The rootname of interest (e.g. ``jw86600008001_02101_00007_guider2``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     filenames : list
@@ -377,10 +608,8 @@ def get_filenames_by_rootname(rootname):
     """
 
     proposal = rootname.split('_')[0].split('jw')[-1][0:5]
-    filenames = sorted(glob.glob(os.path.join(
-        FILESYSTEM_DIR,
-        'jw{}'.format(proposal),
-        '{}*'.format(rootname))))
+    filenames = _get_index('filesystem').query('filesystem', pattern='{}*'.format(rootname),
+                                               program=proposal, after=after, limit=limit)
     filenames = [os.path.basename(filename) for filename in filenames]
 
     return filenames
@@ -402,7 +631,7 @@ def get_header_info(file):
 
     dirname = file[:7]
     fits_filepath = os.path.join(FILESYSTEM_DIR, dirname, file)
-    header = fits.getheader(fits_filepath, ext=0).tostring(sep='\n')
+    header = HeaderCache(get_header_cache_filename()).header(fits_filepath)
 
     return header
 
@@ -423,7 +652,12 @@ def get_image_info(file_root, rewrite):
     -------
     image_info : dict
         A dictionary containing various information for the given
-        ``file_root``.
+        ``file_root``. If JPEGs are missing (or ``rewrite`` is
+        ``True``), a job is submitted to the preview job queue, and
+        ``preview_job`` holds its status. For NIRCam detectors that are
+        part of a mosaic, ``tiled_images`` maps the names of the
+        preview images of ``file_root`` to the tile pyramids of the
+        mosaic shown in their place.
     """
 
     # Initialize dictionary to store information
@@ -431,6 +665,9 @@ def get_image_info(file_root, rewrite):
     image_info['all_jpegs'] = []
     image_info['suffixes'] = []
     image_info['num_ints'] = {}
+    image_info['tiled_images'] = {}
+    image_info['preview_job'] = None
+    render = False
 
     preview_dir = os.path.join(get_config()['jwql_dir'], 'preview_images')
 
@@ -439,6 +676,17 @@ def get_image_info(file_root, rewrite):
     search_filepath = os.path.join(FILESYSTEM_DIR, dirname, file_root + '*.fits')
     image_info['all_files'] = glob.glob(search_filepath)
 
+    # Deep-zoom tile pyramids are only saved for NIRCam mosaics, which
+    # are named after the exposure with the detector replaced by the
+    # mosaic (see ``generate_preview_images.create_dummy_filename``).
+    # The mosaic that includes the detector is shown in its place.
+    mosaic_root = None
+    name_parts = file_root.split('_')
+    if len(name_parts) == 4 and name_parts[3].upper() in NIRCAM_SHORTWAVE_DETECTORS:
+        mosaic_root = '_'.join(name_parts[:3] + ['NRC_SW*_MOSAIC'])
+    elif len(name_parts) == 4 and name_parts[3].upper() in NIRCAM_LONGWAVE_DETECTORS:
+        mosaic_root = '_'.join(name_parts[:3] + ['NRC_LW*_MOSAIC'])
+
     for file in image_info['all_files']:
 
         # Get suffix information
@@ -450,26 +698,36 @@ def get_image_info(file_root, rewrite):
         jpg_filename = os.path.basename(os.path.splitext(file)[0] + '_integ0.jpg')
         jpg_filepath = os.path.join(jpg_dir, jpg_filename)
 
-        # Check that a jpg does not already exist. If it does (and rewrite=False),
-        # just call the existing jpg file
-        if os.path.exists(jpg_filepath) and not rewrite:
-            pass
-
-        # If it doesn't, make it using the preview_image module
-        else:
-            if not os.path.exists(jpg_dir):
-                os.makedirs(jpg_dir)
-            im = PreviewImage(file, 'SCI')
-            im.output_directory = jpg_dir
-            im.make_image()
+        # Find the tile pyramids of the mosaic, keyed by the name of the
+        # preview image they replace
+        if mosaic_root is not None:
+            search_tiles = os.path.join(jpg_dir, '{}_{}_integ*.dzi'.format(mosaic_root, suffix))
+            for tile_file in glob.glob(search_tiles):
+                integration = os.path.splitext(tile_file)[0].split('_integ')[-1]
+                tiled_jpg = '{}_{}_integ{}.jpg'.format(file_root, suffix, integration)
+                image_info['tiled_images'][tiled_jpg] = os.path.basename(tile_file)
+
+        # If the jpg does not exist yet (or rewrite=True), it is made in
+        # the background by process_preview_jobs rather than here
+        rendered = os.path.exists(jpg_filepath) or jpg_filename in image_info['tiled_images']
+        if rewrite or not rendered:
+            render = True
 
         # Record how many integrations there are per filetype
         search_jpgs = os.path.join(preview_dir, dirname, file_root + '_{}_integ*.jpg'.format(suffix))
         num_jpgs = len(glob.glob(search_jpgs))
-        image_info['num_ints'][suffix] = num_jpgs
+        num_tiled = len([name for name in image_info['tiled_images']
+                         if name.startswith('{}_{}_integ'.format(file_root, suffix))])
+        image_info['num_ints'][suffix] = max(num_jpgs, num_tiled)
 
         image_info['all_jpegs'].append(jpg_filepath)
 
+    # Queue the rendering of missing images; requests for a file root
+    # that is already queued are coalesced
+    if render:
+        queue = PreviewJobQueue(get_job_queue_filename())
+        image_info['preview_job'] = queue.submit(file_root, rewrite)
+
     return image_info
 
 
@@ -487,17 +745,53 @@ def get_instrument_proposals(instrument):
         List of proposals for the given instrument
     """
 
-    service = "Mast.Jwst.Filtered.{}".format(instrument)
-    params = {"columns": "program",
-              "filters": []}
-    response = Mast.service_request_async(service, params)
-    results = response[0].json()['data']
-    proposals = list(set(result['program'] for result in results))
+    proposals = _get_mast_column(instrument, 'program')
 
     return proposals
 
 
-def get_preview_images_by_instrument(inst):
+def get_listing_version(stores, instrument=None, mast_column=None):
+    """Return a version of the listings built from the given stores of
+    the filesystem index and, optionally, from a MAST column of an
+    instrument. The version changes whenever the files of the stores or
+    the cached MAST values change, so that it can validate a listing
+    without building it.
+
+    Parameters
+    ----------
+    stores : list
+        Names of the stores of the filesystem index (e.g.
+        ``thumbnails``)
+    instrument : str (optional)
+        Name of the JWST instrument of the MAST column
+    mast_column : str (optional)
+        Name of the MAST column (e.g. ``filename``)
+
+    Returns
+    -------
+    version : str
+        The generations of the stores and the time of the last fetch of
+        the MAST column
+    modified : float
+        Time of the last change to any of them
+    """
+
+    versions = []
+    modified = 0.
+    for store in stores:
+        generation, changed = _get_index(store).version(store)
+        versions.append('{}:{}'.format(store, generation))
+        modified = max(modified, changed)
+
+    if mast_column is not None:
+        fetched = _get_mast_fetched(instrument, mast_column)
+        versions.append('{}:{}:{!r}'.format(instrument.lower(), mast_column, fetched))
+        modified = max(modified, fetched)
+
+    return ';'.join(versions), modified
+
+
+def get_preview_images_by_instrument(inst, after=None, limit=None):
     """Return a list of preview images available in the filesystem for
     the given instrument.
 
@@ -506,6 +800,13 @@ def get_preview_images_by_instrument(inst):
     inst : str
         The instrument of interest (e.g. ``NIRCam``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     preview_images : list
@@ -516,26 +817,17 @@ def get_preview_images_by_instrument(inst):
     # Make sure the instrument is of the proper format (e.g. "Nircam")
     instrument = inst[0].upper() + inst[1:].lower()
 
-    # Query MAST for all rootnames for the instrument
-    service = "Mast.Jwst.Filtered.{}".format(instrument)
-    params = {"columns": "filename",
-              "filters": []}
-    response = Mast.service_request_async(service, params)
-    results = response[0].json()['data']
-
-    # Parse the results to get the rootnames
-    filenames = [result['filename'].split('.')[0] for result in results]
-
-    # Get list of all preview_images
-    preview_images = glob.glob(os.path.join(PREVIEW_IMAGE_FILESYSTEM, '*', '*.jpg'))
+    # Get all rootnames for the instrument from the MAST cache
+    filenames = set(filename.split('.')[0] for filename in _get_mast_column(instrument, 'filename'))
 
-    # Get subset of preview images that match the filenames
-    preview_images = [item for item in preview_images if os.path.basename(item).split('_integ')[0] in filenames]
+    # Get the preview images of those files
+    preview_images = _query_by_rootnames('preview_images', filenames, after=after, limit=limit,
+                                         extension='jpg')
 
     return preview_images
 
 
-def get_preview_images_by_proposal(proposal):
+def get_preview_images_by_proposal(proposal, after=None, limit=None):
     """Return a list of preview images available in the filesystem for
     the given ``proposal``.
 
@@ -544,6 +836,13 @@ def get_preview_images_by_proposal(proposal):
     proposal : str
         The five-digit proposal number (e.g. ``88600``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     preview_images : list
@@ -551,13 +850,15 @@ def get_preview_images_by_proposal(proposal):
         given ``proposal``.
     """
 
-    preview_images = glob.glob(os.path.join(PREVIEW_IMAGE_FILESYSTEM, 'jw{}'.format(proposal), '*'))
+    preview_images = _get_index('preview_images').query('preview_images', program=proposal,
+                                                        extension='jpg', after=after,
+                                                        limit=limit)
     preview_images = [os.path.basename(preview_image) for preview_image in preview_images]
 
     return preview_images
 
 
-def get_preview_images_by_rootname(rootname):
+def get_preview_images_by_rootname(rootname, after=None, limit=None):
     """Return a list of preview images available in the filesystem for
     the given ``rootname``.
 
@@ -566,6 +867,13 @@ def get_preview_images_by_rootname(rootname):
     rootname : str
         The rootname of interest (e.g. ``jw86600008001_02101_00007_guider2``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     preview_images : list
@@ -574,10 +882,10 @@ def get_preview_images_by_rootname(rootname):
     """
 
     proposal = rootname.split('_')[0].split('jw')[-1][0:5]
-    preview_images = sorted(glob.glob(os.path.join(
-        PREVIEW_IMAGE_FILESYSTEM,
-        'jw{}'.format(proposal),
-        '{}*'.format(rootname))))
+    preview_images = _get_index('preview_images').query('preview_images',
+                                                        pattern='{}*'.format(rootname),
+                                                        program=proposal, extension='jpg',
+                                                        after=after, limit=limit)
     preview_images = [os.path.basename(preview_image) for preview_image in preview_images]
 
     return preview_images
@@ -604,19 +912,21 @@ def get_proposal_info(filepaths):
     """
 
     proposals = list(set([f.split('/')[-1][2:7] for f in filepaths]))
-    thumbnail_dir = os.path.join(get_config()['jwql_dir'], 'thumbnails')
+    thumbnail_index = _get_index('thumbnails')
+    filesystem_index = _get_index('filesystem')
     thumbnail_paths = []
     num_files = []
     for proposal in proposals:
-        thumbnail_search_filepath = os.path.join(thumbnail_dir, 'jw{}'.format(proposal), 'jw{}*rate*.thumb'.format(proposal))
-        thumbnail = glob.glob(thumbnail_search_filepath)
+        thumbnail = thumbnail_index.query('thumbnails', pattern='jw{}*rate*.thumb'.format(proposal),
+                                          program=proposal)
         if len(thumbnail) > 0:
             thumbnail = thumbnail[0]
             thumbnail = '/'.join(thumbnail.split('/')[-2:])
         thumbnail_paths.append(thumbnail)
 
-        fits_search_filepath = os.path.join(FILESYSTEM_DIR, 'jw{}'.format(proposal), 'jw{}*.fits'.format(proposal))
-        num_files.append(len(glob.glob(fits_search_filepath)))
+        fits_files = filesystem_index.query('filesystem', pattern='jw{}*.fits'.format(proposal),
+                                            program=proposal)
+        num_files.append(len(fits_files))
 
     # Put the various information into a dictionary of results
     proposal_info = {}
@@ -628,7 +938,7 @@ def get_proposal_info(filepaths):
     return proposal_info
 
 
-def get_thumbnails_by_instrument(inst):
+def get_thumbnails_by_instrument(inst, after=None, limit=None):
     """Return a list of thumbnails available in the filesystem for the
     given instrument.
 
@@ -637,6 +947,13 @@ def get_thumbnails_by_instrument(inst):
     inst : str
         The instrument of interest (e.g. ``NIRCam``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     preview_images : list
@@ -647,26 +964,17 @@ def get_thumbnails_by_instrument(inst):
     # Make sure the instrument is of the proper format (e.g. "Nircam")
     instrument = inst[0].upper() + inst[1:].lower()
 
-    # Query MAST for all rootnames for the instrument
-    service = "Mast.Jwst.Filtered.{}".format(instrument)
-    params = {"columns": "filename",
-              "filters": []}
-    response = Mast.service_request_async(service, params)
-    results = response[0].json()['data']
+    # Get all rootnames for the instrument from the MAST cache
+    filenames = set(filename.split('.')[0] for filename in _get_mast_column(instrument, 'filename'))
 
-    # Parse the results to get the rootnames
-    filenames = [result['filename'].split('.')[0] for result in results]
-
-    # Get list of all thumbnails
-    thumbnails = glob.glob(os.path.join(THUMBNAIL_FILESYSTEM, '*', '*.thumb'))
-
-    # Get subset of preview images that match the filenames
-    thumbnails = [item for item in thumbnails if os.path.basename(item).split('_integ')[0] in filenames]
+    # Get the thumbnails of those files
+    thumbnails = _query_by_rootnames('thumbnails', filenames, after=after, limit=limit,
+                                     extension='thumb')
 
     return thumbnails
 
 
-def get_thumbnails_by_proposal(proposal):
+def get_thumbnails_by_proposal(proposal, after=None, limit=None):
     """Return a list of thumbnails available in the filesystem for the
     given ``proposal``.
 
@@ -675,6 +983,13 @@ def get_thumbnails_by_proposal(proposal):
     proposal : str
         The five-digit proposal number (e.g. ``88600``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     thumbnails : list
@@ -682,13 +997,14 @@ def get_thumbnails_by_proposal(proposal):
         ``proposal``.
     """
 
-    thumbnails = glob.glob(os.path.join(THUMBNAIL_FILESYSTEM, 'jw{}'.format(proposal), '*'))
+    thumbnails = _get_index('thumbnails').query('thumbnails', program=proposal, after=after,
+                                                limit=limit)
     thumbnails = [os.path.basename(thumbnail) for thumbnail in thumbnails]
 
     return thumbnails
 
 
-def get_thumbnails_by_rootname(rootname):
+def get_thumbnails_by_rootname(rootname, after=None, limit=None):
     """Return a list of preview images available in the filesystem for
     the given ``rootname``.
 
@@ -697,6 +1013,13 @@ def get_thumbnails_by_rootname(rootname):
     rootname : str
         The rootname of interest (e.g. ``jw86600008001_02101_00007_guider2``).
 
+    after : str (optional)
+        If given, only the files whose names sort after it are
+        returned.
+
+    limit : int (optional)
+        If given, the largest number of files to return.
+
     Returns
     -------
     thumbnails : list
@@ -705,27 +1028,49 @@ def get_thumbnails_by_rootname(rootname):
     """
 
     proposal = rootname.split('_')[0].split('jw')[-1][0:5]
-    thumbnails = sorted(glob.glob(os.path.join(
-        THUMBNAIL_FILESYSTEM,
-        'jw{}'.format(proposal),
-        '{}*'.format(rootname))))
+    thumbnails = _get_index('thumbnails').query('thumbnails', pattern='{}*'.format(rootname),
+                                                program=proposal, after=after, limit=limit)
 
     thumbnails = [os.path.basename(thumbnail) for thumbnail in thumbnails]
 
     return thumbnails
 
 
+def group_filepaths_by_rootname(filepaths):
+    """Group file paths by their rootname, i.e. their filename without
+    the suffix (e.g. ``jw00327001001_02101_00002_nrca1``), in a single
+    pass over the paths.
+
+    Parameters
+    ----------
+    filepaths : list
+        A list of full paths to files
+
+    Returns
+    -------
+    groups : dict
+        Lists of the paths of each rootname, keyed by rootname. The
+        rootnames and paths are sorted.
+    """
+
+    groups = OrderedDict()
+    for filepath in sorted(filepaths):
+        rootname = '_'.join(os.path.basename(filepath).split('_')[:-1])
+        groups.setdefault(rootname, []).append(filepath)
+
+    return groups
+
+
 def split_files(file_list, page_type):
     """JUST FOR USE DURING DEVELOPMENT WITH FILESYSTEM
 
     Splits the files in the filesystem into "unlooked" and "archived",
     with the "unlooked" images being the most recent 10% of files.
+    The exposure start times are read from the header cache, so only
+    new or changed files are opened.
     """
-    exp_times = []
-    for file in file_list:
-        hdr = fits.getheader(file, ext=0)
-        exp_start = hdr['EXPSTART']
-        exp_times.append(exp_start)
+    keywords = HeaderCache(get_header_cache_filename()).keywords(file_list)
+    exp_times = [keywords[file]['EXPSTART'] for file in file_list]
 
     exp_times_sorted = sorted(exp_times)
     i_cutoff = int(len(exp_times) * .1)
@@ -734,13 +1079,149 @@ def split_files(file_list, page_type):
     mask_unlooked = np.array([t < t_cutoff for t in exp_times])
 
     if page_type == 'unlooked':
-        print('ONLY RETURNING {} "UNLOOKED" FILES OF {} ORIGINAL FILES'.format(len([m for m in mask_unlooked if m]), len(file_list)))
+        print('ONLY RETURNING {} "UNLOOKED" FILES OF {} ORIGINAL FILES'
+              .format(np.count_nonzero(mask_unlooked), len(file_list)))
         return [f for i, f in enumerate(file_list) if mask_unlooked[i]]
     elif page_type == 'archive':
-        print('ONLY RETURNING {} "ARCHIVED" FILES OF {} ORIGINAL FILES'.format(len([m for m in mask_unlooked if not m]), len(file_list)))
+        print('ONLY RETURNING {} "ARCHIVED" FILES OF {} ORIGINAL FILES'
+              .format(len(file_list) - np.count_nonzero(mask_unlooked), len(file_list)))
         return [f for i, f in enumerate(file_list) if not mask_unlooked[i]]
 
 
+def thumbnail_data(inst, filepaths, available_filepaths, proposal=None):
+    """Build the data needed for the ``thumbnails`` template from lists
+    of files, with a single grouping pass over each list.
+
+    Parameters
+    ----------
+    inst : str
+        Name of JWST instrument
+    filepaths : list
+        Full paths of the files whose rootnames are shown
+    available_filepaths : list
+        Full paths of all files of the instrument, from which the
+        available files of each rootname are taken
+    proposal : str (optional)
+        Number of APT proposal to filter
+
+    Returns
+    -------
+    data_dict : dict
+        Dictionary of data needed for the ``thumbnails`` template
+    """
+
+    # Get the unique rootnames, and the available files of each
+    rootnames = list(group_filepaths_by_rootname(filepaths))
+    available = group_filepaths_by_rootname(available_filepaths)
+
+    # If the proposal is specified (i.e. if the page being loaded is
+    # an archive page), only collect data for given proposal
+    if proposal is not None:
+        rootnames = [rootname for rootname in rootnames if rootname[2:7] == proposal]
+
+    # Initialize dictionary that will contain all needed data
+    data_dict = {}
+    data_dict['inst'] = inst
+    data_dict['file_data'] = {}
+
+    # Gather data for each rootname
+    for rootname in rootnames:
+
+        # Parse filename
+        try:
+            filename_dict = filename_parser(rootname)
+        except ValueError:
+            # Temporary workaround for noncompliant files in filesystem
+            filename_dict = {'activity': rootname[17:19],
+                             'detector': rootname[26:],
+                             'exposure_id': rootname[20:25],
+                             'observation': rootname[7:10],
+                             'parallel_seq_id': rootname[16],
+                             'program_id': rootname[2:7],
+                             'visit': rootname[10:13],
+                             'visit_group': rootname[14:16]}
+
+        # Get list of available filenames
+        available_files = [os.path.basename(filepath) for filepath in available.get(rootname, [])]
+
+        # Add data to dictionary
+        data_dict['file_data'][rootname] = {}
+        data_dict['file_data'][rootname]['filename_dict'] = filename_dict
+        data_dict['file_data'][rootname]['available_files'] = available_files
+        data_dict['file_data'][rootname]['expstart'] = get_expstart(rootname)
+        data_dict['file_data'][rootname]['suffixes'] = [filename_parser(filename)['suffix']
+                                                        for filename in available_files]
+
+    # Extract information for sorting with dropdown menus
+    # (Don't include the proposal as a sorting parameter if the
+    # proposal has already been specified)
+    detectors = [data_dict['file_data'][rootname]['filename_dict']['detector']
+                 for rootname in rootnames]
+    proposals = [data_dict['file_data'][rootname]['filename_dict']['program_id']
+                 for rootname in rootnames]
+    if proposal is not None:
+        dropdown_menus = {'detector': detectors}
+    else:
+        dropdown_menus = {'detector': detectors,
+                          'proposal': proposals}
+
+    data_dict['tools'] = MONITORS
+    data_dict['dropdown_menus'] = dropdown_menus
+    data_dict['prop'] = proposal
+
+    return data_dict
+
+
+def thumbnail_menus(filepaths, proposal=None):
+    """Collect the detectors and proposals of a list of files for the
+    dropdown menus of the ``thumbnails`` page, parsing the name of a
+    single file per rootname.
+
+    Parameters
+    ----------
+    filepaths : list
+        Full paths of the files shown on the page
+    proposal : str (optional)
+        Number of APT proposal to filter
+
+    Returns
+    -------
+    detectors : list
+        The detectors of the files, in order of their first rootname
+    proposals : list
+        The proposals of the files, in order of their first rootname
+    """
+
+    groups = group_filepaths_by_rootname(filepaths)
+
+    detectors = []
+    proposals = []
+    for file_id, files in groups.items():
+
+        # If the proposal is specified (i.e. if the page being loaded
+        # is an archive page), only collect data for given proposal
+        if proposal is not None and file_id[2:7] != proposal:
+            continue
+
+        # Parse filename to get program_id
+        try:
+            filename_dict = filename_parser(files[-1])
+            program_id = filename_dict['program_id']
+            detector = filename_dict['detector']
+        except ValueError:
+            # Temporary workaround for noncompliant files in filesystem
+            program_id = file_id[2:7]
+            detector = file_id[26:]
+
+        # Add parameters to sort by
+        if detector not in detectors and not detector.startswith('f'):
+            detectors.append(detector)
+        if program_id not in proposals:
+            proposals.append(program_id)
+
+    return detectors, proposals
+
+
 def thumbnails(inst, proposal=None):
     """Generate a page showing thumbnail images corresponding to
     activities, from a given ``proposal``
@@ -768,35 +1249,7 @@ def thumbnails(inst, proposal=None):
         page_type = 'unlooked'
     filepaths = split_files(filepaths, page_type)
 
-    # Determine file ID (everything except suffix)
-    # e.g. jw00327001001_02101_00002_nrca1
-    full_ids = set(['_'.join(f.split('/')[-1].split('_')[:-1]) for f in filepaths])
-
-    # If the proposal is specified (i.e. if the page being loaded is
-    # an archive page), only collect data for given proposal
-    if proposal is not None:
-        full_ids = [f for f in full_ids if f[2:7] == proposal]
-
-    detectors = []
-    proposals = []
-    for i, file_id in enumerate(full_ids):
-        for file in filepaths:
-            if '_'.join(file.split('/')[-1].split('_')[:-1]) == file_id:
-
-                # Parse filename to get program_id
-                try:
-                    program_id = filename_parser(file)['program_id']
-                    detector = filename_parser(file)['detector']
-                except ValueError:
-                    # Temporary workaround for noncompliant files in filesystem
-                    program_id = nfile_id[2:7]
-                    detector = file_id[26:]
-
-        # Add parameters to sort by
-        if detector not in detectors and not detector.startswith('f'):
-            detectors.append(detector)
-        if program_id not in proposals:
-            proposals.append(program_id)
+    detectors, proposals = thumbnail_menus(filepaths, proposal)
 
     # Extract information for sorting with dropdown menus
     # (Don't include the proposal as a sorting parameter if the
@@ -833,65 +1286,10 @@ def thumbnails_ajax(inst, proposal=None):
     """
 
     # Get the available files for the instrument
-    filepaths = get_filenames_by_instrument(inst)
-    if proposal is not None:
-        filepaths = split_files(filepaths, 'archive')
-    else:
-        filepaths = split_files(filepaths, 'unlooked')
-
-    # Get set of unique rootnames
-    rootnames = set(['_'.join(f.split('/')[-1].split('_')[:-1]) for f in filepaths])
-
-    # If the proposal is specified (i.e. if the page being loaded is
-    # an archive page), only collect data for given proposal
-    if proposal is not None:
-        rootnames = [rootname for rootname in rootnames if rootname[2:7] == proposal]
-
-    # Initialize dictionary that will contain all needed data
-    data_dict = {}
-    data_dict['inst'] = inst
-    data_dict['file_data'] = {}
-
-    # Gather data for each rootname
-    for rootname in rootnames:
-
-        # Parse filename
-        try:
-            filename_dict = filename_parser(rootname)
-        except ValueError:
-            # Temporary workaround for noncompliant files in filesystem
-            filename_dict = {'activity': file_id[17:19],
-                             'detector': file_id[26:],
-                             'exposure_id': file_id[20:25],
-                             'observation': file_id[7:10],
-                             'parallel_seq_id': file_id[16],
-                             'program_id': file_id[2:7],
-                             'visit': file_id[10:13],
-                             'visit_group': file_id[14:16]}
-
-        # Get list of available filenames
-        available_files = get_filenames_by_rootname(rootname)
-
-        # Add data to dictionary
-        data_dict['file_data'][rootname] = {}
-        data_dict['file_data'][rootname]['filename_dict'] = filename_dict
-        data_dict['file_data'][rootname]['available_files'] = available_files
-        data_dict['file_data'][rootname]['expstart'] = get_expstart(rootname)
-        data_dict['file_data'][rootname]['suffixes'] = [filename_parser(filename)['suffix'] for filename in available_files]
-
-    # Extract information for sorting with dropdown menus
-    # (Don't include the proposal as a sorting parameter if the
-    # proposal has already been specified)
-    detectors = [data_dict['file_data'][rootname]['filename_dict']['detector'] for rootname in list(data_dict['file_data'].keys())]
-    proposals = [data_dict['file_data'][rootname]['filename_dict']['program_id'] for rootname in list(data_dict['file_data'].keys())]
+    available_filepaths = get_filenames_by_instrument(inst)
     if proposal is not None:
-        dropdown_menus = {'detector': detectors}
+        filepaths = split_files(available_filepaths, 'archive')
     else:
-        dropdown_menus = {'detector': detectors,
-                          'proposal': proposals}
-
-    data_dict['tools'] = MONITORS
-    data_dict['dropdown_menus'] = dropdown_menus
-    data_dict['prop'] = proposal
+        filepaths = split_files(available_filepaths, 'unlooked')
 
-    return data_dict
+    return thumbnail_data(inst, filepaths, available_filepaths, proposal)
@@ -222,6 +222,27 @@ function update_filter_options(data) {
     $("#thumbnail-filter")[0].innerHTML = content;
 };
 
+/**
+ * Polls the status of the preview image rendering job of a file root, and
+ * reloads the page once the images have been created
+ * @param {String} file_root - The file root of the job
+ * @param {String} base_url - The base URL for gathering data from the AJAX view.
+ */
+function update_preview_job(file_root, base_url) {
+    $.ajax({
+        url: base_url + '/ajax/preview_job/' + file_root + '/',
+        success: function(data){
+            if (data.status == 'done') {
+                location.reload();
+            } else if (data.status == 'failed') {
+                $("#preview_job").removeClass("alert-info").addClass("alert-danger");
+                $("#preview_job")[0].innerHTML = data.message;
+            } else {
+                setTimeout(function() {update_preview_job(file_root, base_url);}, 2000);
+            }
+        }});
+};
+
 /**
  * Updates the img_show_count component
  * @param {Integer} count - The count to display
@@ -72,10 +72,12 @@ urlpatterns = [
     re_path(r'^(?P<inst>({}))/(?P<file_root>[\w]+)/$'.format(instruments), views.view_image, name='view_image'),
     re_path(r'^(?P<inst>({}))/(?P<file>.+)/hdr/$'.format(instruments), views.view_header, name='view_header'),
     re_path(r'^(?P<inst>({}))/archive/(?P<proposal>[\d]{{5}})/$'.format(instruments), views.archive_thumbnails, name='archive_thumb'),
+    re_path(r'^tiles/(?P<proposal>jw[\d]{5})/(?P<filename>[\w]+(?:\.dzi|_files/[\d]+/[\d]+_[\d]+\.jpg))$', views.preview_tiles, name='preview_tiles'),
 
     # AJAX views
     re_path(r'^ajax/(?P<inst>({}))/archive/$'.format(instruments), views.archived_proposals_ajax, name='archive_ajax'),
     re_path(r'^ajax/(?P<inst>({}))/archive/(?P<proposal>[\d]{{5}})/$'.format(instruments), views.archive_thumbnails_ajax, name='archive_thumb_ajax'),
+    re_path(r'^ajax/preview_job/(?P<file_root>[\w]+)/$', views.preview_job_ajax, name='preview_job_ajax'),
 
     # REST API views
     path('api/proposals/', api_views.all_proposals, name='all_proposals'),
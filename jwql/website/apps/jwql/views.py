@@ -37,9 +37,11 @@ Dependencies
 
 import os
 
-from django.http import JsonResponse
+from astropy.time import Time
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
 
+from .conditional import file_condition, listing_condition
 from .data_containers import get_acknowledgements, get_edb_components
 from .data_containers import get_dashboard_components
 from .data_containers import get_filenames_by_instrument
@@ -48,19 +50,26 @@ from .data_containers import get_image_info
 from .data_containers import get_proposal_info
 from .data_containers import thumbnails
 from .data_containers import thumbnails_ajax
-from .data_containers import webpage_template_data, data_trending
+from .data_containers import data_trending
 from .forms import FileSearchForm
 from .oauth import auth_info
 from jwql.utils.constants import JWST_INSTRUMENT_NAMES, MONITORS, JWST_INSTRUMENT_NAMES_MIXEDCASE
+from jwql.utils.preview_cache import PreviewCache, get_cache_filename
+from jwql.utils.preview_jobs import PreviewJobQueue, get_job_queue_filename
 from jwql.utils.utils import get_base_url, get_config
 import jwql
 
 FILESYSTEM_DIR = os.path.join(get_config()['jwql_dir'], 'filesystem')
+PREVIEW_IMAGE_FILESYSTEM = os.path.join(get_config()['jwql_dir'], 'preview_images')
 
 
 def miri_data_trending(request):
     """Generate the ``MIRI DATA-TRENDING`` page
 
+    The time range of the dashboard may be given by the optional
+    ``start`` and ``end`` query parameters, as ISO dates (e.g.
+    ``?start=2019-01-01&end=2019-02-01``).
+
     Parameters
     ----------
     request : HttpRequest object
@@ -73,7 +82,15 @@ def miri_data_trending(request):
     """
 
     template = "miri_data_trending.html"
-    variables, dash = data_trending()
+    time_range = {}
+    for name in ['start', 'end']:
+        value = request.GET.get(name)
+        if value is not None:
+            try:
+                time_range[name] = Time(value, format='iso').iso
+            except ValueError:
+                return HttpResponseBadRequest('Invalid {} time: {}'.format(name, value))
+    variables, dash = data_trending(**time_range)
 
     context = {
         'dashboard' : dash,
@@ -143,6 +160,7 @@ def archived_proposals(request, user, inst):
     return render(request, template, context)
 
 
+@listing_condition(['filesystem', 'thumbnails'])
 def archived_proposals_ajax(request, inst):
     """Generate the page listing all archived proposals in the database
 
@@ -212,6 +230,7 @@ def archive_thumbnails(request, user, inst, proposal):
     return render(request, template, context)
 
 
+@listing_condition(['filesystem'])
 def archive_thumbnails_ajax(request, inst, proposal):
     """Generate the page listing all archived images in the database
     for a certain proposal
@@ -374,6 +393,67 @@ def instrument(request, user, inst):
     return render(request, template, context)
 
 
+def preview_job_ajax(request, file_root):
+    """Report the status of the preview image rendering job of a file
+    root, so that the image view page can poll for its completion
+
+    Parameters
+    ----------
+    request : HttpRequest object
+        Incoming request from the webpage
+    file_root : str
+        The file root of the job
+
+    Returns
+    -------
+    JsonResponse object
+        Outgoing response sent to the webpage
+    """
+    job = PreviewJobQueue(get_job_queue_filename()).status(file_root)
+    if job is None:
+        raise Http404('No preview job for {}'.format(file_root))
+
+    return JsonResponse({'file_root': file_root, 'status': job['status'],
+                         'message': job['message']},
+                        json_dumps_params={'indent': 2})
+
+
+@file_condition(
+    lambda proposal, filename: os.path.join(PREVIEW_IMAGE_FILESYSTEM, proposal, filename))
+def preview_tiles(request, proposal, filename):
+    """Serve the descriptor or a tile of the deep-zoom tile pyramid of
+    a preview image, so that the browser only fetches the parts of a
+    large image that are in view
+
+    Parameters
+    ----------
+    request : HttpRequest object
+        Incoming request from the webpage
+    proposal : str
+        Proposal directory of the preview image (e.g. ``jw00327``)
+    filename : str
+        ``<image>.dzi`` for the descriptor, or
+        ``<image>_files/<level>/<column>_<row>.jpg`` for a tile
+
+    Returns
+    -------
+    HttpResponse object
+        Outgoing response sent to the webpage
+    """
+    filepath = os.path.join(PREVIEW_IMAGE_FILESYSTEM, proposal, filename)
+    if not os.path.isfile(filepath):
+        raise Http404('{} does not exist'.format(filename))
+
+    if filename.endswith('.dzi'):
+        content_type = 'application/xml'
+    else:
+        content_type = 'image/jpeg'
+    response = FileResponse(open(filepath, 'rb'), content_type=content_type)
+    response['Cache-Control'] = 'max-age=3600'
+
+    return response
+
+
 @auth_info
 def unlooked_images(request, user, inst):
     """Generate the page listing all unlooked images in the database
@@ -458,6 +538,10 @@ def view_image(request, user, inst, file_root, rewrite=False):
     # Ensure the instrument is correctly capitalized
     inst = JWST_INSTRUMENT_NAMES_MIXEDCASE[inst.lower()]
 
+    # Record the view before looking up the images, so that they are not
+    # evicted by manage_preview_cache while the page is being built
+    PreviewCache(get_cache_filename()).touch(file_root)
+
     template = 'view_image.html'
     image_info = get_image_info(file_root, rewrite)
     context = {'inst': inst,
@@ -468,6 +552,9 @@ def view_image(request, user, inst, file_root, rewrite=False):
                'fits_files': image_info['all_files'],
                'suffixes': image_info['suffixes'],
                'num_ints': image_info['num_ints'],
+               'tiled_images': image_info['tiled_images'],
+               'preview_job': image_info['preview_job'],
+               'base_url': get_base_url(),
                'version': jwql.__version__}
 
     return render(request, template, context)
@@ -18,6 +18,7 @@ REQUIRES = ['astropy',
             'numpy',
             'numpydoc',
             'pandas',
+            'pillow',
             'psycopg2',
             'pytest',
             'sphinx',